@@ -18,19 +18,22 @@
 '''
 Usage:
     pulseaudio-dlna [--host <host>] [--port <port>][--encoder <encoders> | --codec <codec>] [--bit-rate=<rate>]
-                    [--encoder-backend <encoder-backend>]
-                    [--filter-device=<filter-device>]
+                    [--encoder-backend <encoder-backend>] [--recorder <recorder>]
+                    [--filter-device=<filter-device>] [--group=<group>]...
                     [--renderer-urls <urls>]
                     [--request-timeout <timeout>]
-                    [--chunk-size <chunk-size>]
+                    [--chunk-size <chunk-size>] [--latency-profile <profile>] [--buffer-size <buffer-size>] [--buffer-policy <buffer-policy>] [--send-timeout <msec>] [--slow-client-policy <policy>] [--socket-profile <profile>] [--pre-roll-msec <msec>] [--time-shift-size <bytes>]
+                    [--pipeline-linger <seconds>] [--encoder-stall-timeout <msec>] [--silence-timeout <msec>] [--cpu-budget <percent>] [--probe-window <msec>]
+                    [--stream-server <stream-server>]
                     [--msearch-port=<msearch-port>] [--ssdp-mx <ssdp-mx>] [--ssdp-ttl <ssdp-ttl>] [--ssdp-amount <ssdp-amount>]
                     [--cover-mode <mode>]
-                    [--auto-reconnect]
+                    [--auto-reconnect] [--zero-copy]
                     [--debug]
-                    [--fake-http10-content-length] [--fake-http-content-length]
+                    [--fake-http10-content-length] [--fake-http-content-length] [--chunked-transfer-encoding]
                     [--disable-switchback] [--disable-ssdp-listener] [--disable-device-stop] [--disable-workarounds] [--disable-mimetype-check]
     pulseaudio-dlna [--host <host>] [--create-device-config] [--update-device-config]
                     [--msearch-port=<msearch-port>] [--ssdp-mx <ssdp-mx>] [--ssdp-ttl <ssdp-ttl>] [--ssdp-amount <ssdp-amount>]
+    pulseaudio-dlna [--host <host>] [--port <port>] --handoff <source> <target>
     pulseaudio-dlna [-h | --help | --version]
 
 Options:
@@ -43,6 +46,10 @@ Options:
                                                the bit rate (depends on the codec)
                                            A written config is loaded by default if the --encoder and --bit-rate options are not used.
     --update-device-config                 Same as --create-device-config but preserves your existing config from being overwritten
+    --handoff                              Asks the running instance to hand the stream of the device <source> over to the device
+                                           <target> without restarting the encoder. Devices are identified by their name or udn.
+                                           The target device has to use the same codec. The new device starts playing before
+                                           the old one is stopped.
        --host=<host>                       Set the server ip.
     -p --port=<port>                       Set the server port [default: 8080].
     -e --encoder=<encoders>                Deprecated alias for --codec
@@ -60,13 +67,73 @@ Options:
                                              - generic (default)
                                              - ffmpeg
                                              - avconv
+    --recorder=<recorder>                  Set how the audio of the sinks is recorded [default: parec].
+                                           Possible recorders are:
+                                             - parec          The audio is recorded by a parec process
+                                             - libpulse       The audio is recorded within the application via libpulse-simple
     -b --bit-rate=<rate>                   Set the audio encoder's bitrate.
     --filter-device=<filter-device>        Set a name filter for devices which should be added.
                                            Devices which get discovered, but won't match the
                                            filter text will be skipped.
+    --group=<group>                        Play several devices from a single sink which is recorded and encoded just once.
+                                           Format: "<name>=<device>,<device>". The option can be used multiple times.
+                                           The devices of a group do not get a sink on their own.
     --renderer-urls=<urls>                 Set the renderer urls yourself. no discovery will commence.
     --request-timeout=<timeout>            Set the timeout for requests in seconds [default: 15].
-    --chunk-size=<chunk-size>              Set the stream's chunk size [default: 4096].
+    --chunk-size=<chunk-size>              Set the stream's chunk size in bytes. By default it is derived from the latency profile.
+    --latency-profile=<profile>            Set how much latency the recording may add [default: default].
+                                           The profile can also be set per codec in the device config.
+                                           Possible profiles are:
+                                             - default        PulseAudio chooses the buffer sizes
+                                             - low            20 ms, many wakeups
+                                             - balanced       100 ms
+                                             - power-save     500 ms, few wakeups
+    --buffer-size=<buffer-size>            Set the size of each stream's buffer in bytes [default: 524288].
+    --buffer-policy=<buffer-policy>        Set what happens when a stream's buffer is full [default: drop-oldest].
+                                           Possible policies are:
+                                             - drop-oldest    The oldest data is dropped to keep the latency low
+                                             - block          The encoder waits until the client catches up
+                                             - disconnect     The client gets disconnected
+    --send-timeout=<msec>                  Set after how many milliseconds a client which does not read anything is
+                                           handled according to the slow client policy. 0 disables it [default: 10000].
+    --slow-client-policy=<policy>          Set what happens to a client which did not read anything for the send
+                                           timeout [default: skip].
+                                           Possible policies are:
+                                             - skip           The stream skips ahead to live, if the client still does
+                                                              not read anything it gets disconnected
+                                             - disconnect     The client gets disconnected
+    --socket-profile=<profile>             Set how the sockets of the streams are tuned [default: default].
+                                           The profile can also be set per codec in the device config.
+                                           Possible profiles are:
+                                             - default        The kernel defaults are kept
+                                             - low            250 ms send buffer, no delay, keepalive
+                                             - balanced       1 s send buffer, no delay, keepalive
+                                             - robust         3 s send buffer for lossy networks, keepalive
+    --pre-roll-msec=<msec>                 Set how many milliseconds of recently encoded audio are sent to new connections
+                                           right away to start playback faster [default: 0].
+    --time-shift-size=<bytes>              Set how many bytes of each encoded stream are kept to resume the streams of
+                                           reconnecting clients at the HTTP range they request. 0 disables it and zero
+                                           copy is not used as long as it is enabled [default: 1048576].
+    --pipeline-linger=<seconds>            Set how many seconds the recorder and encoder keep running after the last
+                                           connection was closed. They are also started in advance when a device is
+                                           instructed to play. 0 disables both [default: 10].
+    --encoder-stall-timeout=<msec>         Set after how many milliseconds without any output an encoder which does not
+                                           read its input anymore is restarted. 0 disables it [default: 5000].
+    --silence-timeout=<msec>               Set after how many milliseconds of silence the encoder is stopped and silent
+                                           frames are sent instead, until there is audio again. Only mp3 supports it.
+                                           0 disables it [default: 0].
+    --cpu-budget=<percent>                 Set how much CPU all recorders and encoders together may use, in percent of a
+                                           single core. It is estimated from the codecs and bit rates. Streams which do
+                                           not fit are started with a lower bit rate or rejected with "503 Service
+                                           Unavailable". 0 disables it [default: 0].
+    --probe-window=<msec>                  Set for how many milliseconds a new connection only gets the cached header and
+                                           silence of the last recorder and encoder which ran for the device. They are
+                                           started once the connection outlasts it, so devices probing the stream before
+                                           playing it do not start them in vain. 0 disables it [default: 500].
+    --stream-server=<stream-server>        Set how the streaming server handles its connections [default: threaded].
+                                           Possible servers are:
+                                             - threaded       Every connection and encoder is handled in its own thread
+                                             - epoll          All connections and encoders are handled in a single thread
     --ssdp-ttl=<ssdp-ttl>                  Set the SSDP socket's TTL [default: 10].
     --ssdp-mx=<ssdp-mx>                    Set the MX value of the SSDP discovery message [default: 3].
     --ssdp-amount=<ssdp-amount>            Set the amount of SSDP discovery messages being sent [default: 5].
@@ -79,7 +146,9 @@ Options:
                                              - application    The audio application's icon is shown
     --debug                                enables detailed debug messages.
     --auto-reconnect                       If set, the application tries to reconnect devices in case the stream collapsed
+    --zero-copy                            If set, streams with a single client are moved from the encoder to the socket via splice() (Linux only).
     --fake-http-content-length             If set, the content-length of HTTP requests will be set to 100 GB.
+    --chunked-transfer-encoding            If set, streams are sent with the HTTP/1.1 chunked transfer encoding to clients supporting it.
     --disable-switchback                   If set, streams won't switched back to the default sink if a device disconnects.
     --disable-ssdp-listener                If set, the application won't bind to the port 1900 and therefore the automatic discovery of new devices won't work.
     --disable-device-stop                  If set, the application won't send any stop commands to renderers at all
@@ -113,6 +182,10 @@ Examples:
       UDP multicast packages won't work (most times) over VPN connections this is
       very useful if you ever plan to stream to a UPNP device over VPN.
 
+      - pulseaudio-dlna --handoff 'Living Room' 'Kitchen'
+
+      will move the stream of the running instance from the device Living Room to the device Kitchen.
+
 '''
 
 
@@ -143,6 +216,9 @@ def main(argv=sys.argv[1:]):
         datefmt='%m-%d %H:%M:%S')
     logger = logging.getLogger('pulseaudio_dlna.__main__')
 
+    if options['--handoff']:
+        return handoff(options)
+
     if not acquire_lock():
         print('The application is shutting down, since there already seems to '
               'be a running instance.')
@@ -160,6 +236,21 @@ def main(argv=sys.argv[1:]):
     return 0
 
 
+def handoff(options):
+    import requests
+    import pulseaudio_dlna.handoff
+    host = options['--host'] or '127.0.0.1'
+    try:
+        status, message = pulseaudio_dlna.handoff.request(
+            host, options['--port'], options['<source>'], options['<target>'])
+    except requests.exceptions.RequestException as e:
+        print('Could not reach a running instance on {}:{} ({}).'.format(
+            host, options['--port'], e))
+        return 1
+    print(message)
+    return 0 if status == 202 else 1
+
+
 def acquire_lock():
     acquire_lock._lock_socket = socket.socket(
         socket.AF_UNIX, socket.SOCK_DGRAM)
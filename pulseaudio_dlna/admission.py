@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import logging
+import time
+
+logger = logging.getLogger('pulseaudio_dlna.admission')
+
+# The codec costs are estimated for this bit rate.
+REFERENCE_BIT_RATE = 128
+# Every pipeline has a recorder besides its encoder.
+RECORDER_COST = 1.0
+
+
+class AdmissionRejectedException(Exception):
+    def __init__(self, path, cost, available, retry_after):
+        Exception.__init__(
+            self,
+            'Starting the stream "{}" would need {:.1f}% CPU, but only '
+            '{:.1f}% are left!'.format(path, cost, available)
+        )
+        self.retry_after = retry_after
+
+
+def estimate_cost(codec, encoder):
+    # Returns the estimated CPU usage of a pipeline in percent of a single
+    # core. Half of an encoder's cost is assumed to scale with its bit rate.
+    cost = codec.CPU_COST
+    bit_rate = getattr(encoder, 'bit_rate', None)
+    if bit_rate:
+        cost *= 0.5 + 0.5 * int(bit_rate) / float(REFERENCE_BIT_RATE)
+    return cost + RECORDER_COST
+
+
+class AdmissionController(object):
+
+    # Keeps the estimated CPU usage of all pipelines within CPU_BUDGET. A
+    # request which is about to start a pipeline reserves its cost until
+    # the pipeline exists, so concurrent requests cannot exceed the budget
+    # together. If the budget does not suffice, the encoder is downgraded
+    # to a lower bit rate. If that does not help either, the request is
+    # rejected.
+
+    CPU_BUDGET = 0
+    RESERVATION_SECONDS = 10
+    RETRY_AFTER_SECONDS = 5
+
+    def __init__(self):
+        self.reservations = {}
+
+    @property
+    def is_enabled(self):
+        return self.CPU_BUDGET > 0
+
+    def reserve(self, path, codec, used_cost):
+        # used_cost is what the running pipelines are estimated to need.
+        if not self.is_enabled:
+            return
+        now = time.time()
+        for _path, (_encoder, _cost, expires) in \
+                self.reservations.items():
+            if expires < now:
+                del self.reservations[_path]
+        if path in self.reservations:
+            return
+        reserved_cost = sum(
+            cost for _encoder, cost, _expires in self.reservations.values())
+        available = self.CPU_BUDGET - used_cost - reserved_cost
+
+        encoder = codec.encoder
+        cost = estimate_cost(codec, encoder)
+        if cost > available:
+            downgraded = self._downgrade(codec, encoder, available)
+            if downgraded is None:
+                raise AdmissionRejectedException(
+                    path, cost, max(available, 0), self.RETRY_AFTER_SECONDS)
+            logger.info(
+                'Downgrading the stream "{path}" to {bit_rate} kbit/s to stay '
+                'within the CPU budget.'.format(
+                    path=path, bit_rate=downgraded.bit_rate))
+            encoder = downgraded
+            cost = estimate_cost(codec, encoder)
+        self.reservations[path] = (
+            encoder, cost, now + self.RESERVATION_SECONDS)
+
+    def _downgrade(self, codec, encoder, available):
+        # Returns an encoder with the highest lower bit rate which fits.
+        bit_rate = getattr(encoder, 'bit_rate', None)
+        if not bit_rate:
+            return None
+        bit_rates = sorted(
+            [rate for rate in encoder.supported_bit_rates
+             if rate < int(bit_rate)], reverse=True)
+        for rate in bit_rates:
+            downgraded = codec.encoder_type(rate)
+            if estimate_cost(codec, downgraded) <= available:
+                return downgraded
+        return None
+
+    def cancel(self, path):
+        # The pipeline the reservation was made for is not started.
+        self.reservations.pop(path, None)
+
+    def take(self, path, codec):
+        # Returns the encoder for the pipeline which is about to be started.
+        reservation = self.reservations.pop(path, None)
+        if reservation is not None:
+            return reservation[0]
+        return codec.encoder
+
+    def __str__(self):
+        return '<{} budget="{}" reservations="{}">'.format(
+            self.__class__.__name__,
+            self.CPU_BUDGET,
+            len(self.reservations),
+        )
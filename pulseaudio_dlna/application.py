@@ -34,10 +34,17 @@ import pulseaudio_dlna.plugins.dlna.ssdp.listener
 import pulseaudio_dlna.plugins.dlna.ssdp.discover
 import pulseaudio_dlna.plugins.chromecast
 import pulseaudio_dlna.plugins.chromecast.mdns
+import pulseaudio_dlna.admission
+import pulseaudio_dlna.buffers
 import pulseaudio_dlna.encoders
 import pulseaudio_dlna.covermodes
+import pulseaudio_dlna.latency
+import pulseaudio_dlna.probes
+import pulseaudio_dlna.sockets
+import pulseaudio_dlna.silence
 import pulseaudio_dlna.streamserver
 import pulseaudio_dlna.pulseaudio
+import pulseaudio_dlna.utils.libpulse
 import pulseaudio_dlna.utils.network
 import pulseaudio_dlna.rules
 import pulseaudio_dlna.workarounds
@@ -134,6 +141,119 @@ class Application(object):
                 pulseaudio_dlna.streamserver.ProcessThread.CHUNK_SIZE = \
                     chunk_size
 
+        try:
+            pulseaudio_dlna.codecs.set_latency_profile(
+                options['--latency-profile'])
+        except pulseaudio_dlna.latency.UnknownLatencyProfileException as e:
+            logger.error(e)
+            sys.exit(1)
+
+        if options['--zero-copy']:
+            pulseaudio_dlna.streamserver.ProcessThread.USE_SPLICE = True
+
+        if options['--buffer-size']:
+            buffer_size = int(options['--buffer-size'])
+            if buffer_size > 0:
+                pulseaudio_dlna.streamserver.ProcessBroadcaster.BUFFER_SIZE = \
+                    buffer_size
+
+        buffer_policy = options['--buffer-policy']
+        if buffer_policy:
+            try:
+                pulseaudio_dlna.buffers.validate(buffer_policy)
+            except pulseaudio_dlna.buffers.UnknownBufferPolicyException as e:
+                logger.error(e)
+                sys.exit(1)
+            pulseaudio_dlna.streamserver.ProcessBroadcaster.BUFFER_POLICY = \
+                buffer_policy
+
+        if options['--send-timeout']:
+            send_timeout = int(options['--send-timeout'])
+            if send_timeout >= 0:
+                pulseaudio_dlna.streamserver.ProcessStream.\
+                    SEND_TIMEOUT_MSEC = send_timeout
+
+        slow_client_policy = options['--slow-client-policy']
+        if slow_client_policy:
+            try:
+                pulseaudio_dlna.streamserver.validate_eviction_policy(
+                    slow_client_policy)
+            except pulseaudio_dlna.streamserver.\
+                    UnknownEvictionPolicyException as e:
+                logger.error(e)
+                sys.exit(1)
+            pulseaudio_dlna.streamserver.ProcessStream.EVICTION_POLICY = \
+                slow_client_policy
+
+        try:
+            pulseaudio_dlna.codecs.set_socket_profile(
+                options['--socket-profile'])
+        except pulseaudio_dlna.sockets.UnknownSocketProfileException as e:
+            logger.error(e)
+            sys.exit(1)
+
+        if options['--pre-roll-msec']:
+            pre_roll_msec = int(options['--pre-roll-msec'])
+            if pre_roll_msec > 0:
+                pulseaudio_dlna.streamserver.ProcessBroadcaster.\
+                    PREROLL_MSEC = pre_roll_msec
+
+        if options['--time-shift-size']:
+            time_shift_size = int(options['--time-shift-size'])
+            if time_shift_size >= 0:
+                pulseaudio_dlna.streamserver.ProcessBroadcaster.\
+                    TIMESHIFT_SIZE = time_shift_size
+        if options['--zero-copy'] and \
+           pulseaudio_dlna.streamserver.ProcessBroadcaster.TIMESHIFT_SIZE > 0:
+            logger.warning(
+                'Zero copy is not used as long as the time-shift buffer is '
+                'enabled. Use "--time-shift-size=0" to disable it.')
+
+        if options['--pipeline-linger']:
+            pipeline_linger = int(options['--pipeline-linger'])
+            if pipeline_linger >= 0:
+                pulseaudio_dlna.streamserver.StreamManager.LINGER_SECONDS = \
+                    pipeline_linger
+
+        if options['--encoder-stall-timeout']:
+            stall_timeout = int(options['--encoder-stall-timeout'])
+            if stall_timeout >= 0:
+                pulseaudio_dlna.streamserver.PipelineSupervisor.\
+                    STALL_TIMEOUT_MSEC = stall_timeout
+
+        if options['--silence-timeout']:
+            silence_timeout = int(options['--silence-timeout'])
+            if silence_timeout >= 0:
+                pulseaudio_dlna.silence.SilenceDetector.SILENCE_MSEC = \
+                    silence_timeout
+
+        if options['--cpu-budget']:
+            cpu_budget = float(options['--cpu-budget'])
+            if cpu_budget >= 0:
+                pulseaudio_dlna.admission.AdmissionController.CPU_BUDGET = \
+                    cpu_budget
+
+        if options['--probe-window']:
+            probe_window = int(options['--probe-window'])
+            if probe_window >= 0:
+                pulseaudio_dlna.probes.ProbeCache.PROBE_MSEC = probe_window
+
+        try:
+            stream_server_type = pulseaudio_dlna.streamserver.\
+                get_stream_server(options['--stream-server'])
+        except pulseaudio_dlna.streamserver.\
+                UnknownStreamServerException as e:
+            logger.error(e)
+            sys.exit(1)
+        if stream_server_type is \
+           pulseaudio_dlna.streamserver.ReactorStreamServer and \
+           buffer_policy == pulseaudio_dlna.buffers.POLICY_BLOCK:
+            logger.error(
+                'The buffer policy "{policy}" cannot be used with the '
+                '"{server}" stream server!'.format(
+                    policy=buffer_policy, server=options['--stream-server']))
+            sys.exit(1)
+
         if options['--ssdp-ttl']:
             ssdp_ttl = int(options['--ssdp-ttl'])
             pulseaudio_dlna.plugins.dlna.ssdp.discover.\
@@ -176,6 +296,19 @@ class Application(object):
                 logger.error(e)
                 sys.exit(1)
 
+        if options['--recorder']:
+            try:
+                pulseaudio_dlna.codecs.set_recorder(options['--recorder'])
+            except pulseaudio_dlna.codecs.UnknownRecorderException as e:
+                logger.error(e)
+                sys.exit(1)
+            if options['--recorder'] == 'libpulse' and \
+               not pulseaudio_dlna.utils.libpulse.is_available():
+                logger.error(
+                    'The recorder "libpulse" requires libpulse-simple, which '
+                    'could not be found on your system!')
+                sys.exit(1)
+
         if options['--encoder']:
             logger.warning(
                 'The option "--encoder" is deprecated. '
@@ -226,6 +359,10 @@ class Application(object):
                 'Please use "--fake-http-content-length" instead.')
             fake_http_content_length = True
 
+        chunked_transfer_encoding = False
+        if options['--chunked-transfer-encoding']:
+            chunked_transfer_encoding = True
+
         disable_switchback = False
         if options['--disable-switchback']:
             disable_switchback = True
@@ -238,12 +375,24 @@ class Application(object):
         if options['--auto-reconnect']:
             disable_auto_reconnect = False
 
+        groups = []
+        for group_string in options['--group'] or []:
+            try:
+                group = pulseaudio_dlna.pulseaudio.PulseGroup.from_string(
+                    group_string)
+            except pulseaudio_dlna.pulseaudio.InvalidGroupException as e:
+                logger.error(e)
+                sys.exit(1)
+            logger.info('Using group {}'.format(group))
+            groups.append(group)
+
         pulse_queue = multiprocessing.Queue()
         stream_queue = multiprocessing.Queue()
 
-        stream_server = pulseaudio_dlna.streamserver.ThreadedStreamServer(
+        stream_server = stream_server_type(
             host, port, pulse_queue, stream_queue,
             fake_http_content_length=fake_http_content_length,
+            chunked_transfer_encoding=chunked_transfer_encoding,
             proc_title='stream_server',
         )
 
@@ -253,6 +402,7 @@ class Application(object):
             disable_device_stop=disable_device_stop,
             disable_auto_reconnect=disable_auto_reconnect,
             cover_mode=cover_mode,
+            groups=groups,
             proc_title='pulse_watcher',
         )
 
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import threading
+import logging
+import fcntl
+import os
+
+logger = logging.getLogger('pulseaudio_dlna.buffers')
+
+POLICY_DROP_OLDEST = 'drop-oldest'
+POLICY_BLOCK = 'block'
+POLICY_DISCONNECT = 'disconnect'
+
+POLICIES = [POLICY_DROP_OLDEST, POLICY_BLOCK, POLICY_DISCONNECT]
+
+
+class UnknownBufferPolicyException(Exception):
+    def __init__(self, policy):
+        Exception.__init__(
+            self,
+            'You specified an unknown buffer policy "{}"!'.format(policy)
+        )
+
+
+def validate(policy):
+    if policy not in POLICIES:
+        raise UnknownBufferPolicyException(policy)
+
+
+class RingBuffer(object):
+
+    def __init__(self, size, policy=POLICY_DROP_OLDEST, alignment=1):
+        validate(policy)
+        self.size = size
+        self.policy = policy
+        self.alignment = alignment
+
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+        self.overflow_count = 0
+        self.overflowed = False
+
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._length = 0
+        self._closed = False
+        self._condition = threading.Condition(threading.Lock())
+
+        self._notify_reader, self._notify_writer = os.pipe()
+        for fd in [self._notify_reader, self._notify_writer]:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._is_notified = False
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def is_closed(self):
+        return self._closed
+
+    def fileno(self):
+        # The descriptor becomes readable as long as there is data to read
+        # or the buffer was closed.
+        return self._notify_reader
+
+    def _notify(self):
+        if not self._is_notified and self._notify_writer is not None:
+            os.write(self._notify_writer, b'\0')
+            self._is_notified = True
+
+    def _clear_notification(self):
+        if self._is_notified and self._notify_reader is not None:
+            try:
+                os.read(self._notify_reader, 64)
+            except OSError:
+                pass
+            self._is_notified = False
+
+    def _align(self, length):
+        remainder = length % self.alignment
+        if remainder:
+            length += self.alignment - remainder
+        return min(length, self._length)
+
+    def _drop(self, length):
+        self._start = (self._start + length) % self.size
+        self._length -= length
+        self.dropped_bytes += length
+
+    def _copy_in(self, data):
+        end = (self._start + self._length) % self.size
+        first = min(len(data), self.size - end)
+        self._buffer[end:end + first] = data[:first]
+        if first < len(data):
+            self._buffer[0:len(data) - first] = data[first:]
+        self._length += len(data)
+
+    def _copy_out(self, length):
+        first = min(length, self.size - self._start)
+        data = self._view[self._start:self._start + first].tobytes()
+        if first < length:
+            data += self._view[0:length - first].tobytes()
+        self._start = (self._start + length) % self.size
+        self._length -= length
+        return data
+
+    def write(self, data):
+        with self._condition:
+            if self._closed:
+                return
+            self.written_bytes += len(data)
+            if self.policy == POLICY_BLOCK:
+                while len(data) > 0 and not self._closed:
+                    free = self.size - self._length
+                    if free == 0:
+                        self._condition.wait()
+                        continue
+                    self._copy_in(data[:free])
+                    data = data[free:]
+                    self._notify()
+                    self._condition.notify_all()
+                return
+            if len(data) > self.size - self._length:
+                self.overflow_count += 1
+                if self.policy == POLICY_DISCONNECT:
+                    logger.info(
+                        'The buffer overflowed. Disconnecting the client.')
+                    self.overflowed = True
+                    self.dropped_bytes += len(data)
+                    self._closed = True
+                    self._notify()
+                    self._condition.notify_all()
+                    return
+                if len(data) > self.size:
+                    dropped = len(data) - self.size
+                    dropped += (self.alignment - dropped % self.alignment) % \
+                        self.alignment
+                    self.dropped_bytes += dropped
+                    data = data[dropped:]
+                    self._drop(self._length)
+                else:
+                    self._drop(self._align(
+                        len(data) - (self.size - self._length)))
+            self._copy_in(data)
+            self._notify()
+            self._condition.notify_all()
+
+    def _read(self, max_size):
+        if self.overflowed:
+            return b''
+        length = self._length
+        if max_size is not None:
+            length = min(length, max_size)
+        data = self._copy_out(length)
+        if self._length == 0 and not self._closed:
+            self._clear_notification()
+        self._condition.notify_all()
+        return data
+
+    def read(self, max_size=None):
+        with self._condition:
+            while self._length == 0 and not self._closed:
+                self._condition.wait()
+            return self._read(max_size)
+
+    def read_nowait(self, max_size=None):
+        # Returns None instead of blocking when there is nothing to read.
+        with self._condition:
+            if self._length == 0 and not self._closed:
+                self._clear_notification()
+                return None
+            return self._read(max_size)
+
+    def skip(self):
+        # Drops everything which was not read yet, so the reader continues
+        # with the next data written. Returns how many bytes were dropped.
+        with self._condition:
+            length = self._length
+            self._drop(length)
+            if not self._closed:
+                self._clear_notification()
+            self._condition.notify_all()
+            return length
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._notify()
+            self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            for fd in [self._notify_reader, self._notify_writer]:
+                if fd is not None:
+                    os.close(fd)
+            self._notify_reader, self._notify_writer = None, None
+
+    def __str__(self):
+        return '<{} size="{}" length="{}" policy="{}" dropped="{}">'.format(
+            self.__class__.__name__,
+            self.size,
+            self._length,
+            self.policy,
+            self.dropped_bytes,
+        )
+
+
+class HistoryBuffer(object):
+
+    # Keeps the most recent bytes of a stream, addressed by their absolute
+    # position since the stream started. It is not thread safe on its own.
+
+    def __init__(self, size):
+        self.size = size
+        self.end = 0
+        self._buffer = bytearray(size)
+
+    @property
+    def start(self):
+        return max(0, self.end - self.size)
+
+    def clear(self):
+        self.end = 0
+
+    def write(self, data):
+        if len(data) > self.size:
+            self.end += len(data) - self.size
+            data = data[-self.size:]
+        offset = self.end % self.size
+        first = min(len(data), self.size - offset)
+        self._buffer[offset:offset + first] = data[:first]
+        if first < len(data):
+            self._buffer[0:len(data) - first] = data[first:]
+        self.end += len(data)
+
+    def read(self, position):
+        # Returns everything from position on or None if that is not part
+        # of the buffer (anymore).
+        if position < self.start or position > self.end:
+            return None
+        offset = position % self.size
+        length = self.end - position
+        first = min(length, self.size - offset)
+        data = bytes(self._buffer[offset:offset + first])
+        if first < length:
+            data += bytes(self._buffer[0:length - first])
+        return data
+
+    def __str__(self):
+        return '<{} size="{}" start="{}" end="{}">'.format(
+            self.__class__.__name__,
+            self.size,
+            self.start,
+            self.end,
+        )
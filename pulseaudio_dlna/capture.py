@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import subprocess
+import threading
+import logging
+import signal
+import errno
+import os
+
+import pulseaudio_dlna.buffers
+import pulseaudio_dlna.latency
+import pulseaudio_dlna.recorders
+
+logger = logging.getLogger('pulseaudio_dlna.capture')
+
+
+class CaptureOutput(object):
+
+    # Feeds the recorded PCM data to the stdin of a single encoder. Every
+    # encoder has a buffer of its own, so a slow one just loses its oldest
+    # samples instead of stalling the others.
+
+    BUFFER_SIZE = 1024 * 256
+
+    def __init__(self, output):
+        self.output = output
+        self.buffer = pulseaudio_dlna.buffers.RingBuffer(
+            self.BUFFER_SIZE, pulseaudio_dlna.buffers.POLICY_DROP_OLDEST,
+            pulseaudio_dlna.latency.FRAME_SIZE)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def close(self):
+        # The encoder gets everything buffered so far and an EOF afterwards.
+        self.buffer.close()
+
+    def _run(self):
+        try:
+            while True:
+                data = self.buffer.read()
+                if len(data) == 0:
+                    break
+                self.output.write(data)
+                self.output.flush()
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPIPE:
+                logger.error(
+                    'Could not write to the encoder ({}).'.format(e))
+        finally:
+            self.buffer.release()
+            try:
+                self.output.close()
+            except (IOError, OSError):
+                pass
+            if self.buffer.dropped_bytes > 0:
+                logger.info(
+                    'An encoder could not keep up with its capture and '
+                    'dropped {dropped} bytes.'.format(
+                        dropped=self.buffer.dropped_bytes))
+
+
+class Capture(object):
+
+    # Records a monitor once and hands the PCM data to any number of
+    # encoders. In process recorders write to the capture like to a file.
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.key = recorder.capture_key
+        self.metrics = pulseaudio_dlna.recorders.RecorderMetrics()
+        self.outputs = []
+        self.users = 0
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        logger.info('Starting shared capture "{}"'.format(
+            ' '.join(self.recorder.command) or self.recorder))
+        if self.recorder.IN_PROCESS:
+            self.process = self.recorder.start(self, self.metrics)
+            return
+        self.process = subprocess.Popen(
+            self.recorder.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=True)
+        self.metrics.watch(self.process.stderr)
+        thread = threading.Thread(
+            target=self._read, args=(self.process.stdout, ))
+        thread.daemon = True
+        thread.start()
+
+    def _read(self, stream):
+        chunk_size = self.recorder.chunk_size
+        try:
+            while True:
+                data = os.read(stream.fileno(), chunk_size)
+                if len(data) == 0:
+                    break
+                self.write(data)
+        except OSError:
+            pass
+        finally:
+            stream.close()
+            self.close()
+
+    @property
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def subscribe(self, output):
+        capture_output = CaptureOutput(output)
+        capture_output.start()
+        with self.lock:
+            self.outputs.append(capture_output)
+        return capture_output
+
+    def unsubscribe(self, capture_output):
+        with self.lock:
+            if capture_output in self.outputs:
+                self.outputs.remove(capture_output)
+        capture_output.close()
+
+    def write(self, data):
+        with self.lock:
+            for capture_output in self.outputs:
+                capture_output.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # The recorder stopped, the encoders finish on their own then.
+        with self.lock:
+            for capture_output in self.outputs:
+                capture_output.close()
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.recorder.IN_PROCESS:
+            self.process.stop()
+            return
+        pid = self.process.pid
+        logger.debug('Terminating process {} ...'.format(pid))
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+    def __str__(self):
+        return '<{} recorder="{}" encoders="{}">'.format(
+            self.__class__.__name__,
+            ' '.join(self.recorder.command) or self.recorder,
+            len(self.outputs),
+        )
+
+
+class CaptureManager(object):
+
+    # Hands out one capture per recorder, which runs as long as an
+    # encoder uses it.
+
+    def __init__(self):
+        self.captures = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, recorder):
+        with self.lock:
+            capture = self.captures.get(recorder.capture_key, None)
+            if capture is None or not capture.is_running:
+                capture = Capture(recorder)
+                capture.start()
+                self.captures[capture.key] = capture
+            capture.users += 1
+            return capture
+
+    def release(self, capture):
+        with self.lock:
+            capture.users -= 1
+            if capture.users > 0:
+                return
+            if self.captures.get(capture.key, None) is capture:
+                del self.captures[capture.key]
+        capture.stop()
+
+
+captures = CaptureManager()
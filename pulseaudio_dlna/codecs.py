@@ -24,6 +24,9 @@ import inspect
 import sys
 
 import pulseaudio_dlna.encoders
+import pulseaudio_dlna.latency
+import pulseaudio_dlna.sockets
+import pulseaudio_dlna.recorders
 import pulseaudio_dlna.rules
 
 logger = logging.getLogger('pulseaudio_dlna.codecs')
@@ -40,6 +43,14 @@ class UnknownBackendException(Exception):
         )
 
 
+class UnknownRecorderException(Exception):
+    def __init__(self, recorder):
+        Exception.__init__(
+            self,
+            'You specified an unknown recorder "{}"!'.format(recorder)
+        )
+
+
 class UnknownCodecException(Exception):
     def __init__(self, codec):
         Exception.__init__(
@@ -64,6 +75,23 @@ def set_backend(backend):
     raise UnknownBackendException(backend)
 
 
+def set_recorder(recorder):
+    if recorder in pulseaudio_dlna.recorders.RECORDERS:
+        BaseCodec.RECORDER = recorder
+        return
+    raise UnknownRecorderException(recorder)
+
+
+def set_latency_profile(profile):
+    pulseaudio_dlna.latency.validate(profile)
+    BaseCodec.LATENCY_PROFILE = profile
+
+
+def set_socket_profile(profile):
+    pulseaudio_dlna.sockets.validate(profile)
+    BaseCodec.SOCKET_PROFILE = profile
+
+
 def set_codecs(identifiers):
     step = 3
     priority = (len(CODECS) + 1) * step
@@ -93,11 +121,18 @@ class BaseCodec(object):
     ENABLED = True
     IDENTIFIER = None
     BACKEND = 'generic'
+    RECORDER = 'parec'
+    LATENCY_PROFILE = 'default'
+    SOCKET_PROFILE = 'default'
     PRIORITY = None
+    # Estimated CPU usage of the encoder in percent of a single core.
+    CPU_COST = 10.0
 
     def __init__(self):
         self.mime_type = None
         self.suffix = None
+        self.latency_profile = None
+        self.socket_profile = None
         self.rules = pulseaudio_dlna.rules.Rules()
 
     @property
@@ -139,11 +174,33 @@ class BaseCodec(object):
         return False
 
     def get_recorder(self, monitor):
+        latency_profile = self.get_latency_profile()
         if self.BACKEND == 'pulseaudio':
             return pulseaudio_dlna.recorders.PulseaudioRecorder(
-                monitor, codec=self)
+                monitor, codec=self, latency_profile=latency_profile)
         else:
-            return pulseaudio_dlna.recorders.PulseaudioRecorder(monitor)
+            return pulseaudio_dlna.recorders.RECORDERS[self.RECORDER](
+                monitor, latency_profile=latency_profile)
+
+    def get_latency_profile(self):
+        # A profile set in the device config has precedence over the one
+        # chosen for all devices.
+        profile = self.latency_profile or self.LATENCY_PROFILE
+        try:
+            return pulseaudio_dlna.latency.get_profile(profile)
+        except pulseaudio_dlna.latency.UnknownLatencyProfileException as e:
+            logger.warning(e)
+            return pulseaudio_dlna.latency.get_profile(self.LATENCY_PROFILE)
+
+    def get_socket_profile(self):
+        # A profile set in the device config has precedence over the one
+        # chosen for all devices.
+        profile = self.socket_profile or self.SOCKET_PROFILE
+        try:
+            return pulseaudio_dlna.sockets.get_profile(profile)
+        except pulseaudio_dlna.sockets.UnknownSocketProfileException as e:
+            logger.warning(e)
+            return pulseaudio_dlna.sockets.get_profile(self.SOCKET_PROFILE)
 
     def __eq__(self, other):
         return type(self) is type(other)
@@ -202,6 +259,7 @@ class Mp3Codec(BitRateMixin, BaseCodec):
         'avconv': pulseaudio_dlna.encoders.AVConvMp3Encoder,
     }
     PRIORITY = 18
+    CPU_COST = 8.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -221,6 +279,7 @@ class WavCodec(BaseCodec):
         'pulseaudio': pulseaudio_dlna.encoders.NullEncoder,
     }
     PRIORITY = 15
+    CPU_COST = 2.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -238,6 +297,7 @@ class L16Codec(BaseCodec):
         'avconv': pulseaudio_dlna.encoders.AVConvL16Encoder,
     }
     PRIORITY = 1
+    CPU_COST = 2.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -290,6 +350,7 @@ class AacCodec(BitRateMixin, BaseCodec):
         'avconv': pulseaudio_dlna.encoders.AVConvAacEncoder,
     }
     PRIORITY = 12
+    CPU_COST = 10.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -309,6 +370,7 @@ class OggCodec(BitRateMixin, BaseCodec):
         'pulseaudio': pulseaudio_dlna.encoders.NullEncoder,
     }
     PRIORITY = 6
+    CPU_COST = 10.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -328,6 +390,7 @@ class FlacCodec(BaseCodec):
         'pulseaudio': pulseaudio_dlna.encoders.NullEncoder,
     }
     PRIORITY = 9
+    CPU_COST = 6.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -345,6 +408,7 @@ class OpusCodec(BitRateMixin, BaseCodec):
         'avconv': pulseaudio_dlna.encoders.AVConvOpusEncoder,
     }
     PRIORITY = 3
+    CPU_COST = 8.0
 
     def __init__(self, mime_string=None):
         BaseCodec.__init__(self)
@@ -0,0 +1,298 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import logging
+import inspect
+import struct
+import sys
+
+logger = logging.getLogger('pulseaudio_dlna.framing')
+
+FRAMINGS = {}
+
+
+def get_framing(codec):
+    try:
+        return FRAMINGS[codec.IDENTIFIER]()
+    except (KeyError, AttributeError):
+        return BaseFraming()
+
+
+class BaseFraming(object):
+
+    IDENTIFIERS = []
+    ALIGNMENT = 1
+    SILENT_FRAMES = False
+    # Whether every encoder run with the same settings writes the same
+    # header.
+    STATIC_HEADER = True
+
+    def header_length(self, data):
+        # Returns the length of the stream header at the beginning of data,
+        # 0 if the stream does not start with a header and None if more data
+        # is needed to decide.
+        return 0
+
+    def frame_offset(self, data, position=0):
+        # Returns the offset of the first frame boundary within data or None
+        # if there is none. The position is the absolute offset of data
+        # within the audio stream (without the header).
+        return None
+
+    def silent_frame(self, data):
+        # Returns a frame which decodes to silence and matches the frames
+        # within data together with its duration in seconds. None if there
+        # is no frame in data or the codec cannot do that.
+        return None
+
+
+class WavFraming(BaseFraming):
+
+    IDENTIFIERS = ['wav', 'l16']
+    ALIGNMENT = 4
+
+    def header_length(self, data):
+        if len(data) < 12:
+            return None
+        if data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+            return 0
+        offset = 12
+        while len(data) >= offset + 8:
+            chunk_id = data[offset:offset + 4]
+            chunk_size, = struct.unpack(b'<I', data[offset + 4:offset + 8])
+            if chunk_id == b'data':
+                return offset + 8
+            offset += 8 + chunk_size + (chunk_size % 2)
+        return None
+
+    def frame_offset(self, data, position=0):
+        offset = -position % self.ALIGNMENT
+        return offset if offset < len(data) else None
+
+
+class OggFraming(BaseFraming):
+
+    IDENTIFIERS = ['ogg', 'opus']
+    # Every stream gets a random serial number.
+    STATIC_HEADER = False
+
+    def _page_length(self, data, offset):
+        if len(data) < offset + 27:
+            return None
+        segments = ord(data[offset + 26:offset + 27])
+        if len(data) < offset + 27 + segments:
+            return None
+        lacing = data[offset + 27:offset + 27 + segments]
+        return 27 + segments + sum(ord(lacing[i:i + 1]) for i in range(
+            segments))
+
+    def _granule_position(self, data, offset):
+        granule_position, = struct.unpack(
+            b'<q', data[offset + 6:offset + 14])
+        return granule_position
+
+    def header_length(self, data):
+        if len(data) < 4:
+            return None
+        if data[0:4] != b'OggS':
+            return 0
+        # Header pages (identification, comment, setup) are the ones
+        # without a granule position. The first audio page ends the header.
+        offset = 0
+        while True:
+            page_length = self._page_length(data, offset)
+            if page_length is None:
+                return None
+            if data[offset:offset + 4] != b'OggS':
+                return offset
+            if self._granule_position(data, offset) != 0:
+                return offset
+            offset += page_length
+
+    def frame_offset(self, data, position=0):
+        offset = data.find(b'OggS')
+        while offset != -1:
+            if data[offset + 4:offset + 5] in [b'\x00', b'']:
+                return offset
+            offset = data.find(b'OggS', offset + 1)
+        return None
+
+
+class FlacFraming(BaseFraming):
+
+    IDENTIFIERS = ['flac']
+
+    def header_length(self, data):
+        if len(data) < 4:
+            return None
+        if data[0:4] != b'fLaC':
+            return 0
+        offset = 4
+        while len(data) >= offset + 4:
+            block_header, = struct.unpack(b'>I', data[offset:offset + 4])
+            is_last = block_header & 0x80000000
+            offset += 4 + (block_header & 0x00ffffff)
+            if is_last:
+                return offset if len(data) >= offset else None
+        return None
+
+    def _is_frame_header(self, data, offset):
+        if len(data) < offset + 4:
+            return False
+        header = bytearray(data[offset:offset + 4])
+        return (
+            header[0] == 0xff and
+            header[1] & 0xfe == 0xf8 and
+            header[2] & 0xf0 != 0x00 and
+            header[2] & 0x0f != 0x0f and
+            header[3] >> 4 < 0x0b and
+            header[3] & 0x0e not in [0x06, 0x0e] and
+            header[3] & 0x01 == 0x00)
+
+    def frame_offset(self, data, position=0):
+        offset = data.find(b'\xff')
+        while offset != -1:
+            if self._is_frame_header(data, offset):
+                return offset
+            offset = data.find(b'\xff', offset + 1)
+        return None
+
+
+class Mp3Framing(BaseFraming):
+
+    IDENTIFIERS = ['mp3']
+    SILENT_FRAMES = True
+    BIT_RATES = {
+        # MPEG 1 Layer III
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+        # MPEG 2 and 2.5 Layer III
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    }
+    SAMPLE_RATES = {
+        3: [44100, 48000, 32000],
+        2: [22050, 24000, 16000],
+        0: [11025, 12000, 8000],
+    }
+
+    def header_length(self, data):
+        if len(data) < 10:
+            return None
+        if data[0:3] != b'ID3':
+            return 0
+        size = 0
+        for byte in data[6:10]:
+            size = (size << 7) | (ord(byte) & 0x7f)
+        length = 10 + size
+        return length if len(data) >= length else None
+
+    def _frame_length(self, data, offset):
+        # Returns the length of the Layer III frame starting at offset or
+        # None if there is no valid frame header.
+        if len(data) < offset + 4:
+            return None
+        header = bytearray(data[offset:offset + 4])
+        if header[0] != 0xff or header[1] & 0xe0 != 0xe0:
+            return None
+        version = (header[1] >> 3) & 0x03
+        layer = (header[1] >> 1) & 0x03
+        bit_rate_index = header[2] >> 4
+        sample_rate_index = (header[2] >> 2) & 0x03
+        if version == 1 or layer != 1 or bit_rate_index in [0, 15] or \
+           sample_rate_index == 3:
+            return None
+        bit_rate = self.BIT_RATES[version][bit_rate_index] * 1000
+        sample_rate = self.SAMPLE_RATES[version][sample_rate_index]
+        padding = (header[2] >> 1) & 0x01
+        samples = 144 if version == 3 else 72
+        return samples * bit_rate // sample_rate + padding
+
+    def frame_offset(self, data, position=0):
+        # A frame is only accepted if the following frame header is valid
+        # too, as long as it is part of data.
+        offset = data.find(b'\xff')
+        while offset != -1:
+            length = self._frame_length(data, offset)
+            if length:
+                if len(data) < offset + length + 4 or \
+                   self._frame_length(data, offset + length):
+                    return offset
+            offset = data.find(b'\xff', offset + 1)
+        return None
+
+    def silent_frame(self, data):
+        # A frame without any main data decodes to silence, so everything
+        # after the header is left zero. The header is taken from the
+        # encoder, but without CRC and padding.
+        offset = self.frame_offset(data)
+        if offset is None or len(data) < offset + 4:
+            return None
+        header = bytearray(data[offset:offset + 4])
+        header[1] |= 0x01
+        header[2] &= 0xfd
+        length = self._frame_length(bytes(header), 0)
+        if not length:
+            return None
+        version = (header[1] >> 3) & 0x03
+        sample_rate = self.SAMPLE_RATES[version][(header[2] >> 2) & 0x03]
+        samples = 1152 if version == 3 else 576
+        frame = bytes(header) + b'\x00' * (length - 4)
+        return frame, float(samples) / sample_rate
+
+
+class AacFraming(BaseFraming):
+
+    IDENTIFIERS = ['aac']
+
+    def _frame_length(self, data, offset):
+        if len(data) < offset + 7:
+            return None
+        header = bytearray(data[offset:offset + 7])
+        if header[0] != 0xff or header[1] & 0xf6 != 0xf0:
+            return None
+        if (header[2] >> 2) & 0x0f > 12:
+            return None
+        length = ((header[3] & 0x03) << 11) | (header[4] << 3) | \
+            (header[5] >> 5)
+        return length if length >= 7 else None
+
+    def frame_offset(self, data, position=0):
+        offset = data.find(b'\xff')
+        while offset != -1:
+            length = self._frame_length(data, offset)
+            if length:
+                if len(data) < offset + length + 7 or \
+                   self._frame_length(data, offset + length):
+                    return offset
+            offset = data.find(b'\xff', offset + 1)
+        return None
+
+
+def load_framings():
+    if len(FRAMINGS) == 0:
+        logger.debug('Loaded framings:')
+        for name, _type in inspect.getmembers(sys.modules[__name__]):
+            if inspect.isclass(_type) and issubclass(_type, BaseFraming):
+                if _type is not BaseFraming:
+                    for identifier in _type.IDENTIFIERS:
+                        logger.debug('  {} = {}'.format(identifier, _type))
+                        FRAMINGS[identifier] = _type
+    return None
+
+load_framings()
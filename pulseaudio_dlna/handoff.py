@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import logging
+import requests
+
+logger = logging.getLogger('pulseaudio_dlna.handoff')
+
+API_PATH = '/api/handoff'
+REQUEST_TIMEOUT = 10
+
+
+class HandoffException(Exception):
+    # The HTTP status the stream server answers a handoff request with.
+    STATUS = 409
+
+
+class UnknownDeviceException(HandoffException):
+    STATUS = 404
+
+    def __init__(self, identifier):
+        Exception.__init__(
+            self,
+            'There is no device called "{}"!'.format(identifier)
+        )
+
+
+class DeviceNotPlayingException(HandoffException):
+    def __init__(self, device):
+        Exception.__init__(
+            self,
+            'The device "{}" is not playing!'.format(device.label)
+        )
+
+
+class DevicePlayingException(HandoffException):
+    def __init__(self, device):
+        Exception.__init__(
+            self,
+            'The device "{}" is already playing!'.format(device.label)
+        )
+
+
+class SameDeviceException(HandoffException):
+    def __init__(self, device):
+        Exception.__init__(
+            self,
+            'The device "{}" is already playing the stream!'.format(
+                device.label)
+        )
+
+
+class IncompatibleCodecException(HandoffException):
+    def __init__(self, source, target):
+        Exception.__init__(
+            self,
+            'The device "{}" does not use the same codec as "{}"!'.format(
+                target.label, source.label)
+        )
+
+
+def find_bridge(bridges, identifier):
+    # Devices can be identified by their udn, their name or their label.
+    for bridge in bridges:
+        device = bridge.device
+        if identifier == device.udn or \
+           identifier.lower() in [device.name.lower(), device.label.lower()]:
+            return bridge
+    raise UnknownDeviceException(identifier)
+
+
+def check(source_bridge, target_bridge):
+    # The target has to use the same codec, so it can be served by the
+    # encoder which is already running.
+    if source_bridge.device == target_bridge.device:
+        raise SameDeviceException(target_bridge.device)
+    if not source_bridge.device.codec == target_bridge.device.codec:
+        raise IncompatibleCodecException(
+            source_bridge.device, target_bridge.device)
+
+
+def validate(bridges, source, target):
+    # Returns the bridge of the device playing the stream and the bridge of
+    # the device it is handed to.
+    source_bridge = find_bridge(bridges, source)
+    target_bridge = find_bridge(bridges, target)
+    check(source_bridge, target_bridge)
+    return source_bridge, target_bridge
+
+
+def request(host, port, source, target):
+    # Asks a running instance to hand its stream over. Returns the status
+    # code and the message of the stream server.
+    url = 'http://{host}:{port}{path}'.format(
+        host=host, port=port, path=API_PATH)
+    response = requests.post(
+        url, data={'source': source, 'target': target},
+        timeout=REQUEST_TIMEOUT)
+    return response.status_code, response.text.strip()
@@ -18,9 +18,14 @@
 from __future__ import unicode_literals
 from __future__ import with_statement
 
+import email.utils
+import threading
+import collections
 import tempfile
+import hashlib
 import logging
 import gi
+import os
 
 logger = logging.getLogger('pulseaudio_dlna.images')
 
@@ -88,11 +93,64 @@ def get_type_by_filepath(path):
     raise UnknownImageExtension(path)
 
 
+def get_file_stamp(path):
+    # Changes whenever the file is rewritten.
+    try:
+        stat = os.stat(path)
+    except EnvironmentError:
+        raise ImageNotAccessible(path)
+    return stat.st_mtime, stat.st_size
+
+
+def get_cached_image(path):
+    # The key contains the stamp of the file, so an image rewritten at the
+    # same path is read again instead of serving the outdated data.
+    _type = get_type_by_filepath(path)
+    return cache.get(
+        ('image', path, None) + get_file_stamp(path),
+        lambda: _type(path=path, cached=True))
+
+
+class ImageCache(object):
+
+    # Keeps the most recently requested images, so icons are neither
+    # looked up nor rendered again for every request.
+
+    MAX_ENTRIES = 32
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.images = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, create):
+        # The lock is held while creating the image, Gtk must not be used
+        # from several threads at once anyway.
+        with self.lock:
+            image = self.images.pop(key, None)
+            if image is None:
+                image = create()
+                logger.debug('Cached image {}.'.format(key))
+            self.images[key] = image
+            while len(self.images) > self.max_entries:
+                self.images.popitem(last=False)
+            return image
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+
+
+cache = ImageCache()
+
+
 class BaseImage(object):
     def __init__(self, path, cached=True):
         self.path = path
         self.content_type = None
         self.cached = cached
+        self.modified = None
+        self._etag = None
 
         if self.cached:
             self._read_data()
@@ -101,9 +159,22 @@ class BaseImage(object):
         try:
             with open(self.path) as h:
                 self._data = h.read()
+            self.modified = os.path.getmtime(self.path)
         except EnvironmentError:
             raise ImageNotAccessible(self.path)
 
+    @property
+    def etag(self):
+        if self._etag is None:
+            self._etag = '"{}"'.format(hashlib.md5(self.data).hexdigest())
+        return self._etag
+
+    @property
+    def last_modified(self):
+        if self.modified is None:
+            return None
+        return email.utils.formatdate(self.modified, usegmt=True)
+
     @property
     def data(self):
         if self.cached:
@@ -147,6 +218,7 @@ class SvgPngImage(BaseImage):
         image_surface.write_to_png(tmp_file.name)
 
         BaseImage.__init__(self, tmp_file.name, cached=True)
+        self.content_type = 'image/png'
 
 
 class JpgImage(BaseImage):
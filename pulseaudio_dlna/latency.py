@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import sys
+import inspect
+import logging
+
+logger = logging.getLogger('pulseaudio_dlna.latency')
+
+# The recorders always capture signed 16 bit stereo PCM at 44.1 kHz.
+SAMPLE_RATE = 44100
+FRAME_SIZE = 4
+
+DEFAULT_CHUNK_SIZE = 4096
+
+PROFILES = {}
+
+
+class UnknownLatencyProfileException(Exception):
+    def __init__(self, profile):
+        Exception.__init__(
+            self,
+            'You specified an unknown latency profile "{}"!'.format(profile)
+        )
+
+
+def validate(profile):
+    if profile not in PROFILES:
+        raise UnknownLatencyProfileException(profile)
+
+
+def get_profile(profile):
+    validate(profile)
+    return PROFILES[profile]()
+
+
+class BaseLatencyProfile(object):
+
+    IDENTIFIER = None
+    LATENCY_MSEC = None
+    PROCESS_TIME_MSEC = None
+
+    @property
+    def latency_msec(self):
+        return self.LATENCY_MSEC
+
+    @property
+    def process_time_msec(self):
+        return self.PROCESS_TIME_MSEC
+
+    @property
+    def chunk_size(self):
+        # The amount of data read from the encoder at once. Reading more
+        # than the recorder delivers within its latency target just adds
+        # wakeups without any data.
+        if not self.latency_msec:
+            return DEFAULT_CHUNK_SIZE
+        frames = SAMPLE_RATE * self.latency_msec // 1000
+        return max(frames, 1) * FRAME_SIZE
+
+    def __str__(self):
+        return '<{} latency="{}" process_time="{}" chunk_size="{}">'.format(
+            self.__class__.__name__,
+            self.latency_msec,
+            self.process_time_msec,
+            self.chunk_size,
+        )
+
+
+class DefaultLatencyProfile(BaseLatencyProfile):
+
+    # PulseAudio chooses the buffer sizes on its own.
+    IDENTIFIER = 'default'
+
+
+class LowLatencyProfile(BaseLatencyProfile):
+
+    IDENTIFIER = 'low'
+    LATENCY_MSEC = 20
+    PROCESS_TIME_MSEC = 10
+
+
+class BalancedLatencyProfile(BaseLatencyProfile):
+
+    IDENTIFIER = 'balanced'
+    LATENCY_MSEC = 100
+    PROCESS_TIME_MSEC = 50
+
+
+class PowerSaveLatencyProfile(BaseLatencyProfile):
+
+    IDENTIFIER = 'power-save'
+    LATENCY_MSEC = 500
+    PROCESS_TIME_MSEC = 250
+
+
+def load_profiles():
+    if len(PROFILES) == 0:
+        logger.debug('Loaded latency profiles:')
+        for name, _type in inspect.getmembers(sys.modules[__name__]):
+            if inspect.isclass(_type) and \
+               issubclass(_type, BaseLatencyProfile):
+                if _type is not BaseLatencyProfile:
+                    logger.debug('  {} = {}'.format(_type.IDENTIFIER, _type))
+                    PROFILES[_type.IDENTIFIER] = _type
+    return None
+
+load_profiles()
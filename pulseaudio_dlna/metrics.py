@@ -0,0 +1,213 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import json
+import logging
+
+logger = logging.getLogger('pulseaudio_dlna.metrics')
+
+PREFIX = 'pulseaudio_dlna'
+
+TYPE_COUNTER = 'counter'
+TYPE_GAUGE = 'gauge'
+
+# (name, type, description, key)
+PROCESS_METRICS = [
+    ('uptime_seconds', TYPE_GAUGE,
+     'Seconds since the stream server was started.', 'uptime_seconds'),
+    ('streams', TYPE_GAUGE,
+     'Number of connected streams.', 'streams'),
+    ('broadcasters', TYPE_GAUGE,
+     'Number of running encoder pipelines.', 'broadcasters'),
+    ('encoded_bytes_total', TYPE_COUNTER,
+     'Bytes read from all running encoders.', 'bytes_encoded'),
+    ('sent_bytes_total', TYPE_COUNTER,
+     'Bytes sent to all connected streams.', 'bytes_sent'),
+    ('stalls_total', TYPE_COUNTER,
+     'Sends to connected streams which did not fit into the socket.',
+     'stalls'),
+    ('evictions_total', TYPE_COUNTER,
+     'Streams disconnected because their client did not read anything.',
+     'evictions'),
+    ('admission_rejections_total', TYPE_COUNTER,
+     'Streams rejected because the CPU budget was exhausted.',
+     'admission_rejections'),
+    ('cpu_budget_percent', TYPE_GAUGE,
+     'CPU budget for all pipelines in percent of a single core.',
+     'cpu_budget_percent'),
+    ('cpu_cost_percent', TYPE_GAUGE,
+     'Estimated CPU usage of all running pipelines.', 'cpu_cost_percent'),
+    ('probes_total', TYPE_COUNTER,
+     'Streams answered with a snapshot until they outlasted the probe '
+     'window.', 'probes'),
+    ('probe_pipelines_avoided_total', TYPE_COUNTER,
+     'Pipelines not started because the stream disconnected within the '
+     'probe window.', 'probe_pipelines_avoided'),
+]
+
+BRIDGE_METRICS = [
+    ('bridge_streams', TYPE_GAUGE,
+     'Number of streams connected to the pipeline.', 'streams'),
+    ('bridge_age_seconds', TYPE_GAUGE,
+     'Seconds since the pipeline was created.', 'age_seconds'),
+    ('bridge_bit_rate_kilobits_per_second', TYPE_GAUGE,
+     'Bit rate of the encoder, if it has a fixed one.', 'bit_rate_kbps'),
+    ('bridge_cpu_cost_percent', TYPE_GAUGE,
+     'Estimated CPU usage of the pipeline.', 'cpu_cost_percent'),
+    ('bridge_encoded_bytes_total', TYPE_COUNTER,
+     'Bytes read from the encoder.', 'bytes_encoded'),
+    ('bridge_running', TYPE_GAUGE,
+     'Whether the pipeline is running.', 'running'),
+    ('bridge_restarts_total', TYPE_COUNTER,
+     'Restarts of the recorder and encoder processes.', 'restarts'),
+    ('bridge_encoder_stalls_total', TYPE_COUNTER,
+     'Restarts because the encoder stopped producing output.',
+     'encoder_stalls'),
+    ('bridge_silent', TYPE_GAUGE,
+     'Whether the encoder is paused because the sink is silent.', 'silent'),
+    ('bridge_silence_pauses_total', TYPE_COUNTER,
+     'Encoder pauses because the sink was silent.', 'silence_pauses'),
+    ('bridge_reinitialize_count', TYPE_GAUGE,
+     'Recent restarts counting towards the restart limit.',
+     'reinitialize_count'),
+    ('bridge_recorder_latency_microseconds', TYPE_GAUGE,
+     'Capture latency reported by PulseAudio.', 'recorder_latency_usec'),
+]
+
+STREAM_METRICS = [
+    ('stream_age_seconds', TYPE_GAUGE,
+     'Seconds since the client connected.', 'age_seconds'),
+    ('stream_encoded_bytes_total', TYPE_COUNTER,
+     'Encoded bytes handed to the stream.', 'bytes_encoded'),
+    ('stream_sent_bytes_total', TYPE_COUNTER,
+     'Bytes sent to the client.', 'bytes_sent'),
+    ('stream_buffer_bytes', TYPE_GAUGE,
+     'Bytes waiting in the stream buffer.', 'buffer_depth_bytes'),
+    ('stream_buffer_dropped_bytes_total', TYPE_COUNTER,
+     'Bytes dropped because the stream buffer was full.',
+     'buffer_dropped_bytes'),
+    ('stream_send_rate_bits_per_second', TYPE_GAUGE,
+     'Average rate the client was sent data with.', 'send_rate_bps'),
+    ('stream_codec_bit_rate_bits_per_second', TYPE_GAUGE,
+     'Bit rate of the encoder, if it has a fixed one.', 'codec_bit_rate_bps'),
+    ('stream_stalls_total', TYPE_COUNTER,
+     'Sends which did not fit into the socket.', 'stalls'),
+    ('stream_skips_total', TYPE_COUNTER,
+     'Times the stream skipped ahead because the client did not read '
+     'anything.', 'skips'),
+    ('stream_skipped_bytes_total', TYPE_COUNTER,
+     'Bytes dropped when the stream skipped ahead.', 'skipped_bytes'),
+    ('stream_socket_queued_bytes', TYPE_GAUGE,
+     'Bytes in the socket send queue the client did not acknowledge yet.',
+     'socket_queued_bytes'),
+    ('stream_socket_queued_milliseconds', TYPE_GAUGE,
+     'Milliseconds of audio in the socket send queue.', 'socket_queued_msec'),
+]
+
+BRIDGE_LABELS = ['path', 'device', 'group', 'codec']
+STREAM_LABELS = ['id', 'path', 'device', 'client']
+
+
+class BaseReport(object):
+
+    # Rendered metrics, served by the stream server like an image.
+
+    CONTENT_TYPE = None
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._data = None
+
+    @property
+    def content_type(self):
+        return self.CONTENT_TYPE
+
+    @property
+    def data(self):
+        # Rendered once, so the body matches the announced length.
+        if self._data is None:
+            self._data = self.render().encode('utf-8')
+        return self._data
+
+    def render(self):
+        raise NotImplementedError()
+
+
+class JsonReport(BaseReport):
+
+    CONTENT_TYPE = 'application/json'
+
+    def render(self):
+        return json.dumps(self.metrics, indent=2)
+
+
+class PrometheusReport(BaseReport):
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def _escape(self, value):
+        return unicode(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+
+    def _format_value(self, value):
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        if isinstance(value, float):
+            return repr(value)
+        return unicode(value)
+
+    def _render_family(self, lines, definition, samples, labels):
+        name, _type, description, key = definition
+        name = '{}_{}'.format(PREFIX, name)
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, _type))
+        for sample in samples:
+            value = sample.get(key, None)
+            if value is None:
+                continue
+            label_string = ','.join(
+                '{}="{}"'.format(label, self._escape(sample[label]))
+                for label in labels if sample.get(label, None) is not None)
+            lines.append('{}{} {}'.format(
+                name,
+                '{' + label_string + '}' if label_string else '',
+                self._format_value(value)))
+
+    def render(self):
+        lines = []
+        for definition in PROCESS_METRICS:
+            self._render_family(
+                lines, definition, [self.metrics['process']], [])
+        for definition in BRIDGE_METRICS:
+            self._render_family(
+                lines, definition, self.metrics['bridges'], BRIDGE_LABELS)
+        for definition in STREAM_METRICS:
+            self._render_family(
+                lines, definition, self.metrics['streams'], STREAM_LABELS)
+        return '\n'.join(lines) + '\n'
+
+
+REPORTS = {
+    '/metrics': PrometheusReport,
+    '/metrics.json': JsonReport,
+}
+
+
+def get_report_type(path):
+    return REPORTS.get(path.split('?', 1)[0], None)
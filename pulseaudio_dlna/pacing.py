@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import logging
+import time
+
+import pulseaudio_dlna.rules
+
+logger = logging.getLogger('pulseaudio_dlna.pacing')
+
+
+class Pacer(object):
+
+    # Limits a stream to the rate it is encoded with. The first burst_msec
+    # of audio are sent right away to fill the renderer's buffer, afterwards
+    # the stream may only run lead_msec ahead of real time. As long as the
+    # rate is unknown, the stream is not limited at all, but everything sent
+    # in the meantime counts towards the burst.
+
+    INTERVAL_MSEC = 20
+
+    def __init__(self, get_rate, burst_msec, lead_msec):
+        self.get_rate = get_rate
+        self.burst_msec = burst_msec
+        self.lead_msec = lead_msec
+        self.started = None
+        self.sent_bytes = 0
+        self.is_limited = False
+
+    def allowance(self):
+        # Returns how many bytes may be sent now, None if there is no limit.
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        rate = self.get_rate()
+        if not rate:
+            return None
+        if not self.is_limited:
+            self.is_limited = True
+            logger.debug(
+                'Pacing the stream at {rate} bytes/s ({burst} ms burst, '
+                '{lead} ms lead).'.format(
+                    rate=rate, burst=self.burst_msec, lead=self.lead_msec))
+        msec = self.burst_msec + self.lead_msec + (now - self.started) * 1000
+        return int(rate * msec / 1000) - self.sent_bytes
+
+    def delay_msec(self):
+        # Returns how long to wait until another interval of audio may be
+        # sent.
+        rate = self.get_rate()
+        allowance = self.allowance()
+        if not rate or allowance is None:
+            return 0
+        deficit = rate * self.INTERVAL_MSEC / 1000.0 - allowance
+        return max(int(deficit * 1000 / rate), 1)
+
+    def consume(self, length):
+        self.sent_bytes += length
+
+
+def create_pacer(bridge, get_rate):
+    # Streams are only paced for devices having the PACED_SENDING rule.
+    rules = list(bridge.device.rules) + list(bridge.device.codec.rules)
+    for rule in rules:
+        if rule == pulseaudio_dlna.rules.PACED_SENDING:
+            return Pacer(
+                get_rate, int(rule.burst_msec), int(rule.lead_msec))
+    return None
@@ -24,6 +24,7 @@ import urllib
 import functools
 import logging
 import base64
+import hashlib
 
 import pulseaudio_dlna.pulseaudio
 import pulseaudio_dlna.rules
@@ -337,21 +338,40 @@ class BaseRenderer(object):
             ip=server_ip,
             port=server_port,
         )
+        return urlparse.urljoin(base_url, self._encode_path(settings, suffix))
+
+    def _encode_path(self, settings, suffix=''):
         data_string = ','.join(
             ['{}="{}"'.format(k, v) for k, v in settings.iteritems()])
-        stream_name = '/{base_string}/{suffix}'.format(
+        return '/{base_string}/{suffix}'.format(
             base_string=urllib.quote(base64.b64encode(data_string)),
             suffix=suffix,
         )
-        return urlparse.urljoin(base_url, stream_name)
 
-    def get_stream_url(self):
-        settings = {
+    def get_stream_settings(self, group=None):
+        if group:
+            # All members of a group using the same encoder settings are
+            # served by the same stream.
+            command = ' '.join(self.codec.encoder.command)
+            return {
+                'type': 'group',
+                'name': group,
+                'encoder': hashlib.md5(
+                    command.encode('utf-8')).hexdigest()[:8],
+            }
+        return {
             'type': 'bridge',
             'udn': self.udn,
         }
+
+    def get_stream_url(self, group=None):
+        settings = self.get_stream_settings(group)
         return self._encode_settings(settings, 'stream.' + self.codec.suffix)
 
+    def get_stream_path(self, group=None):
+        settings = self.get_stream_settings(group)
+        return self._encode_path(settings, 'stream.' + self.codec.suffix)
+
     def get_image_url(self, name='default.png'):
         settings = {
             'type': 'image',
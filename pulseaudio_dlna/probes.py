@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import logging
+
+import pulseaudio_dlna.buffers
+
+logger = logging.getLogger('pulseaudio_dlna.probes')
+
+
+def is_enabled():
+    return ProbeCache.PROBE_MSEC > 0
+
+
+def get_key(codec, encoder):
+    # Snapshots are only valid for the codec and bit rate they were taken
+    # with.
+    return codec.IDENTIFIER, getattr(encoder, 'bit_rate', None)
+
+
+def create_snapshot(key, framing, header, data):
+    # Returns a snapshot of the stream header followed by PROBE_MSEC of
+    # silence, None if data does not tell how silence is encoded yet. The
+    # header of a new pipeline has to be the same, otherwise the stream of
+    # a client which got the snapshot cannot be continued.
+    if not framing.STATIC_HEADER:
+        return None
+    body = b''
+    if framing.SILENT_FRAMES:
+        silent_frame = framing.silent_frame(data)
+        if silent_frame is None:
+            return None
+        frame, duration = silent_frame
+        body = frame * int(ProbeCache.PROBE_MSEC / 1000.0 / duration + 1)
+    if not header and not body:
+        return None
+    return ProbeSnapshot(key, header, body)
+
+
+class ProbeSnapshot(object):
+
+    def __init__(self, key, header, body):
+        self.key = key
+        self.header = header
+        self.body = body
+
+    @property
+    def data(self):
+        return self.header + self.body
+
+    def create_buffer(self):
+        buffer = pulseaudio_dlna.buffers.RingBuffer(len(self.data))
+        buffer.write(self.data)
+        return buffer
+
+    def __str__(self):
+        return '<{} key="{}" header="{}" body="{}">'.format(
+            self.__class__.__name__,
+            self.key,
+            len(self.header),
+            len(self.body),
+        )
+
+
+class ProbeCache(object):
+
+    # Many renderers probe a stream with a short GET request before they
+    # really play it. As long as no pipeline runs for a path, new streams
+    # get a snapshot of the last pipeline's header and silence first. The
+    # pipeline is only started if the client is still connected after
+    # PROBE_MSEC, probes which disconnected before did not cost anything.
+
+    PROBE_MSEC = 500
+
+    def __init__(self):
+        self.snapshots = {}
+        self.probe_count = 0
+        self.avoided_count = 0
+
+    def store(self, path, snapshot):
+        if snapshot is not None:
+            self.snapshots[path] = snapshot
+
+    def get(self, path, codec):
+        if not is_enabled():
+            return None
+        snapshot = self.snapshots.get(path, None)
+        if snapshot is None or \
+           snapshot.key != get_key(codec, codec.encoder):
+            return None
+        return snapshot
+
+    def __str__(self):
+        return '<{} probe_msec="{}" snapshots="{}">'.format(
+            self.__class__.__name__,
+            self.PROBE_MSEC,
+            len(self.snapshots),
+        )
@@ -38,6 +38,7 @@ import pulseaudio_dlna.plugins.renderer
 import pulseaudio_dlna.notification
 import pulseaudio_dlna.utils.encoding
 import pulseaudio_dlna.covermodes
+import pulseaudio_dlna.handoff
 
 logger = logging.getLogger('pulseaudio_dlna.pulseaudio')
 
@@ -45,19 +46,41 @@ MODULE_DBUS_PROTOCOL = 'module-dbus-protocol'
 MODULE_NULL_SINK = 'module-null-sink'
 
 
+class InvalidGroupException(Exception):
+    def __init__(self, group):
+        Exception.__init__(
+            self,
+            'You specified an invalid group "{}"! Use '
+            '"<name>=<device>,<device>".'.format(group)
+        )
+
+
 class PulseAudio(object):
     def __init__(self):
-        self.streams = []
-        self.sinks = []
+        # The streams and sinks are kept by their object path, so signals
+        # only have to update the objects they name.
+        self.stream_objects = collections.OrderedDict()
+        self.sink_objects = collections.OrderedDict()
 
         self.fallback_sink = None
         self.system_sinks = []
 
+    @property
+    def streams(self):
+        return self.stream_objects.values()
+
+    @property
+    def sinks(self):
+        return self.sink_objects.values()
+
     def _connect(self, signals):
         self.bus = self._get_bus()
         self.core = self.bus.get_object(object_path='/org/pulseaudio/core1')
-        for sig_name, interface, sig_handler in signals:
-            self.bus.add_signal_receiver(sig_handler, sig_name)
+        # The path keyword passes the object path the signal was emitted
+        # for to the handler, if the signal does not contain it itself.
+        for sig_name, interface, sig_handler, path_keyword in signals:
+            self.bus.add_signal_receiver(
+                sig_handler, sig_name, path_keyword=path_keyword)
             self.core.ListenForSignal(
                 interface.format(sig_name), dbus.Array(signature='o'))
 
@@ -178,10 +201,10 @@ class PulseAudio(object):
 
         if retry_on_fail(self.update_playback_streams) and \
            retry_on_fail(self.update_sinks):
+            for sink in self.sinks:
+                sink.streams = []
             for stream in self.streams:
-                for sink in self.sinks:
-                    if sink.object_path == stream.device:
-                        sink.streams.append(stream)
+                self._link_stream(stream)
         else:
             logger.error(
                 'Could not update sinks and streams. This normally indicates '
@@ -194,31 +217,88 @@ class PulseAudio(object):
                 'org.PulseAudio.Core1', 'PlaybackStreams',
                 dbus_interface='org.freedesktop.DBus.Properties')
 
-            self.streams = []
+            streams = collections.OrderedDict()
             for stream_path in stream_paths:
                 stream = PulseStreamFactory.new(self.bus, stream_path)
                 if stream:
-                    self.streams.append(stream)
+                    streams[stream.object_path] = stream
+            self.stream_objects = streams
             return True
         except dbus.exceptions.DBusException:
             return False
 
     def update_sinks(self):
+        # Sinks do not change, so only the ones which are not known yet are
+        # read.
         try:
             sink_paths = self.core.Get(
                 'org.PulseAudio.Core1', 'Sinks',
                 dbus_interface='org.freedesktop.DBus.Properties')
 
-            self.sinks = []
+            sinks = collections.OrderedDict()
             for sink_path in sink_paths:
-                sink = PulseSinkFactory.new(self.bus, sink_path)
+                sink = self.sink_objects.get(unicode(sink_path), None)
+                if sink is None:
+                    sink = self._create_sink(sink_path)
                 if sink:
-                    sink.fallback_sink = self.fallback_sink
-                    self.sinks.append(sink)
+                    sinks[sink.object_path] = sink
+            self.sink_objects = sinks
             return True
         except dbus.exceptions.DBusException:
             return False
 
+    def _create_sink(self, sink_path):
+        sink = PulseSinkFactory.new(self.bus, sink_path)
+        if sink:
+            sink.fallback_sink = self.fallback_sink
+        return sink
+
+    def _link_stream(self, stream):
+        sink = self.sink_objects.get(stream.device, None)
+        if sink and stream not in sink.streams:
+            sink.streams.append(stream)
+        return sink
+
+    def _unlink_stream(self, stream, sink_path):
+        sink = self.sink_objects.get(sink_path, None)
+        if sink and stream in sink.streams:
+            sink.streams.remove(stream)
+        return sink
+
+    def update_playback_stream(self, stream_path):
+        # Reads a single stream again and links it to its current sink.
+        # Returns None if the stream does not exist anymore.
+        stream_path = unicode(stream_path)
+        known_stream = self.stream_objects.get(stream_path, None)
+        sink_path = known_stream.device if known_stream else None
+        stream = PulseStreamFactory.new(self.bus, stream_path)
+        if stream is None:
+            self.remove_playback_stream(stream_path)
+            return None
+        if sink_path is not None:
+            self._unlink_stream(stream, sink_path)
+        self.stream_objects[stream_path] = stream
+        self._link_stream(stream)
+        return stream
+
+    def remove_playback_stream(self, stream_path):
+        # Returns the sink the stream was playing on, if it was known.
+        stream = self.stream_objects.pop(unicode(stream_path), None)
+        if stream is None:
+            return None
+        return self._unlink_stream(stream, stream.device)
+
+    def update_sink(self, sink_path):
+        sink = self.sink_objects.get(unicode(sink_path), None)
+        if sink is None:
+            sink = self._create_sink(sink_path)
+            if sink:
+                self.sink_objects[sink.object_path] = sink
+        return sink
+
+    def remove_sink(self, sink_path):
+        return self.sink_objects.pop(unicode(sink_path), None)
+
     def dbus_server_lookup(self):
         try:
             lookup_object = dbus.SessionBus().get_object(
@@ -555,10 +635,54 @@ class PulseStream(object):
                )
 
 
+class PulseGroup(object):
+
+    # Several devices playing the same null sink. The sink is recorded once
+    # and all members using the same codec share a single encoder.
+
+    def __init__(self, name, device_names):
+        self.name = name
+        self.device_names = device_names
+        self.short_name = '{filtered_name}_group'.format(
+            filtered_name=re.sub(r'[^a-z0-9]', '', name.lower()))
+        self.sink = None
+
+    @classmethod
+    def from_string(cls, group_string):
+        name, separator, devices = group_string.partition('=')
+        device_names = [
+            device_name.strip() for device_name in devices.split(',')
+            if device_name.strip()]
+        if not separator or not name.strip() or not device_names:
+            raise InvalidGroupException(group_string)
+        return cls(name.strip(), device_names)
+
+    def accepts(self, device):
+        return device.name in self.device_names
+
+    def __str__(self):
+        return '<PulseGroup name="{}" devices="{}">'.format(
+            self.name, ','.join(self.device_names))
+
+
 class PulseBridge(object):
-    def __init__(self, sink, device):
+    def __init__(self, sink, device, group=None):
         self.sink = sink
         self.device = device
+        self.group = group
+
+    @property
+    def group_name(self):
+        return self.group.short_name if self.group else None
+
+    def get_stream_settings(self):
+        return self.device.get_stream_settings(self.group_name)
+
+    def get_stream_url(self):
+        return self.device.get_stream_url(self.group_name)
+
+    def get_stream_path(self):
+        return self.device.get_stream_path(self.group_name)
 
     def __cmp__(self, other):
         if isinstance(other, PulseBridge):
@@ -568,7 +692,34 @@ class PulseBridge(object):
             return self.device == other
 
     def __str__(self):
-        return '<Bridge>\n    {}\n    {}\n'.format(self.sink, self.device)
+        return '<Bridge>\n    {}\n    {}\n{}'.format(
+            self.sink, self.device,
+            '    {}\n'.format(self.group) if self.group else '')
+
+
+class PulseHandoffBridge(PulseBridge):
+
+    # Plays the stream of another bridge on a different device. The stream
+    # keeps its path, so the recorder and encoder which are already running
+    # serve the new device as well.
+
+    def __init__(self, source, device):
+        PulseBridge.__init__(self, source.sink, device, source.group)
+        self.source = source
+
+    def get_stream_settings(self):
+        return self.source.get_stream_settings()
+
+    def get_stream_url(self):
+        return self.source.get_stream_url()
+
+    def get_stream_path(self):
+        return self.source.get_stream_path()
+
+    def __str__(self):
+        return '<HandoffBridge>\n    {}\n    {}\n    from {}\n{}'.format(
+            self.sink, self.device, self.source.device,
+            '    {}\n'.format(self.group) if self.group else '')
 
 
 class PulseWatcher(PulseAudio):
@@ -577,10 +728,12 @@ class PulseWatcher(PulseAudio):
 
     def __init__(self, pulse_queue, stream_queue, disable_switchback=False,
                  disable_device_stop=False, disable_auto_reconnect=True,
-                 cover_mode='application', proc_title=None):
+                 cover_mode='application', groups=None, proc_title=None):
         PulseAudio.__init__(self)
 
         self.bridges = []
+        self.handoffs = {}
+        self.groups = groups or []
         self.pulse_queue = pulse_queue
         self.stream_queue = stream_queue
         self.blocked_devices = []
@@ -608,13 +761,17 @@ class PulseWatcher(PulseAudio):
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         signals = (
             ('NewPlaybackStream', 'org.PulseAudio.Core1.{}',
-                self.on_new_playback_stream),
+                self.on_new_playback_stream, None),
             ('PlaybackStreamRemoved', 'org.PulseAudio.Core1.{}',
-                self.on_playback_stream_removed),
+                self.on_playback_stream_removed, None),
+            ('NewSink', 'org.PulseAudio.Core1.{}',
+                self.on_new_sink, None),
+            ('SinkRemoved', 'org.PulseAudio.Core1.{}',
+                self.on_sink_removed, None),
             ('FallbackSinkUpdated', 'org.PulseAudio.Core1.{}',
-                self.on_fallback_sink_updated),
+                self.on_fallback_sink_updated, None),
             ('DeviceUpdated', 'org.PulseAudio.Core1.Stream.{}',
-                self.on_device_updated),
+                self.on_device_updated, 'stream_path'),
         )
         self._connect(signals)
         self.update()
@@ -653,13 +810,123 @@ class PulseWatcher(PulseAudio):
     def share_bridges(self):
         self.stream_queue.put({
             'type': 'update_bridges',
-            'bridges': self.bridges,
+            'bridges': self.bridges + self.handoffs.values(),
+        })
+
+    def _get_active_bridges(self):
+        # A bridge whose stream was handed to another device is replaced by
+        # the handoff bridge, the other device's own bridge is left alone
+        # meanwhile.
+        targets = [handoff.device for handoff in self.handoffs.values()]
+        bridges = []
+        for bridge in self.bridges:
+            handoff = self.handoffs.get(bridge.device.udn, None)
+            if handoff:
+                bridges.append(handoff)
+            elif bridge.device not in targets:
+                bridges.append(bridge)
+        return bridges
+
+    def _was_handed_off(self, stopped_bridge):
+        # Whether another device took over the stream the stopped device
+        # was playing.
+        origin = getattr(stopped_bridge, 'source', stopped_bridge)
+        current = self.handoffs.get(origin.device.udn, origin)
+        return not current.device == stopped_bridge.device
+
+    def _end_handoff(self, bridge):
+        origin = getattr(bridge, 'source', bridge)
+        if self.handoffs.get(origin.device.udn, None) is bridge:
+            logger.info('The device "{}" stopped playing the stream of "{}", '
+                        'the handoff ended.'.format(
+                            bridge.device.label, origin.device.label))
+            del self.handoffs[origin.device.udn]
+            self.share_bridges()
+
+    def handoff(self, source, target):
+        self.thread_pool.submit(self._handoff, source, target)
+
+    def _handoff(self, source, target):
+        # Moves the stream the source device is playing to the target
+        # device. The recorder and encoder keep running, the target gets
+        # the url of the running stream and the source is stopped only
+        # after the target started playing.
+        try:
+            source_bridge = pulseaudio_dlna.handoff.find_bridge(
+                self._get_active_bridges(), source)
+            target_bridge = pulseaudio_dlna.handoff.find_bridge(
+                self.bridges, target)
+            pulseaudio_dlna.handoff.check(source_bridge, target_bridge)
+            if source_bridge.device.state != source_bridge.device.\
+                    STATE_PLAYING:
+                raise pulseaudio_dlna.handoff.DeviceNotPlayingException(
+                    source_bridge.device)
+            if target_bridge.device.state == target_bridge.device.\
+                    STATE_PLAYING:
+                raise pulseaudio_dlna.handoff.DevicePlayingException(
+                    target_bridge.device)
+        except pulseaudio_dlna.handoff.HandoffException as e:
+            logger.error('Could not hand the stream over! ({})'.format(e))
+            return False
+
+        origin = getattr(source_bridge, 'source', source_bridge)
+        if target_bridge.device == origin.device:
+            bridge = origin
+        else:
+            bridge = PulseHandoffBridge(origin, target_bridge.device)
+        logger.info(
+            'Handing the stream of "{source}" over to "{target}" ...'.format(
+                source=source_bridge.device.label,
+                target=bridge.device.label))
+
+        # The stream server has to know the new device before it connects.
+        previous = self.handoffs.pop(origin.device.udn, None)
+        if bridge is not origin:
+            self.handoffs[origin.device.udn] = bridge
+        self.share_bridges()
+
+        artist, title, thumb = self.cover_mode.get(bridge)
+        return_code, message = bridge.device.play(
+            url=bridge.get_stream_url(),
+            artist=artist, title=title, thumb=thumb)
+        if return_code != 200:
+            logger.error(
+                'The device "{}" failed to play! ({}) - {}'.format(
+                    bridge.device.label, return_code,
+                    message or 'Unknown reason.'))
+            self.handoffs.pop(origin.device.udn, None)
+            if previous:
+                self.handoffs[origin.device.udn] = previous
+            self.share_bridges()
+            return False
+        logger.info('The device "{}" is playing.'.format(bridge.device.label))
+
+        return_code, message = source_bridge.device.stop()
+        if return_code == 200:
+            logger.info('The device "{}" was stopped.'.format(
+                source_bridge.device.label))
+        else:
+            logger.error(
+                'The device "{}" failed to stop! ({}) - {}'.format(
+                    source_bridge.device.label, return_code,
+                    message or 'Unknown reason.'))
+        return False
+
+    def prespawn_bridge(self, bridge):
+        self.stream_queue.put({
+            'type': 'prespawn',
+            'path': bridge.get_stream_path(),
+            'bridge': bridge,
         })
 
     def cleanup(self):
+        removed_sinks = []
         for bridge in self.bridges:
+            if bridge.sink in removed_sinks:
+                continue
             logger.info('Remove "{}" sink ...'.format(bridge.sink.name))
             self.delete_null_sink(bridge.sink.module.index)
+            removed_sinks.append(bridge.sink)
         self.bridges = []
         sys.exit(0)
 
@@ -698,10 +965,9 @@ class PulseWatcher(PulseAudio):
 
     def on_bridge_disconnected(self, stopped_bridge):
 
-        for sink in self.sinks:
-            if sink == stopped_bridge.sink:
-                stopped_bridge.sink = sink
-                break
+        sink = self.sink_objects.get(stopped_bridge.sink.object_path, None)
+        if sink:
+            stopped_bridge.sink = sink
         for bridge in self.bridges:
             if bridge.device == stopped_bridge.device:
                 stopped_bridge.device = bridge.device
@@ -710,6 +976,20 @@ class PulseWatcher(PulseAudio):
         stopped_bridge.device.state = \
             pulseaudio_dlna.plugins.renderer.BaseRenderer.STATE_STOPPED
 
+        if self._was_handed_off(stopped_bridge):
+            # Another device is playing the stream now.
+            return
+        if self.disable_auto_reconnect:
+            for handoff in self.handoffs.values():
+                if handoff.device == stopped_bridge.device:
+                    self._end_handoff(handoff)
+
+        if stopped_bridge.group:
+            # The other members are still playing the group's sink.
+            if not self.disable_auto_reconnect:
+                self._handle_sink_update(stopped_bridge.sink.object_path)
+            return
+
         reason = 'The device disconnected'
         if len(stopped_bridge.sink.streams) > 1:
             if not self.disable_auto_reconnect:
@@ -726,35 +1006,41 @@ class PulseWatcher(PulseAudio):
         elif len(stopped_bridge.sink.streams) == 0:
             pass
 
-    def on_device_updated(self, sink_path):
-        logger.info('on_device_updated "{path}"'.format(
-            path=sink_path))
-        self.update()
+    def on_device_updated(self, sink_path, stream_path=None):
+        logger.info('on_device_updated "{path}" ({stream_path})'.format(
+            path=sink_path, stream_path=stream_path))
+        # The stream moved to another sink, the sink it left is handled
+        # along with all other bridges.
+        if stream_path:
+            self.update_playback_stream(stream_path)
+        else:
+            self.update()
         self._delayed_handle_sink_update(sink_path)
 
     def on_fallback_sink_updated(self, sink_path):
-        self.default_sink = PulseSinkFactory.new(self.bus, sink_path)
-        self.update()
+        self.default_sink = self.update_sink(sink_path)
+
+    def on_new_sink(self, sink_path):
+        logger.info('on_new_sink "{path}"'.format(path=sink_path))
+        self.update_sink(sink_path)
+
+    def on_sink_removed(self, sink_path):
+        logger.info('on_sink_removed "{path}"'.format(path=sink_path))
+        self.remove_sink(sink_path)
 
     def on_new_playback_stream(self, stream_path):
         logger.info('on_new_playback_stream "{path}"'.format(
             path=stream_path))
-        self.update()
-        for sink in self.sinks:
-            for stream in sink.streams:
-                if stream.object_path == stream_path:
-                    self._delayed_handle_sink_update(sink.object_path)
-                    return
+        stream = self.update_playback_stream(stream_path)
+        if stream and stream.device in self.sink_objects:
+            self._delayed_handle_sink_update(stream.device)
 
     def on_playback_stream_removed(self, stream_path):
         logger.info('on_playback_stream_removed "{path}"'.format(
             path=stream_path))
-        for sink in self.sinks:
-            for stream in sink.streams:
-                if stream.object_path == stream_path:
-                    self.update()
-                    self._delayed_handle_sink_update(sink.object_path)
-                    return
+        sink = self.remove_playback_stream(stream_path)
+        if sink:
+            self._delayed_handle_sink_update(sink.object_path)
 
     def _delayed_handle_sink_update(self, sink_path):
         if self.signal_timers.get(sink_path, None):
@@ -785,7 +1071,8 @@ class PulseWatcher(PulseAudio):
             logger.info('{sink_path} was blocked!'.format(sink_path=sink_path))
             return
 
-        for bridge in self.bridges:
+        bridges_to_play = []
+        for bridge in self._get_active_bridges():
             logger.debug('\n{}'.format(bridge))
             if bridge.device.state == bridge.device.STATE_PLAYING:
                 if len(bridge.sink.streams) == 0 and (
@@ -799,6 +1086,7 @@ class PulseWatcher(PulseAudio):
                         logger.info(
                             'The device "{}" was stopped.'.format(
                                 bridge.device.label))
+                        self._end_handoff(bridge)
                     else:
                         if not message:
                             message = 'Unknown reason.'
@@ -812,31 +1100,80 @@ class PulseWatcher(PulseAudio):
             if bridge.sink.object_path == sink_path:
                 if bridge.device.state == bridge.device.STATE_STOPPED or \
                    bridge.device.state == bridge.device.STATE_PAUSED:
-                    logger.info(
-                        'Instructing the device "{}" to play ...'.format(
-                            bridge.device.label))
-                    artist, title, thumb = self.cover_mode.get(bridge)
-                    return_code, message = bridge.device.play(
-                        artist=artist, title=title, thumb=thumb)
-                    if return_code == 200:
-                        logger.info(
-                            'The device "{}" is playing.'.format(
-                                bridge.device.label))
-                    else:
-                        if not message:
-                            message = 'Unknown reason.'
-                        logger.error(
-                            'The device "{}" failed to play! ({}) - {}'.format(
-                                bridge.device.label,
-                                return_code,
-                                message))
-                        self.switch_back(bridge, message)
+                    bridges_to_play.append(bridge)
+        if bridges_to_play:
+            self._play_bridges(bridges_to_play)
         return False
 
+    def _play_bridges(self, bridges):
+        # The members of a group are instructed at the same time, so they
+        # start playing as close together as possible.
+        stream_paths = []
+        play_commands = []
+        for bridge in bridges:
+            logger.info(
+                'Instructing the device "{}" to play ...'.format(
+                    bridge.device.label))
+            stream_path = bridge.get_stream_path()
+            if stream_path not in stream_paths:
+                self.prespawn_bridge(bridge)
+                stream_paths.append(stream_path)
+            artist, title, thumb = self.cover_mode.get(bridge)
+            play_commands.append(functools.partial(
+                self._play_bridge, bridge,
+                artist=artist, title=title, thumb=thumb))
+        if len(play_commands) == 1:
+            play_commands[0]()
+            return
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(play_commands))
+        try:
+            futures = [executor.submit(command) for command in play_commands]
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(wait=False)
+
+    def _play_bridge(self, bridge, artist=None, title=None, thumb=None):
+        return_code, message = bridge.device.play(
+            url=bridge.get_stream_url(),
+            artist=artist, title=title, thumb=thumb)
+        if return_code == 200:
+            logger.info(
+                'The device "{}" is playing.'.format(
+                    bridge.device.label))
+        else:
+            if not message:
+                message = 'Unknown reason.'
+            logger.error(
+                'The device "{}" failed to play! ({}) - {}'.format(
+                    bridge.device.label,
+                    return_code,
+                    message))
+            # A single member must not take the sink away from the others.
+            if not bridge.group:
+                self.switch_back(bridge, message)
+
+    def _get_group(self, device):
+        for group in self.groups:
+            if group.accepts(device):
+                return group
+        return None
+
     def add_device(self, device):
-        sink = self.create_null_sink(
-            device.short_name, device.label)
-        self.bridges.append(PulseBridge(sink, device))
+        group = self._get_group(device)
+        if group:
+            if group.sink is None:
+                group.sink = self.create_null_sink(
+                    group.short_name, group.name)
+            self.bridges.append(PulseBridge(group.sink, device, group))
+            logger.info(
+                'The device "{name}" joined the group "{group}".'.format(
+                    name=device.name, group=group.name))
+        else:
+            sink = self.create_null_sink(
+                device.short_name, device.label)
+            self.bridges.append(PulseBridge(sink, device))
         self.update()
         self.share_bridges()
         logger.info('Added the device "{name} ({flavour})".'.format(
@@ -846,12 +1183,20 @@ class PulseWatcher(PulseAudio):
         bridge_index_to_remove = None
         for index, bridge in enumerate(self.bridges):
             if bridge.device == device:
-                logger.info('Remove "{}" sink ...'.format(bridge.sink.name))
                 bridge_index_to_remove = index
-                self.delete_null_sink(bridge.sink.module.index)
                 break
         if bridge_index_to_remove is not None:
-            self.bridges.pop(bridge_index_to_remove)
+            bridge = self.bridges.pop(bridge_index_to_remove)
+            for udn, handoff in self.handoffs.items():
+                if udn == device.udn or handoff.device == device:
+                    del self.handoffs[udn]
+            # The sink of a group is kept as long as it has members.
+            if not bridge.group or not any(
+                    other.group is bridge.group for other in self.bridges):
+                logger.info('Remove "{}" sink ...'.format(bridge.sink.name))
+                self.delete_null_sink(bridge.sink.module.index)
+                if bridge.group:
+                    bridge.group.sink = None
             self.update()
             self.share_bridges()
             logger.info('Removed the device "{name}".'.format(
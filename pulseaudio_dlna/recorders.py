@@ -17,24 +17,123 @@
 
 from __future__ import unicode_literals
 
+import threading
+import logging
+import errno
+import time
+import re
+import os
+
 import pulseaudio_dlna.codecs
+import pulseaudio_dlna.latency
+import pulseaudio_dlna.utils.libpulse
+
+logger = logging.getLogger('pulseaudio_dlna.recorders')
 
 
 class BaseRecorder(object):
-    def __init__(self):
+
+    # In process recorders do not have a command, their start() method
+    # writes the recorded PCM data to the encoder's stdin instead.
+    IN_PROCESS = False
+
+    def __init__(self, latency_profile=None):
         self._command = []
+        self._latency_profile = latency_profile or \
+            pulseaudio_dlna.latency.DefaultLatencyProfile()
 
     @property
     def command(self):
         return self._command
 
+    @property
+    def latency_profile(self):
+        return self._latency_profile
+
+    @property
+    def chunk_size(self):
+        return self.latency_profile.chunk_size
+
+    @property
+    def capture_key(self):
+        # Recorders with the same key record the same data and can be
+        # shared by several encoders.
+        return tuple(self.command)
+
+
+class RecorderMetrics(object):
+
+    # Collects the buffer metrics and the capture latency PulseAudio
+    # reports for a recorder.
+
+    BUFFER_METRICS_PATTERN = re.compile(
+        r'Buffer metrics: maxlength=(\d+), fragsize=(\d+)')
+    LATENCY_PATTERN = re.compile(r'Latency: (\d+) usec')
+
+    def __init__(self):
+        self.max_length = None
+        self.fragment_size = None
+        self.latency_usec = None
+
+    def parse(self, line):
+        match = self.LATENCY_PATTERN.search(line)
+        if match:
+            self.latency_usec = int(match.group(1))
+            return
+        match = self.BUFFER_METRICS_PATTERN.search(line)
+        if match:
+            self.max_length = int(match.group(1))
+            self.fragment_size = int(match.group(2))
+            logger.info(
+                'Recording with a fragment size of {fragment_size} bytes '
+                '(max length {max_length} bytes).'.format(
+                    fragment_size=self.fragment_size,
+                    max_length=self.max_length))
+
+    def watch(self, stream):
+        # Parses the verbose output of parec until it closes its stderr.
+        # The output has to be consumed anyway, otherwise parec would block.
+        thread = threading.Thread(target=self._watch, args=(stream, ))
+        thread.daemon = True
+        thread.start()
+
+    def _watch(self, stream):
+        data = b''
+        try:
+            while True:
+                chunk = os.read(stream.fileno(), 1024)
+                if len(chunk) == 0:
+                    break
+                lines = re.split(b'[\r\n]', data + chunk)
+                data = lines.pop()
+                for line in lines:
+                    self.parse(line)
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    def __str__(self):
+        return '<{} fragment_size="{}" max_length="{}" latency="{}">'.format(
+            self.__class__.__name__,
+            self.fragment_size,
+            self.max_length,
+            self.latency_usec,
+        )
+
 
 class PulseaudioRecorder(BaseRecorder):
-    def __init__(self, monitor, codec=None):
-        BaseRecorder.__init__(self)
+    def __init__(self, monitor, codec=None, latency_profile=None):
+        BaseRecorder.__init__(self, latency_profile)
         self._monitor = monitor
         self._codec = codec
-        self._command = ['parec', '--format=s16le']
+        self._command = ['parec', '--format=s16le', '-v']
+        if self.latency_profile.latency_msec:
+            self._command.append('--latency-msec={}'.format(
+                self.latency_profile.latency_msec))
+        if self.latency_profile.process_time_msec:
+            self._command.append('--process-time-msec={}'.format(
+                self.latency_profile.process_time_msec))
 
     @property
     def monitor(self):
@@ -63,3 +162,112 @@ class PulseaudioRecorder(BaseRecorder):
                 '-d', self.monitor,
                 '--file-format={}'.format(self.file_format),
             ]
+
+
+class LibpulseRecorder(BaseRecorder):
+
+    IN_PROCESS = True
+    RATE = pulseaudio_dlna.latency.SAMPLE_RATE
+    CHANNELS = 2
+    LATENCY_MSEC = 50
+    FRAGMENT_SIZE = None
+
+    def __init__(self, monitor, codec=None, latency_profile=None):
+        BaseRecorder.__init__(self, latency_profile)
+        self._monitor = monitor
+        self._codec = codec
+
+    @property
+    def monitor(self):
+        return self._monitor
+
+    @property
+    def codec(self):
+        return self._codec
+
+    @property
+    def latency_msec(self):
+        return self.latency_profile.latency_msec or self.LATENCY_MSEC
+
+    @property
+    def fragment_size(self):
+        # An explicit fragment size has precedence over the latency target.
+        if self.FRAGMENT_SIZE:
+            return self.FRAGMENT_SIZE
+        frame_size = self.CHANNELS * 2
+        frames = self.RATE * self.latency_msec // 1000
+        return max(frames, 1) * frame_size
+
+    @property
+    def capture_key(self):
+        return ('libpulse', self.monitor, self.fragment_size)
+
+    def start(self, output, metrics):
+        thread = LibpulseCaptureThread(self, output, metrics)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def __str__(self):
+        return 'libpulse:{}'.format(self.monitor)
+
+
+class LibpulseCaptureThread(threading.Thread):
+
+    # Provides poll() like subprocess.Popen, so the stream server can check
+    # the capture like a recorder process.
+
+    LATENCY_INTERVAL = 1
+
+    def __init__(self, recorder, output, metrics, *args, **kwargs):
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.recorder = recorder
+        self.output = output
+        self.metrics = metrics
+        self.stop_event = threading.Event()
+        self.stream = pulseaudio_dlna.utils.libpulse.SimpleRecordStream(
+            device=recorder.monitor,
+            name='pulseaudio-dlna',
+            stream_name='{} capture'.format(recorder.monitor),
+            rate=recorder.RATE,
+            channels=recorder.CHANNELS,
+            fragment_size=recorder.fragment_size,
+        )
+
+    def poll(self):
+        return None if self.is_alive() else 0
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(1)
+
+    def run(self):
+        fragment_size = self.recorder.fragment_size
+        self.metrics.fragment_size = fragment_size
+        last_update = 0
+        try:
+            while not self.stop_event.isSet():
+                self.output.write(self.stream.read(fragment_size))
+                self.output.flush()
+                now = time.time()
+                if now - last_update >= self.LATENCY_INTERVAL:
+                    self.metrics.latency_usec = self.stream.latency
+                    last_update = now
+        except pulseaudio_dlna.utils.libpulse.LibpulseException as e:
+            logger.error(e)
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPIPE:
+                logger.error(
+                    'Could not write to the encoder ({}).'.format(e))
+        finally:
+            self.stream.free()
+            try:
+                self.output.close()
+            except (IOError, OSError):
+                pass
+
+
+RECORDERS = {
+    'parec': PulseaudioRecorder,
+    'libpulse': LibpulseRecorder,
+}
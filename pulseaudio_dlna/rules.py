@@ -74,6 +74,14 @@ class FAKE_HTTP_CONTENT_LENGTH(BaseRule):
     pass
 
 
+class CHUNKED_TRANSFER_ENCODING(BaseRule):
+    pass
+
+
+class HTTP_CONNECTION_CLOSE(BaseRule):
+    pass
+
+
 class DISABLE_DEVICE_STOP(BaseRule):
     pass
 
@@ -95,6 +103,16 @@ class REQUEST_TIMEOUT(BaseRule):
             self.__class__.__name__, self.timeout)
 
 
+class PACED_SENDING(BaseRule):
+    def __init__(self, burst_msec=None, lead_msec=None):
+        self.burst_msec = int(burst_msec or 2000)
+        self.lead_msec = int(lead_msec or 200)
+
+    def __str__(self):
+        return '{} (burst_msec="{}",lead_msec="{}")'.format(
+            self.__class__.__name__, self.burst_msec, self.lead_msec)
+
+
 # class EXAMPLE_PROPERTIES_RULE(BaseRule):
 #     def __init__(self, prop1=None, prop2=None):
 #         self.prop1 = prop1 or 'abc'
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import threading
+import logging
+import audioop
+
+import pulseaudio_dlna.latency
+
+logger = logging.getLogger('pulseaudio_dlna.silence')
+
+
+class SilenceDetector(object):
+
+    # Measures for how long the recorded PCM has been silent. Every chunk
+    # the recorder delivers is one window, a chunk whose RMS exceeds the
+    # threshold ends the silence right away.
+
+    THRESHOLD = 16
+    SILENCE_MSEC = 0
+
+    def __init__(self):
+        self.silent_bytes = 0
+
+    def feed(self, data):
+        if audioop.rms(data, 2) > self.THRESHOLD:
+            self.silent_bytes = 0
+        else:
+            self.silent_bytes += len(data)
+
+    @property
+    def silent_msec(self):
+        return self.silent_bytes * 1000 // (
+            pulseaudio_dlna.latency.SAMPLE_RATE *
+            pulseaudio_dlna.latency.FRAME_SIZE)
+
+    @property
+    def is_silent(self):
+        return self.silent_bytes > 0 and \
+            self.silent_msec >= self.SILENCE_MSEC
+
+
+def is_enabled():
+    return SilenceDetector.SILENCE_MSEC > 0
+
+
+class SilenceGate(object):
+
+    # Sits between a capture and the encoder of a pipeline. Once the
+    # recording was silent for long enough, the encoder is stopped and
+    # silent frames of the codec are written to the pipeline's output
+    # instead, paced by the recorded PCM. As soon as audio returns, a new
+    # encoder is started and gets the recording again.
+
+    def __init__(self, pipeline, framing):
+        self.pipeline = pipeline
+        self.framing = framing
+        self.detector = SilenceDetector()
+        self.output = None
+        self.frame = None
+        self.frame_bytes = None
+        self.owed_bytes = 0
+        self.pause_count = 0
+        self.is_paused = False
+        self.is_stopped = False
+        self.lock = threading.Lock()
+
+    def start(self, output):
+        self.output = output
+
+    def learn(self, data):
+        # The silent frame is derived from the encoded data, so it has the
+        # same parameters as the frames of the encoder.
+        if self.frame is not None:
+            return
+        silent_frame = self.framing.silent_frame(data)
+        if silent_frame:
+            self.frame, duration = silent_frame
+            self.frame_bytes = (
+                duration * pulseaudio_dlna.latency.SAMPLE_RATE *
+                pulseaudio_dlna.latency.FRAME_SIZE)
+
+    def write(self, data):
+        self.detector.feed(data)
+        with self.lock:
+            if self.is_stopped:
+                return
+            if self.is_paused:
+                if self.detector.is_silent:
+                    self._write_frames(len(data))
+                    return
+                self._resume()
+            elif self.detector.is_silent and self.frame is not None:
+                self._pause()
+                self._write_frames(len(data))
+                return
+            output = self.output
+        if output is not None:
+            output.write(data)
+
+    def flush(self):
+        output = self.output
+        if output is not None:
+            output.flush()
+
+    def close(self):
+        with self.lock:
+            output, self.output = self.output, None
+        if output is not None:
+            output.close()
+
+    def stop(self):
+        # The gate must not touch the pipeline anymore afterwards.
+        with self.lock:
+            self.is_stopped = True
+
+    def _pause(self):
+        logger.info(
+            'Pausing the encoder of {path} after {msec} ms of '
+            'silence.'.format(
+                path=self.pipeline.path, msec=self.detector.silent_msec))
+        output, self.output = self.output, None
+        self.pipeline.stop_encoder(output)
+        self.is_paused = True
+        self.pause_count += 1
+        self.owed_bytes = 0
+
+    def _resume(self):
+        logger.info('Audio returned, resuming the encoder of {path}.'.format(
+            path=self.pipeline.path))
+        self.is_paused = False
+        try:
+            self.output = self.pipeline.start_encoder()
+        except OSError as e:
+            # The pipeline does not respond anymore and gets restarted.
+            logger.error('Could not resume the encoder ({}).'.format(e))
+
+    def _write_frames(self, length):
+        self.owed_bytes += length
+        count = int(self.owed_bytes // self.frame_bytes)
+        if count > 0:
+            self.owed_bytes -= count * self.frame_bytes
+            self.pipeline.write_output(self.frame * count)
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import sys
+import inspect
+import logging
+import socket
+import struct
+import fcntl
+import termios
+
+import pulseaudio_dlna.latency
+
+logger = logging.getLogger('pulseaudio_dlna.sockets')
+
+# Python 2 does not know all Linux socket options by name.
+TCP_NOTSENT_LOWAT = getattr(socket, 'TCP_NOTSENT_LOWAT', 25)
+# SIOCOUTQ shares its value with TIOCOUTQ.
+SIOCOUTQ = termios.TIOCOUTQ
+
+MIN_SEND_BUFFER_SIZE = 1024 * 4
+
+PROFILES = {}
+
+
+class UnknownSocketProfileException(Exception):
+    def __init__(self, profile):
+        Exception.__init__(
+            self,
+            'You specified an unknown socket profile "{}"!'.format(profile)
+        )
+
+
+def validate(profile):
+    if profile not in PROFILES:
+        raise UnknownSocketProfileException(profile)
+
+
+def get_profile(profile):
+    validate(profile)
+    return PROFILES[profile]()
+
+
+def get_byte_rate(codec):
+    # Codecs without a fixed bit rate never need more than the PCM rate.
+    bit_rate = getattr(codec.encoder, 'bit_rate', None)
+    if bit_rate:
+        return int(bit_rate) * 1000 // 8
+    return pulseaudio_dlna.latency.SAMPLE_RATE * \
+        pulseaudio_dlna.latency.FRAME_SIZE
+
+
+def get_queued_bytes(sock):
+    # Bytes in the send queue of the socket which the client did not
+    # acknowledge yet, None if the kernel does not tell.
+    try:
+        data = fcntl.ioctl(sock.fileno(), SIOCOUTQ, struct.pack(b'I', 0))
+        return struct.unpack(b'I', data)[0]
+    except (IOError, socket.error):
+        return None
+
+
+class BaseSocketProfile(object):
+
+    IDENTIFIER = None
+    SEND_BUFFER_MSEC = None
+    NOTSENT_LOWAT_MSEC = None
+    NODELAY = False
+    KEEPALIVE = False
+    KEEPALIVE_IDLE = 10
+    KEEPALIVE_INTERVAL = 5
+    KEEPALIVE_COUNT = 3
+
+    def get_options(self, byte_rate):
+        # The buffer sizes are given in milliseconds of the stream, so they
+        # hold the same amount of audio for every bit rate.
+        options = []
+        if self.SEND_BUFFER_MSEC:
+            size = max(byte_rate * self.SEND_BUFFER_MSEC // 1000,
+                       MIN_SEND_BUFFER_SIZE)
+            options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, size))
+        if self.NOTSENT_LOWAT_MSEC:
+            size = max(byte_rate * self.NOTSENT_LOWAT_MSEC // 1000, 1)
+            options.append((socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, size))
+        if self.NODELAY:
+            options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+        if self.KEEPALIVE:
+            options += [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                 self.KEEPALIVE_IDLE),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                 self.KEEPALIVE_INTERVAL),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPCNT,
+                 self.KEEPALIVE_COUNT),
+            ]
+        return options
+
+    def apply(self, sock, byte_rate):
+        for level, option, value in self.get_options(byte_rate):
+            try:
+                sock.setsockopt(level, option, value)
+            except socket.error as e:
+                logger.warning(
+                    'Could not set the socket option {option} to {value} '
+                    '({error}).'.format(
+                        option=option, value=value, error=e))
+
+    def __str__(self):
+        return '<{} send_buffer="{}" notsent_lowat="{}" nodelay="{}" ' \
+               'keepalive="{}">'.format(
+                   self.__class__.__name__,
+                   self.SEND_BUFFER_MSEC,
+                   self.NOTSENT_LOWAT_MSEC,
+                   self.NODELAY,
+                   self.KEEPALIVE,
+               )
+
+
+class DefaultSocketProfile(BaseSocketProfile):
+
+    # The kernel defaults are kept.
+    IDENTIFIER = 'default'
+
+
+class LowLatencySocketProfile(BaseSocketProfile):
+
+    IDENTIFIER = 'low'
+    SEND_BUFFER_MSEC = 250
+    NOTSENT_LOWAT_MSEC = 50
+    NODELAY = True
+    KEEPALIVE = True
+
+
+class BalancedSocketProfile(BaseSocketProfile):
+
+    IDENTIFIER = 'balanced'
+    SEND_BUFFER_MSEC = 1000
+    NOTSENT_LOWAT_MSEC = 200
+    NODELAY = True
+    KEEPALIVE = True
+
+
+class RobustSocketProfile(BaseSocketProfile):
+
+    # For lossy networks, where a larger queue bridges retransmissions.
+    IDENTIFIER = 'robust'
+    SEND_BUFFER_MSEC = 3000
+    NOTSENT_LOWAT_MSEC = 500
+    KEEPALIVE = True
+    KEEPALIVE_IDLE = 30
+
+
+def load_profiles():
+    if len(PROFILES) == 0:
+        logger.debug('Loaded socket profiles:')
+        for name, _type in inspect.getmembers(sys.modules[__name__]):
+            if inspect.isclass(_type) and \
+               issubclass(_type, BaseSocketProfile):
+                if _type is not BaseSocketProfile:
+                    logger.debug('  {} = {}'.format(_type.IDENTIFIER, _type))
+                    PROFILES[_type.IDENTIFIER] = _type
+    return None
+
+load_profiles()
@@ -20,6 +20,7 @@ from __future__ import unicode_literals
 from gi.repository import GObject
 
 import re
+import errno
 import subprocess
 import setproctitle
 import logging
@@ -34,56 +35,419 @@ import signal
 import pkg_resources
 import BaseHTTPServer
 import SocketServer
-import Queue
+import StringIO
+import fcntl
+import termios
+import struct
 import threading
-
+import collections
+import time
+import email.utils
+import urlparse
+
+import pulseaudio_dlna.admission
+import pulseaudio_dlna.buffers
+import pulseaudio_dlna.capture
 import pulseaudio_dlna.encoders
 import pulseaudio_dlna.codecs
+import pulseaudio_dlna.framing
+import pulseaudio_dlna.handoff
 import pulseaudio_dlna.recorders
+import pulseaudio_dlna.pacing
+import pulseaudio_dlna.probes
 import pulseaudio_dlna.rules
+import pulseaudio_dlna.silence
+import pulseaudio_dlna.sockets
 import pulseaudio_dlna.images
+import pulseaudio_dlna.metrics
+import pulseaudio_dlna.utils.libpulse
+import pulseaudio_dlna.utils.splice
 
 logger = logging.getLogger('pulseaudio_dlna.streamserver')
 
 PROTOCOL_VERSION_V10 = 'HTTP/1.0'
 PROTOCOL_VERSION_V11 = 'HTTP/1.1'
 
+TRANSFER_MODE_CLOSE = 'close'
+TRANSFER_MODE_CHUNKED = 'chunked'
+TRANSFER_MODE_FAKE_LENGTH = 'fake-length'
 
-class ProcessQueue(Queue.Queue):
+# Streams have no length, clients which need one get 100 GB.
+FAKE_CONTENT_LENGTH = pow(1024, 3) * 100
 
-    def data(self):
-        data = self.get()
-        if not self.empty():
-            data = [data]
-            while not self.empty():
-                data.append(self.get())
-            data = b''.join(data)
-        return data
+# What happens to a stream whose client did not read anything for
+# ProcessStream.SEND_TIMEOUT_MSEC.
+EVICTION_SKIP = 'skip'
+EVICTION_DISCONNECT = 'disconnect'
 
+EVICTION_POLICIES = [EVICTION_SKIP, EVICTION_DISCONNECT]
 
-class ProcessThread(threading.Thread):
 
-    CHUNK_SIZE = 1024 * 32
+class RangeNotSatisfiableException(Exception):
+    def __init__(self, offset):
+        Exception.__init__(
+            self,
+            'The requested range starting at "{}" is not available!'.format(
+                offset)
+        )
 
-    def __init__(self, path, encoder, recorder, queue, *args, **kwargs):
-        threading.Thread.__init__(self, *args, **kwargs)
+
+class UnknownEvictionPolicyException(Exception):
+    def __init__(self, policy):
+        Exception.__init__(
+            self,
+            'You specified an unknown slow client policy "{}"!'.format(
+                policy)
+        )
+
+
+class UnknownStreamServerException(Exception):
+    def __init__(self, stream_server):
+        Exception.__init__(
+            self,
+            'You specified an unknown stream server "{}"!'.format(
+                stream_server)
+        )
+
+
+class ProcessPipeline(object):
+
+    ENCODER_EXIT_TIMEOUT = 1
+
+    def __init__(
+            self, path, encoder, recorder, share_capture=False,
+            framing=None):
         self.path = path
         self.encoder = encoder
         self.recorder = recorder
+        self.share_capture = share_capture
+        self.framing = framing
         self.recorder_process = None
         self.encoder_process = None
-        self.queue = queue
+        self.encoder_input = None
+        self.input_fd = None
+        self.output_fd = None
+        self.output_write_fd = None
+        self.capture = None
+        self.capture_output = None
+        self.silence_gate = None
+        self.metrics = None
 
-        self.reinitialize_count = 0
-        self.stop_event = threading.Event()
+    @property
+    def uses_silence_gate(self):
+        # The recording has to pass the application to detect silence, so
+        # these pipelines always use a capture.
+        return (pulseaudio_dlna.silence.is_enabled() and
+                self.framing is not None and self.framing.SILENT_FRAMES)
+
+    def start(self):
+        logger.info('Starting processes "{recorder} | {encoder}"'.format(
+            recorder=' '.join(self.recorder.command) or self.recorder,
+            encoder=' '.join(self.encoder.command)))
+        self.metrics = pulseaudio_dlna.recorders.RecorderMetrics()
+        if self.share_capture or self.uses_silence_gate:
+            self._start_shared()
+            return
+        if self.recorder.IN_PROCESS:
+            self._start_in_process()
+            return
+        # The processes must not inherit the client sockets, otherwise
+        # closed connections stay open as long as the processes run.
+        self.recorder_process = subprocess.Popen(
+            self.recorder.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=True)
+        self.metrics.watch(self.recorder_process.stderr)
+        self.encoder_process = subprocess.Popen(
+            self.encoder.command,
+            stdin=self.recorder_process.stdout,
+            stdout=subprocess.PIPE,
+            bufsize=-1,
+            close_fds=True)
+        # The read end of the encoder's input is kept to see whether the
+        # encoder keeps up with its input, see pending_input.
+        self.input_fd = os.dup(self.recorder_process.stdout.fileno())
+        self.recorder_process.stdout.close()
+
+    def _start_encoder(self):
+        # Starts an encoder which is fed by the application itself.
+        read_fd, write_fd = os.pipe()
+        try:
+            self.encoder_process = subprocess.Popen(
+                self.encoder.command,
+                stdin=read_fd,
+                stdout=self.output_write_fd or subprocess.PIPE,
+                bufsize=-1,
+                close_fds=True)
+        except:
+            os.close(read_fd)
+            os.close(write_fd)
+            raise
+        self.input_fd = read_fd
+        self.encoder_input = os.fdopen(write_fd, 'wb')
+
+    def start_encoder(self):
+        # Called by the silence gate when audio returns. The new encoder
+        # writes to the same output as the previous one.
+        self._start_encoder()
+        logger.debug('Started encoder process {} ...'.format(
+            self.encoder_process.pid))
+        return self.encoder_input
+
+    def stop_encoder(self, encoder_input):
+        # Called by the silence gate. The encoder gets an EOF, so it
+        # writes out everything it has encoded so far before it exits.
+        process, self.encoder_process = self.encoder_process, None
+        encoder_input.close()
+        deadline = time.time() + self.ENCODER_EXIT_TIMEOUT
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+        if process.poll() is None:
+            logger.debug('Killing process {} ...'.format(process.pid))
+            try:
+                process.kill()
+                process.wait()
+            except OSError:
+                pass
+        self._close_fd('input_fd')
+
+    def write_output(self, data):
+        # Writes data to the output as if the encoder had produced it.
+        while data:
+            data = data[os.write(self.output_write_fd, data):]
+
+    def _start_in_process(self):
+        self._start_encoder()
+        try:
+            self.recorder_process = self.recorder.start(
+                self.encoder_input, self.metrics)
+        except pulseaudio_dlna.utils.libpulse.LibpulseException as e:
+            logger.error(e)
+            self.recorder_process = None
+            self.encoder_input.close()
+
+    def _start_shared(self):
+        # The recorder is shared with the encoders of all other pipelines
+        # recording the same monitor.
+        if self.uses_silence_gate:
+            # The output is owned by the pipeline, so it outlasts the
+            # encoders started and stopped by the silence gate.
+            self.output_fd, self.output_write_fd = os.pipe()
+        self._start_encoder()
+        try:
+            self.capture = pulseaudio_dlna.capture.captures.acquire(
+                self.recorder)
+        except (pulseaudio_dlna.utils.libpulse.LibpulseException,
+                OSError) as e:
+            logger.error(e)
+            self.recorder_process = None
+            self.encoder_input.close()
+            return
+        self.recorder_process = self.capture.process
+        self.metrics = self.capture.metrics
+        output = self.encoder_input
+        if self.uses_silence_gate:
+            self.silence_gate = pulseaudio_dlna.silence.SilenceGate(
+                self, self.framing)
+            self.silence_gate.start(self.encoder_input)
+            output = self.silence_gate
+        self.capture_output = self.capture.subscribe(output)
 
-        GObject.timeout_add(
-            10000, self._on_regenerate_reinitialize_count)
+    @property
+    def chunk_size(self):
+        # An explicitly configured chunk size has precedence over the one
+        # derived from the recorder's latency profile.
+        return ProcessThread.CHUNK_SIZE or self.recorder.chunk_size
+
+    def fileno(self):
+        if self.output_fd is not None:
+            return self.output_fd
+        return self.encoder_process.stdout.fileno()
+
+    def read(self, size):
+        # The descriptor is read directly, so no data is held back in a
+        # file object buffer when switching to splice().
+        data = os.read(self.fileno(), size)
+        if self.silence_gate and self.silence_gate.frame is None:
+            self.silence_gate.learn(data)
+        return data
 
-    def _on_regenerate_reinitialize_count(self):
-        if self.reinitialize_count > 0:
-            self.reinitialize_count -= 1
-        return True
+    @property
+    def is_silent(self):
+        return self.silence_gate is not None and self.silence_gate.is_paused
+
+    @property
+    def is_responding(self):
+        if self.recorder_process is None or \
+           self.recorder_process.poll() is not None:
+            return False
+        if self.is_silent:
+            return True
+        encoder_process = self.encoder_process
+        return encoder_process is not None and encoder_process.poll() is None
+
+    @property
+    def pending_input(self):
+        # The number of recorded bytes the encoder did not read yet.
+        if self.input_fd is None:
+            return 0
+        try:
+            data = fcntl.ioctl(self.input_fd, termios.FIONREAD, b'\0' * 4)
+        except IOError:
+            return 0
+        return struct.unpack(b'i', data)[0]
+
+    def terminate(self):
+        if self.silence_gate:
+            # Writing silent frames fails from now on, so the gate cannot
+            # block anymore and is stopped before the encoder.
+            self._close_fd('output_fd')
+            self.silence_gate.stop()
+        processes = [self.recorder_process, self.encoder_process]
+        if self.recorder.IN_PROCESS or self.capture:
+            processes = [self.encoder_process]
+        for process in processes:
+            if process is None:
+                continue
+            pid = process.pid
+            logger.debug('Terminating process {} ...'.format(pid))
+            try:
+                os.kill(pid, signal.SIGTERM)
+                _pid, return_code = os.waitpid(pid, 0)
+            except:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except:
+                    pass
+        # Recorders blocked on a full pipe get an EPIPE from now on.
+        self._close_fd('input_fd')
+        # The capture stops as soon as it cannot write to the encoder
+        # anymore, so it is stopped after the encoder was terminated.
+        if self.capture:
+            self.capture.unsubscribe(self.capture_output)
+            pulseaudio_dlna.capture.captures.release(self.capture)
+            self.capture = None
+            self.capture_output = None
+        elif self.recorder.IN_PROCESS and self.recorder_process:
+            self.recorder_process.stop()
+        self._close_fd('output_fd')
+        self._close_fd('output_write_fd')
+        self.silence_gate = None
+
+    def _close_fd(self, name):
+        fd = getattr(self, name)
+        if fd is not None:
+            os.close(fd)
+            setattr(self, name, None)
+
+
+class PipelineSupervisor(object):
+
+    # Decides whether the processes of a pipeline have to be restarted and
+    # how long to wait before doing so. Besides dead processes, an encoder
+    # which did not produce any output for STALL_TIMEOUT_MSEC although its
+    # input kept piling up is considered hung. An idle sink does not count
+    # as a stall, since there is no input then.
+
+    MAX_RESTARTS = 3
+    RESTART_WINDOW_SECONDS = 30
+    BACKOFF_MSEC = 250
+    MAX_BACKOFF_MSEC = 8000
+    STALL_TIMEOUT_MSEC = 5000
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.restarts = collections.deque()
+        self.restart_count = 0
+        self.stall_count = 0
+        self.last_output = time.time()
+
+    def start(self):
+        self.pipeline.start()
+        self.last_output = time.time()
+        logger.info(
+            'Processes of {path} initialized ...'.format(
+                path=self.pipeline.path))
+
+    def feed(self):
+        # Called whenever the encoder produced some output.
+        self.last_output = time.time()
+
+    @property
+    def reinitialize_count(self):
+        # The restarts which count towards the limit.
+        limit = time.time() - self.RESTART_WINDOW_SECONDS
+        while self.restarts and self.restarts[0] < limit:
+            self.restarts.popleft()
+        return len(self.restarts)
+
+    @property
+    def is_stalled(self):
+        if self.STALL_TIMEOUT_MSEC <= 0:
+            return False
+        idle_msec = (time.time() - self.last_output) * 1000
+        return (idle_msec >= self.STALL_TIMEOUT_MSEC and
+                self.pipeline.pending_input > 0)
+
+    def check(self):
+        # Returns True if the pipeline has to be restarted.
+        if not self.pipeline.is_responding:
+            logger.info('Processes of {path} died.'.format(
+                path=self.pipeline.path))
+            return True
+        if self.is_stalled:
+            self.stall_count += 1
+            logger.warning(
+                'The encoder of {path} stalled with {pending} bytes of '
+                'input pending.'.format(
+                    path=self.pipeline.path,
+                    pending=self.pipeline.pending_input))
+            return True
+        return False
+
+    @property
+    def stall_check_interval(self):
+        return max(self.STALL_TIMEOUT_MSEC // 2, 100)
+
+    def get_backoff(self):
+        # The milliseconds to wait before the next restart, None if the
+        # pipeline is restarted too often and should be given up.
+        count = self.reinitialize_count
+        if count >= self.MAX_RESTARTS:
+            logger.error(
+                'There were more than {} attempts to reinitialize '
+                'the record process. Aborting.'.format(count))
+            return None
+        return min(self.BACKOFF_MSEC * pow(2, count), self.MAX_BACKOFF_MSEC)
+
+    def restart(self):
+        self.restarts.append(time.time())
+        self.restart_count += 1
+        self.pipeline.terminate()
+        self.pipeline.start()
+        self.last_output = time.time()
+        logger.info('Processes of {path} reinitialized ...'.format(
+            path=self.pipeline.path))
+
+
+class ProcessThread(threading.Thread):
+
+    CHUNK_SIZE = None
+    USE_SPLICE = False
+
+    def __init__(
+            self, path, encoder, recorder, broadcaster, *args, **kwargs):
+        threading.Thread.__init__(self, *args, **kwargs)
+        self.path = path
+        self.pipeline = ProcessPipeline(
+            path, encoder, recorder,
+            share_capture=broadcaster.shares_capture,
+            framing=broadcaster.framing)
+        self.supervisor = PipelineSupervisor(self.pipeline)
+        self.broadcaster = broadcaster
+
+        self.stop_event = threading.Event()
 
     def stop(self):
         self.stop_event.set()
@@ -93,120 +457,726 @@ class ProcessThread(threading.Thread):
         return self.stop_event.isSet()
 
     def run(self):
+        broadcaster = self.broadcaster
+        pipeline = self.pipeline
+        supervisor = self.supervisor
+        chunk_size = pipeline.chunk_size
+        use_splice = (
+            self.USE_SPLICE and pulseaudio_dlna.utils.splice.is_available())
+        timeout = supervisor.stall_check_interval / 1000.0
+
+        supervisor.start()
+        while not self.is_stopped:
+            if supervisor.check():
+                backoff = supervisor.get_backoff()
+                if backoff is None or self.stop_event.wait(backoff / 1000.0):
+                    break
+                supervisor.restart()
+                broadcaster.reset_header()
+
+            # Waiting for the encoder with a timeout lets a hung encoder be
+            # detected. The streams stay connected in the meantime.
+            try:
+                readable, _, _ = select.select(
+                    [pipeline.fileno()], [], [], timeout)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                continue
+
+            if use_splice and broadcaster.splice(
+                    pipeline.fileno(), chunk_size):
+                supervisor.feed()
+                continue
+
+            data = pipeline.read(chunk_size)
+            if len(data) > 0:
+                supervisor.feed()
+                broadcaster.put(data)
 
-        def create_processes():
-            logger.info('Starting processes "{recorder} | {encoder}"'.format(
-                recorder=' '.join(self.recorder.command),
-                encoder=' '.join(self.encoder.command)))
-            rec_process = subprocess.Popen(
-                self.recorder.command,
-                stdout=subprocess.PIPE)
-            enc_process = subprocess.Popen(
-                self.encoder.command,
-                stdin=rec_process.stdout,
-                stdout=subprocess.PIPE,
-                bufsize=-1)
-            rec_process.stdout.close()
-            return rec_process, enc_process, enc_process.stdout.read
-
-        def do_processes_respond(rec_process, enc_process):
-            return (rec_process.poll() is None and
-                    enc_process.poll() is None)
-
-        def terminate_processes(processes):
-            for process in processes:
-                pid = process.pid
-                logger.debug('Terminating process {} ...'.format(pid))
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                    _pid, return_code = os.waitpid(pid, 0)
-                except:
-                    try:
-                        os.kill(pid, signal.SIGKILL)
-                    except:
-                        pass
+        pipeline.terminate()
+        broadcaster.close()
 
-        chunk_size = self.CHUNK_SIZE
-        queue = self.queue
 
-        rec_process, enc_process, enc_read = create_processes()
-        logger.info(
-            'Processes of {path} initialized ...'.format(
-                path=self.path))
-        while not self.is_stopped:
-            if not do_processes_respond(rec_process, enc_process):
-                if self.reinitialize_count < 3:
-                    self.reinitialize_count += 1
-                    terminate_processes([rec_process, enc_process])
-                    rec_process, enc_process, enc_read = create_processes()
+class ProcessBroadcaster(object):
+
+    MAX_HEADER_SIZE = 1024 * 64
+    BUFFER_SIZE = 1024 * 512
+    BUFFER_POLICY = pulseaudio_dlna.buffers.POLICY_DROP_OLDEST
+    PREROLL_MSEC = 0
+    TIMESHIFT_SIZE = 1024 * 1024
+    RATE_MEASURE_SECONDS = 3
+
+    def __init__(self, path, encoder, recorder, bridge):
+        self.path = path
+        self.encoder = encoder
+        self.recorder = recorder
+        self.bridge = bridge
+        self.framing = pulseaudio_dlna.framing.get_framing(
+            bridge.device.codec)
+        self.cpu_cost = pulseaudio_dlna.admission.estimate_cost(
+            bridge.device.codec, encoder)
+        self.snapshot_key = pulseaudio_dlna.probes.get_key(
+            bridge.device.codec, encoder)
+
+        self.header = None
+        self.snapshot = None
+        self.buffers = {}
+        self.streams = {}
+        # Streams which already got the header of a snapshot, mapped to
+        # that header.
+        self.continued = {}
+        self.is_closed = False
+        # Set once the stream manager added the counters to its totals.
+        self.is_retired = False
+        self.lock = threading.Lock()
+
+        self._header_data = b''
+        self._process_runner = None
+
+        self.preroll = collections.deque()
+        self.position = 0
+        self.encoded_bytes = 0
+        self.first_data = None
+        self.created = time.time()
+
+        # Reconnecting clients ask for the byte offset where their last
+        # connection broke off. The sessions remember at which position
+        # the body of each client's last response started.
+        self.timeshift = None
+        if self.TIMESHIFT_SIZE > 0:
+            self.timeshift = pulseaudio_dlna.buffers.HistoryBuffer(
+                self.TIMESHIFT_SIZE)
+        self.sessions = {}
+
+    def _create_process_runner(self):
+        runner = ProcessThread(self.path, self.encoder, self.recorder, self)
+        runner.daemon = True
+        return runner
+
+    def subscribe(self, stream):
+        with self.lock:
+            if stream.offset is not None:
+                buffer = self._subscribe_shifted(stream)
+            else:
+                buffer = self._subscribe_live(stream)
+            self.buffers[stream.id] = buffer
+            self.streams[stream.id] = stream
+            if self.is_closed:
+                buffer.close()
+                return buffer
+            self._start()
+        return buffer
+
+    def _subscribe_live(self, stream):
+        buffer = pulseaudio_dlna.buffers.RingBuffer(
+            self.BUFFER_SIZE, self.BUFFER_POLICY, self.framing.ALIGNMENT)
+        if self.is_closed:
+            return buffer
+        # A stream which got a snapshot continues after its silence, the
+        # header was sent already.
+        snapshot = stream.snapshot
+        start = 0
+        if self.header:
+            if snapshot is None:
+                buffer.write(self.header)
+            elif snapshot.header != self.header:
+                logger.info(
+                    'The header of {path} changed, stream {id} cannot be '
+                    'continued.'.format(path=self.path, id=stream.id))
+                buffer.close()
+                return buffer
+            preroll = self._get_preroll()
+            if preroll:
+                buffer.write(preroll)
+                logger.debug(
+                    'Sent {length} bytes of pre-roll to stream '
+                    '{id}.'.format(length=len(preroll), id=stream.id))
+            start = self.position - len(preroll)
+        elif snapshot is not None:
+            self.continued[stream.id] = snapshot.header
+        if snapshot is not None:
+            start -= len(snapshot.body)
+        if self.timeshift and stream.client_host:
+            self.sessions[stream.client_host] = start
+        return buffer
+
+    def _subscribe_shifted(self, stream):
+        # The data is sent byte exact, so the buffer has to be large enough
+        # to hold everything from the requested offset on.
+        try:
+            located = self._locate(stream.client_host, stream.offset)
+        except RangeNotSatisfiableException:
+            located = None
+        data = None
+        if located:
+            prefix, position = located
+            data = prefix + self.timeshift.read(position)
+        size = self.BUFFER_SIZE + len(data or b'')
+        buffer = pulseaudio_dlna.buffers.RingBuffer(
+            size, self.BUFFER_POLICY, self.framing.ALIGNMENT)
+        if data is None:
+            logger.info(
+                'The range of stream {id} at offset {offset} is not '
+                'available anymore.'.format(
+                    id=stream.id, offset=stream.offset))
+            buffer.close()
+            return buffer
+        buffer.write(data)
+        logger.debug(
+            'Sent {length} bytes of the time-shift buffer to stream '
+            '{id}.'.format(length=len(data), id=stream.id))
+        return buffer
+
+    def locate(self, client_host, offset):
+        # Checks if a response body of the client can be resumed at offset.
+        # Returns False if the offset cannot be mapped to the stream at
+        # all and raises RangeNotSatisfiableException if it is outside of
+        # the time-shift buffer.
+        with self.lock:
+            return self._locate(client_host, offset) is not None
+
+    def _locate(self, client_host, offset):
+        if self.timeshift is None or self.header is None or \
+           client_host not in self.sessions:
+            return None
+        header_length = len(self.header)
+        position = self.sessions[client_host] + max(0, offset - header_length)
+        if position < self.timeshift.start or position > self.timeshift.end:
+            raise RangeNotSatisfiableException(offset)
+        return self.header[offset:], position
+
+    def start(self):
+        # Starts the processes without any stream, e.g. to have them ready
+        # when the client connects.
+        with self.lock:
+            if not self.is_closed:
+                self._start()
+
+    def _start(self):
+        if not self._process_runner:
+            self._process_runner = self._create_process_runner()
+            self._process_runner.start()
+
+    def unsubscribe(self, stream):
+        # Closing the buffer first wakes up an encoder which is blocked
+        # writing to it while holding no lock, otherwise it could never
+        # be unsubscribed with a full buffer.
+        buffer = self.buffers.get(stream.id, None)
+        if buffer:
+            buffer.close()
+        with self.lock:
+            self.streams.pop(stream.id, None)
+            self.continued.pop(stream.id, None)
+            buffer = self.buffers.pop(stream.id, None)
+            if buffer:
+                buffer.release()
+                if buffer.dropped_bytes > 0:
                     logger.info(
-                        'Processes of {path} reinitialized ...'.format(
-                            path=self.path))
-                else:
-                    logger.error(
-                        'There were more than {} attempts to reinitialize '
-                        'the record process. Aborting.'.format(
-                            self.reinitialize_count))
-                    break
+                        'Stream {id} of {path} dropped {dropped} bytes '
+                        '({overflows} overflows).'.format(
+                            id=stream.id,
+                            path=self.path,
+                            dropped=buffer.dropped_bytes,
+                            overflows=buffer.overflow_count))
 
-            data = enc_read(chunk_size)
-            if len(data) > 0:
-                queue.put(data)
+    @property
+    def is_empty(self):
+        return len(self.buffers) == 0
 
-        terminate_processes([rec_process, enc_process])
-        queue.put(b'')
+    @property
+    def shares_capture(self):
+        # Only the members of a group can use different encoders for the
+        # same sink, everything else pipes the recorder into the encoder.
+        return self.bridge.group is not None
+
+    def stop(self):
+        self.is_closed = True
+        if self._process_runner:
+            self._process_runner.stop()
+
+    def acquire_splice_stream(self):
+        # Data can only bypass the buffers when there is a single stream
+        # which does not need the header injected and has nothing queued.
+        with self.lock:
+            if len(self.buffers) != 1 or self.header is None or \
+               self.timeshift is not None:
+                return None
+            stream_id, buffer = self.buffers.items()[0]
+            stream = self.streams.get(stream_id, None)
+            if stream and stream.acquire_socket():
+                return stream
+        return None
+
+    def splice(self, fd, size):
+        # Moves data from fd directly into the socket of a single stream.
+        # Returns False if the data has to go through the buffers instead
+        # or fd reached its end, so the caller's read notices that.
+        stream = self.acquire_splice_stream()
+        if not stream:
+            return False
+        try:
+            length = pulseaudio_dlna.utils.splice.splice(
+                fd, stream.sock.fileno(), size)
+            if length == 0:
+                return False
+            self.encoded_bytes += length
+            stream.bytes_spliced += length
+            stream.bytes_sent += length
+        except OSError as e:
+            if e.errno in ProcessStream.RETRY_ERRNOS:
+                return False
+            logger.debug('Could not splice to stream {id} ({error}).'.format(
+                id=stream.id, error=e))
+            stream.is_splice_broken = True
+        finally:
+            stream.release_socket()
+        return True
+
+    def reset_header(self):
+        with self.lock:
+            self.header = None
+            self._header_data = b''
+            self.preroll.clear()
+            self.position = 0
+            if self.timeshift:
+                self.timeshift.clear()
+            self.sessions = {}
+
+    @property
+    def byte_rate(self):
+        # Bytes per second of encoded audio. Encoders without a fixed bit
+        # rate are measured once they delivered a few seconds of data.
+        bit_rate = getattr(self.encoder, 'bit_rate', None)
+        if bit_rate:
+            return int(bit_rate) * 1000 // 8
+        if self.first_data is None:
+            return None
+        elapsed = time.time() - self.first_data
+        if elapsed < self.RATE_MEASURE_SECONDS:
+            return None
+        return int(self.encoded_bytes / elapsed)
+
+    def put(self, data):
+        # The buffers are written outside of the lock, with the block
+        # policy a write waits until the client has read enough data.
+        for buffer, data in self._prepare_writes(data):
+            buffer.write(data)
+
+    def _prepare_writes(self, data):
+        with self.lock:
+            if self.first_data is None:
+                self.first_data = time.time()
+            self.encoded_bytes += len(data)
+            if self.header is None:
+                data = self._header_data + data
+                length = self.framing.header_length(data)
+                if length is None:
+                    if len(data) < self.MAX_HEADER_SIZE:
+                        self._header_data = data
+                        return []
+                    logger.warning(
+                        'Could not find the end of the stream header of '
+                        '{path}.'.format(path=self.path))
+                    length = 0
+                self.header = data[:length]
+                self._header_data = b''
+                logger.debug('Cached stream header of {path} ({length} '
+                             'bytes).'.format(path=self.path, length=length))
+                self._add_data(data[length:])
+                return self._prepare_header_writes(data, length)
+            self._add_data(data)
+            return [(buffer, data) for buffer in self.buffers.values()]
+
+    def _prepare_header_writes(self, data, length):
+        # The first data including the header goes to all buffers, except
+        # for the streams which already got the header of a snapshot.
+        writes = []
+        for stream_id, buffer in self.buffers.items():
+            header = self.continued.pop(stream_id, None)
+            if header is None:
+                writes.append((buffer, data))
+            elif header == self.header:
+                writes.append((buffer, data[length:]))
+            else:
+                logger.info(
+                    'The header of {path} changed, stream {id} cannot be '
+                    'continued.'.format(path=self.path, id=stream_id))
+                buffer.close()
+        return writes
+
+    def _add_data(self, data):
+        if self.snapshot is None and self.position < self.MAX_HEADER_SIZE and \
+           pulseaudio_dlna.probes.is_enabled():
+            self.snapshot = pulseaudio_dlna.probes.create_snapshot(
+                self.snapshot_key, self.framing, self.header, data)
+        if self.PREROLL_MSEC > 0:
+            self._add_preroll(data)
+        if self.timeshift:
+            self.timeshift.write(data)
+        self.position += len(data)
+
+    def _add_preroll(self, data):
+        now = time.time()
+        self.preroll.append((now, self.position, data))
+        limit = now - self.PREROLL_MSEC / 1000.0
+        while self.preroll and self.preroll[0][0] < limit:
+            self.preroll.popleft()
+
+    def _get_preroll(self):
+        # The window has to start at a frame boundary, otherwise the client
+        # would get a partial frame right after the header.
+        if not self.preroll:
+            return b''
+        position = self.preroll[0][1]
+        data = b''.join(chunk for _time, _position, chunk in self.preroll)
+        offset = self.framing.frame_offset(data, position)
+        if offset is None:
+            return b''
+        return data[offset:]
+
+    def close(self):
+        with self.lock:
+            self.is_closed = True
+            for buffer in self.buffers.values():
+                buffer.close()
+
+    def get_metrics(self):
+        metrics = {
+            'path': self.path,
+            'device': self.bridge.device.name,
+            'group': self.bridge.group.name if self.bridge.group else None,
+            'codec': self.bridge.device.codec.IDENTIFIER,
+            'bit_rate_kbps': getattr(self.encoder, 'bit_rate', None),
+            'cpu_cost_percent': self.cpu_cost,
+            'streams': len(self.buffers),
+            'age_seconds': time.time() - self.created,
+            'bytes_encoded': self.encoded_bytes,
+            'running': not self.is_closed,
+            'restarts': 0,
+            'encoder_stalls': 0,
+            'silent': False,
+            'silence_pauses': 0,
+            'reinitialize_count': 0,
+            'recorder_latency_usec': None,
+        }
+        supervisor = getattr(self._process_runner, 'supervisor', None)
+        if supervisor:
+            metrics['restarts'] = supervisor.restart_count
+            metrics['encoder_stalls'] = supervisor.stall_count
+            metrics['reinitialize_count'] = supervisor.reinitialize_count
+            silence_gate = supervisor.pipeline.silence_gate
+            if silence_gate:
+                metrics['silent'] = silence_gate.is_paused
+                metrics['silence_pauses'] = silence_gate.pause_count
+            if supervisor.pipeline.metrics:
+                metrics['recorder_latency_usec'] = \
+                    supervisor.pipeline.metrics.latency_usec
+        return metrics
+
+    def __str__(self):
+        return '<{} path="{}" streams="{}" header="{}">\n'.format(
+            self.__class__.__name__,
+            self.path,
+            len(self.buffers),
+            len(self.header) if self.header is not None else None,
+        )
 
 
 class ProcessStream(object):
 
     RUNNING = True
+    POLL_IN = select.POLLIN | select.POLLERR | select.POLLHUP
+    RETRY_ERRNOS = [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]
+    MAX_SEND_SIZE = 1024 * 64
+    SEND_TIMEOUT_MSEC = 10000
+    EVICTION_POLICY = EVICTION_SKIP
+    PROBE_RETRY_MSEC = 50
 
-    def __init__(self, path, sock, recorder, encoder, bridge):
+    def __init__(
+            self, path, sock, bridge, chunked=False, client_host=None,
+            offset=None):
         self.path = path
         self.sock = sock
-        self.recorder = recorder
-        self.encoder = encoder
         self.bridge = bridge
+        self.chunked = chunked
+        self.client_host = client_host
+        self.offset = offset
+        self.created = time.time()
+        self.bytes_sent = 0
+        self.bytes_spliced = 0
+        self.stall_count = 0
+        self.is_finishing = False
+        self.broadcaster = None
+        self.buffer = None
+        self.lock = threading.Lock()
+        self.splice_lock = threading.Lock()
+        self.is_sending = False
+        self.is_splice_broken = False
+        self.pacer = None
+        self.resume_at = None
+        self.send_deadline = None
+        self.has_skipped = False
+        self.skip_count = 0
+        self.skipped_bytes = 0
+        self.is_evicted = False
+        self.snapshot = None
+        self.probe_deadline = None
+        self.on_probed = None
 
         self.id = hex(id(self))
 
-    def run(self):
+    def acquire_socket(self):
+        # Hands the socket over to the process thread, as long as the stream
+        # has no data of its own which would have to be sent first. The
+        # socket must be released again via release_socket().
+        if self.chunked or self.pacer:
+            return False
+        with self.lock:
+            if self.is_sending or len(self.buffer) > 0:
+                return False
+        if not self.splice_lock.acquire(False):
+            return False
+        poller = select.poll()
+        poller.register(self.sock, select.POLLOUT)
+        if self.is_splice_broken or len(poller.poll(0)) == 0:
+            self.splice_lock.release()
+            return False
+        return True
 
-        queue = ProcessQueue()
-        process_thread = ProcessThread(
-            self.path, self.encoder, self.recorder, queue)
-        process_thread.daemon = True
-        process_thread.start()
-
-        empty_list = []
-        select_select = select.select
-        sock = self.sock
-        sock_list = [self.sock]
-        sock_sendall = self.sock.sendall
-        sock_recv = self.sock.recv
-        queue_data = queue.data
-
-        while self.RUNNING:
-            r, w, e = select_select(sock_list, sock_list, empty_list, 0)
-
-            if sock in w:
-                data = queue_data()
-                if len(data) == 0:
-                    break
+    def release_socket(self):
+        self.splice_lock.release()
+
+    def run(self):
+        poller = select.poll()
+        try:
+            self.start(poller)
+            while self.RUNNING:
                 try:
-                    sock_sendall(data)
-                except socket.error:
+                    events = poller.poll(self.get_timeout())
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
                     break
-
-            if sock in r:
+                for fd, event in events:
+                    if not self.handle_event(fd, event):
+                        return
+                if not self.handle_timeout():
+                    return
+        finally:
+            self.finish()
+
+    def start(self, poller, pending=None):
+        # The poller can be anything providing register(), modify() and
+        # unregister() like select.poll(). Data passed via pending is sent
+        # before anything of the buffer.
+        self.poller = poller
+        self.sock_fd = self.sock.fileno()
+        self.buffer_fd = self.buffer.fileno()
+        self.pending = None
+        self.pacer = pulseaudio_dlna.pacing.create_pacer(
+            self.bridge, lambda: self.broadcaster.byte_rate
+            if self.broadcaster else None)
+        poller.register(self.sock_fd, self.POLL_IN)
+        if pending:
+            with self.lock:
+                self.is_sending = True
+            self._set_pending(pending, registered=False)
+        else:
+            poller.register(self.buffer_fd, select.POLLIN)
+
+    def probe(self, snapshot, on_probed, msec):
+        # The stream is answered from the snapshot until msec passed. Then
+        # on_probed(stream) has to return the buffer of the real stream.
+        self.snapshot = snapshot
+        self.buffer = snapshot.create_buffer()
+        self.on_probed = on_probed
+        self.probe_deadline = time.time() + msec / 1000.0
+
+    def _end_probe(self):
+        # Waits until the snapshot was sent, the real stream follows it.
+        if self.pending is not None or len(self.buffer) > 0:
+            self.probe_deadline = time.time() + \
+                self.PROBE_RETRY_MSEC / 1000.0
+            return
+        self.probe_deadline = None
+        logger.debug('Stream {id} outlasted its probe window.'.format(
+            id=self.id))
+        self.poller.unregister(self.buffer_fd)
+        self.buffer.release()
+        self.buffer = self.on_probed(self)
+        self.buffer_fd = self.buffer.fileno()
+        self.poller.register(self.buffer_fd, select.POLLIN)
+
+    def finish(self):
+        with self.splice_lock:
+            self.is_splice_broken = True
+
+    def _set_pending(self, data, registered=True):
+        # Stop reading from the buffer until the socket took the data, so
+        # a slow client lets the buffer fill up.
+        self.pending = memoryview(data)
+        if registered:
+            self.poller.unregister(self.buffer_fd)
+        self.poller.modify(self.sock_fd, self.POLL_IN | select.POLLOUT)
+        if self.send_deadline is None:
+            self._extend_deadline()
+
+    def _extend_deadline(self):
+        if self.SEND_TIMEOUT_MSEC > 0:
+            self.send_deadline = time.time() + self.SEND_TIMEOUT_MSEC / 1000.0
+
+    def handle_event(self, fd, event):
+        # Returns False as soon as the stream has finished.
+        if fd == self.sock_fd:
+            if event & select.POLLOUT and self.pending is not None:
+                try:
+                    sent = self.sock.send(self.pending, socket.MSG_DONTWAIT)
+                except socket.error as e:
+                    if e.errno not in self.RETRY_ERRNOS:
+                        return False
+                    sent = 0
+                self.bytes_sent += sent
+                if sent > 0:
+                    self.has_skipped = False
+                    self._extend_deadline()
+                if sent < len(self.pending):
+                    # The socket buffer is full, the client does not keep
+                    # up with the stream.
+                    self.stall_count += 1
+                self.pending = self.pending[sent:]
+                if len(self.pending) == 0:
+                    if self.is_finishing:
+                        return False
+                    self.send_deadline = None
+                    with self.lock:
+                        self.pending = None
+                        self.is_sending = False
+                    self.poller.modify(self.sock_fd, self.POLL_IN)
+                    self.poller.register(self.buffer_fd, select.POLLIN)
+            if event & self.POLL_IN:
                 try:
-                    data = sock_recv(1024)
+                    data = self.sock.recv(1024, socket.MSG_DONTWAIT)
                     if len(data) == 0:
-                        break
-                except socket.error:
-                    break
+                        return False
+                except socket.error as e:
+                    if e.errno not in self.RETRY_ERRNOS:
+                        return False
+        elif fd == self.buffer_fd and self.pending is None:
+            # Only a limited amount of data is taken out of the buffer at
+            # once, a client which falls behind can then be skipped ahead.
+            max_size = self.MAX_SEND_SIZE
+            if self.pacer:
+                allowance = self.pacer.allowance()
+                if allowance is not None and allowance <= 0:
+                    self._throttle()
+                    return True
+                if allowance is not None:
+                    max_size = min(max_size, allowance)
+            with self.lock:
+                data = self.buffer.read_nowait(max_size)
+                if data is None:
+                    return True
+                if self.pacer:
+                    self.pacer.consume(len(data))
+                if len(data) == 0 and not self.chunked:
+                    return False
+                self.is_sending = True
+            if self.chunked:
+                # The last chunk has a length of zero and ends the body.
+                self.is_finishing = len(data) == 0
+                data = b'{:x}\r\n'.format(len(data)) + bytes(data) + b'\r\n'
+            self._set_pending(data)
+        return True
 
-        process_thread.stop()
+    def _throttle(self):
+        # The stream ran ahead of its pacer, the buffer is read again once
+        # the pacer allows it.
+        self.poller.unregister(self.buffer_fd)
+        self.resume_at = time.time() + self.pacer.delay_msec() / 1000.0
+
+    def get_timeout(self):
+        # Milliseconds until handle_timeout() has to be called, None if the
+        # stream neither waits for its pacer, its client nor its probe.
+        due = [at for at in [
+            self.resume_at, self.send_deadline, self.probe_deadline]
+            if at is not None]
+        if not due:
+            return None
+        return max(int((min(due) - time.time()) * 1000), 0)
+
+    def handle_timeout(self):
+        # Returns False if the stream has to be finished.
+        now = time.time()
+        if self.resume_at is not None and self.resume_at <= now:
+            self.resume_at = None
+            self.poller.register(self.buffer_fd, select.POLLIN)
+        if self.probe_deadline is not None and self.probe_deadline <= now:
+            self._end_probe()
+        if self.send_deadline is not None and self.send_deadline <= now:
+            return self._on_send_timeout()
+        return True
+
+    def _on_send_timeout(self):
+        # The client did not read anything for SEND_TIMEOUT_MSEC. Once it
+        # was skipped ahead without reading anything afterwards, it gets
+        # disconnected in any case.
+        if self.EVICTION_POLICY == EVICTION_SKIP and not self.has_skipped:
+            with self.lock:
+                skipped = self.buffer.skip()
+            self.has_skipped = True
+            self.skip_count += 1
+            self.skipped_bytes += skipped
+            self._extend_deadline()
+            logger.info(
+                'Stream {id} did not read anything for {msec} ms, skipped '
+                '{bytes} bytes to continue live.'.format(
+                    id=self.id, msec=self.SEND_TIMEOUT_MSEC, bytes=skipped))
+            return True
+        logger.info(
+            'Stream {id} did not read anything for {msec} ms, disconnecting '
+            'the client.'.format(id=self.id, msec=self.SEND_TIMEOUT_MSEC))
+        self.is_evicted = True
+        return False
+
+    def get_metrics(self):
+        age = time.time() - self.created
+        encoder = self.broadcaster.encoder if self.broadcaster else None
+        bit_rate = getattr(encoder, 'bit_rate', None)
+        # An empty buffer is falsy, so it is checked against None.
+        buffer = self.buffer
+        has_buffer = buffer is not None
+        encoded_bytes = self.bytes_spliced
+        if has_buffer:
+            encoded_bytes += buffer.written_bytes
+        # The bytes queued in the socket tell how far the client lags
+        # behind, the rate turns them into the latency they add.
+        queued_bytes = pulseaudio_dlna.sockets.get_queued_bytes(self.sock)
+        byte_rate = self.broadcaster.byte_rate if self.broadcaster else None
+        queued_msec = None
+        if queued_bytes is not None and byte_rate:
+            queued_msec = queued_bytes * 1000 // byte_rate
+        return {
+            'id': self.id,
+            'path': self.path,
+            'device': self.bridge.device.name,
+            'client': self.client_host,
+            'age_seconds': age,
+            'bytes_encoded': encoded_bytes,
+            'bytes_sent': self.bytes_sent,
+            'buffer_depth_bytes': len(buffer) if has_buffer else 0,
+            'buffer_dropped_bytes':
+                buffer.dropped_bytes if has_buffer else 0,
+            'send_rate_bps': self.bytes_sent * 8 / age if age > 0 else 0,
+            'codec_bit_rate_bps': int(bit_rate) * 1000 if bit_rate else None,
+            'stalls': self.stall_count,
+            'skips': self.skip_count,
+            'skipped_bytes': self.skipped_bytes,
+            'socket_queued_bytes': queued_bytes,
+            'socket_queued_msec': queued_msec,
+        }
 
     def __str__(self):
         return '<{} id="{}">\n'.format(
@@ -216,43 +1186,259 @@ class ProcessStream(object):
 
 
 class StreamManager(object):
+
+    LINGER_SECONDS = 10
+
     def __init__(self, server):
         self.streams = {}
+        self.broadcasters = {}
         self.timeouts = {}
+        self.lingering = {}
         self.server = server
-
-    def create_stream(self, path, request, bridge):
+        self.eviction_count = 0
+        self.rejection_count = 0
+        # The counters of streams and broadcasters which are gone, so the
+        # process wide totals never decrease.
+        self.encoded_bytes = 0
+        self.sent_bytes = 0
+        self.stall_count = 0
+        self.admission = pulseaudio_dlna.admission.AdmissionController()
+        self.probes = pulseaudio_dlna.probes.ProbeCache()
+        self.lock = threading.Lock()
+
+    def create_stream(
+            self, path, request, bridge, chunked=False, client_host=None,
+            offset=None):
+        # The idle timeout of persistent connections does not apply to
+        # the stream itself.
+        request.settimeout(None)
         stream = ProcessStream(
             path=path,
             sock=request,
-            recorder=bridge.device.codec.get_recorder(bridge.sink.monitor),
-            encoder=bridge.device.codec.encoder,
             bridge=bridge,
+            chunked=chunked,
+            client_host=client_host,
+            offset=offset,
         )
         self.register(stream)
-        stream.run()
-        self.unregister(stream)
+        try:
+            stream.run()
+        finally:
+            self.unregister(stream)
+
+    def _create_broadcaster(self, path, bridge, encoder):
+        return ProcessBroadcaster(
+            path=path,
+            encoder=encoder,
+            recorder=bridge.device.codec.get_recorder(bridge.sink.monitor),
+            bridge=bridge,
+        )
+
+    def _get_broadcaster(self, path, bridge):
+        broadcaster = self.broadcasters.get(path, None)
+        if not broadcaster or broadcaster.is_closed:
+            if broadcaster:
+                self._retire_broadcaster(broadcaster)
+            encoder = self.admission.take(path, bridge.device.codec)
+            broadcaster = self._create_broadcaster(path, bridge, encoder)
+            self.broadcasters[path] = broadcaster
+            logger.info('Created broadcaster for "{}" ...'.format(path))
+        return broadcaster
 
     def register(self, stream):
         logger.info('Registered stream "{}" ({}) ...'.format(
             stream.path, stream.id))
-        if not self.streams.get(stream.path, None):
-            self.streams[stream.path] = {}
-        self.streams[stream.path][stream.id] = stream
+        with self.lock:
+            if not self.streams.get(stream.path, None):
+                self.streams[stream.path] = {}
+            self.streams[stream.path][stream.id] = stream
+            snapshot = self._get_snapshot(stream)
+            if snapshot:
+                logger.info(
+                    'Answering stream "{}" ({}) with a snapshot for {} ms '
+                    '...'.format(stream.path, stream.id,
+                                 self.probes.PROBE_MSEC))
+                self.probes.probe_count += 1
+                stream.probe(snapshot, self.attach, self.probes.PROBE_MSEC)
+                return
+            self._attach(stream)
+
+    def _get_snapshot(self, stream):
+        # Only streams which would start a pipeline are probed.
+        broadcaster = self.broadcasters.get(stream.path, None)
+        if broadcaster and not broadcaster.is_closed or \
+           stream.offset is not None:
+            return None
+        return self.probes.get(stream.path, stream.bridge.device.codec)
+
+    def attach(self, stream):
+        # Returns the buffer of a stream which outlasted its probe window.
+        with self.lock:
+            self._attach(stream)
+        return stream.buffer
+
+    def _attach(self, stream):
+        broadcaster = self._get_broadcaster(stream.path, stream.bridge)
+        stream.buffer = broadcaster.subscribe(stream)
+        stream.broadcaster = broadcaster
+        self._stop_lingering(stream.path)
+
+    def admit(self, path, bridge):
+        # Raises an AdmissionRejectedException if there is not enough CPU
+        # budget left for the pipeline the stream would start.
+        with self.lock:
+            self._admit(path, bridge)
+
+    def _admit(self, path, bridge):
+        broadcaster = self.broadcasters.get(path, None)
+        if broadcaster and not broadcaster.is_closed:
+            return
+        used_cost = sum(
+            broadcaster.cpu_cost for broadcaster in self.broadcasters.values()
+            if not broadcaster.is_closed)
+        try:
+            self.admission.reserve(path, bridge.device.codec, used_cost)
+        except pulseaudio_dlna.admission.AdmissionRejectedException:
+            self.rejection_count += 1
+            raise
+
+    def locate(self, path, client_host, offset):
+        with self.lock:
+            broadcaster = self.broadcasters.get(path, None)
+            if not broadcaster or broadcaster.is_closed:
+                return False
+            return broadcaster.locate(client_host, offset)
+
+    def prespawn(self, path, bridge):
+        # Starts the processes of a bridge which is about to be played. If
+        # nobody connects, they are stopped like lingering ones.
+        if self.LINGER_SECONDS <= 0:
+            return
+        with self.lock:
+            try:
+                self._admit(path, bridge)
+            except pulseaudio_dlna.admission.AdmissionRejectedException as e:
+                logger.info('Not prespawning processes ({}).'.format(e))
+                return
+            broadcaster = self._get_broadcaster(path, bridge)
+            if broadcaster.is_empty:
+                logger.info('Prespawning processes for "{}" ...'.format(path))
+                broadcaster.start()
+                self._linger(path, broadcaster)
+
+    def _linger(self, path, broadcaster):
+        self._stop_lingering(path)
+        self.lingering[path] = GObject.timeout_add(
+            self.LINGER_SECONDS * 1000, self._on_linger_timeout,
+            path, broadcaster)
+
+    def _stop_lingering(self, path):
+        if path in self.lingering:
+            GObject.source_remove(self.lingering.pop(path))
+
+    def _on_linger_timeout(self, path, broadcaster):
+        with self.lock:
+            self.lingering.pop(path, None)
+            if broadcaster.is_empty:
+                self._remove_broadcaster(path, broadcaster)
+        return False
+
+    def _retire_broadcaster(self, broadcaster):
+        # A closed broadcaster is replaced before its streams are gone, so
+        # it can be retired twice.
+        if not broadcaster.is_retired:
+            broadcaster.is_retired = True
+            self.encoded_bytes += broadcaster.encoded_bytes
+
+    def _remove_broadcaster(self, path, broadcaster):
+        broadcaster.stop()
+        self._retire_broadcaster(broadcaster)
+        self.probes.store(path, broadcaster.snapshot)
+        if self.broadcasters.get(path, None) is broadcaster:
+            del self.broadcasters[path]
+            logger.info('Removed broadcaster for "{}" ...'.format(path))
 
     def unregister(self, stream):
         logger.info('Unregistered stream "{}" ({}) ...'.format(
             stream.path, stream.id))
-        del self.streams[stream.path][stream.id]
-
-        if stream.path in self.timeouts:
-            GObject.source_remove(self.timeouts[stream.path])
-        self.timeouts[stream.path] = GObject.timeout_add(
-            2000, self._on_disconnect, stream)
+        with self.lock:
+            del self.streams[stream.path][stream.id]
+            self.sent_bytes += stream.bytes_sent
+            self.stall_count += stream.stall_count
+            if stream.is_evicted:
+                self.eviction_count += 1
+            broadcaster = stream.broadcaster
+            if broadcaster is None:
+                logger.info(
+                    'Stream "{}" ({}) disconnected within its probe window, '
+                    'no pipeline was started.'.format(stream.path, stream.id))
+                self.probes.avoided_count += 1
+                stream.buffer.release()
+                if not self.streams[stream.path]:
+                    self.admission.cancel(stream.path)
+            else:
+                broadcaster.unsubscribe(stream)
+                if broadcaster.is_empty:
+                    if self.LINGER_SECONDS > 0 and \
+                       not broadcaster.is_closed and \
+                       self.broadcasters.get(stream.path, None) is \
+                            broadcaster:
+                        self._linger(stream.path, broadcaster)
+                    else:
+                        self._remove_broadcaster(stream.path, broadcaster)
+
+            # The members of a group share the path, so each device is
+            # checked on its own.
+            key = (stream.path, stream.bridge.device.udn)
+            if key in self.timeouts:
+                GObject.source_remove(self.timeouts[key])
+            self.timeouts[key] = GObject.timeout_add(
+                2000, self._on_disconnect, stream)
+
+    def get_metrics(self):
+        # Collected under the lock, so a stream which is unregistered in
+        # the meantime is not counted twice.
+        with self.lock:
+            stream_metrics = [
+                stream.get_metrics() for path_streams in self.streams.values()
+                for stream in path_streams.values()]
+            bridge_metrics = [
+                broadcaster.get_metrics()
+                for broadcaster in self.broadcasters.values()]
+            encoded_bytes = self.encoded_bytes
+            sent_bytes = self.sent_bytes
+            stall_count = self.stall_count
+        return {
+            'process': {
+                'uptime_seconds': time.time() - self.server.started,
+                'streams': len(stream_metrics),
+                'broadcasters': len(bridge_metrics),
+                'bytes_encoded': encoded_bytes + sum(
+                    metrics['bytes_encoded'] for metrics in bridge_metrics),
+                'bytes_sent': sent_bytes + sum(
+                    metrics['bytes_sent'] for metrics in stream_metrics),
+                'stalls': stall_count + sum(
+                    metrics['stalls'] for metrics in stream_metrics),
+                'evictions': self.eviction_count,
+                'admission_rejections': self.rejection_count,
+                'cpu_budget_percent':
+                    self.admission.CPU_BUDGET if self.admission.is_enabled
+                    else None,
+                'cpu_cost_percent': sum(
+                    metrics['cpu_cost_percent'] for metrics in bridge_metrics
+                    if metrics['running']),
+                'probes': self.probes.probe_count,
+                'probe_pipelines_avoided': self.probes.avoided_count,
+            },
+            'bridges': bridge_metrics,
+            'streams': stream_metrics,
+        }
 
     def _on_disconnect(self, stream):
-        self.timeouts.pop(stream.path)
-        if len(self.streams[stream.path]) == 0:
+        self.timeouts.pop((stream.path, stream.bridge.device.udn))
+        if not any(
+                other.bridge.device.udn == stream.bridge.device.udn
+                for other in self.streams[stream.path].values()):
             logger.info('No more stream from device "{}".'.format(
                 stream.bridge.device.name))
             self.server.pulse_queue.put({
@@ -272,8 +1458,485 @@ class StreamManager(object):
         )
 
 
+class Reactor(object):
+
+    # Single threaded event loop for the epoll based stream server. The
+    # epoll descriptor itself is watched by the GObject mainloop, so timers
+    # and queue messages keep working as before.
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.handlers = {}
+
+    def fileno(self):
+        return self.epoll.fileno()
+
+    def register(self, fd, eventmask, handler):
+        self.epoll.register(fd, eventmask)
+        self.handlers[fd] = handler
+
+    def modify(self, fd, eventmask):
+        self.epoll.modify(fd, eventmask)
+
+    def unregister(self, fd):
+        if self.handlers.pop(fd, None):
+            try:
+                self.epoll.unregister(fd)
+            except (IOError, ValueError):
+                pass
+
+    def dispatch(self, *args):
+        try:
+            events = self.epoll.poll(0)
+        except IOError as e:
+            if e.errno == errno.EINTR:
+                return True
+            raise
+        for fd, event in events:
+            handler = self.handlers.get(fd, None)
+            if not handler:
+                continue
+            try:
+                handler(fd, event)
+            except:
+                logger.exception(
+                    'Handler of descriptor {} failed.'.format(fd))
+                self.unregister(fd)
+        return True
+
+
+class ReactorPoller(object):
+
+    # Lets a ProcessStream register its descriptors with the reactor as if
+    # it was using its own select.poll() object.
+
+    def __init__(self, reactor, handler):
+        self.reactor = reactor
+        self.handler = handler
+        self.fds = set()
+        self.timeout_source = None
+        self.timeout_due = None
+
+    def register(self, fd, eventmask):
+        self.reactor.register(fd, eventmask, self.handler)
+        self.fds.add(fd)
+
+    def modify(self, fd, eventmask):
+        self.reactor.modify(fd, eventmask)
+
+    def unregister(self, fd):
+        self.fds.discard(fd)
+        self.reactor.unregister(fd)
+
+    def schedule(self, timeout, callback):
+        # Calls callback once after timeout milliseconds. A call which is
+        # already scheduled is kept if it is not due any later.
+        due = time.time() + timeout / 1000.0
+        if self.timeout_source is not None:
+            if self.timeout_due <= due:
+                return
+            GObject.source_remove(self.timeout_source)
+
+        def on_timeout():
+            self.timeout_source = None
+            callback()
+            return False
+
+        self.timeout_due = due
+        self.timeout_source = GObject.timeout_add(timeout, on_timeout)
+
+    def close(self):
+        if self.timeout_source is not None:
+            GObject.source_remove(self.timeout_source)
+            self.timeout_source = None
+        for fd in list(self.fds):
+            self.unregister(fd)
+
+
+class ReactorProcessReader(object):
+
+    # Replaces the ProcessThread in the epoll based stream server. The
+    # encoder output is read non-blocking whenever the reactor reports it
+    # to be readable.
+
+    def __init__(self, path, encoder, recorder, broadcaster, reactor):
+        self.path = path
+        self.pipeline = ProcessPipeline(
+            path, encoder, recorder,
+            share_capture=broadcaster.shares_capture,
+            framing=broadcaster.framing)
+        self.supervisor = PipelineSupervisor(self.pipeline)
+        self.broadcaster = broadcaster
+        self.reactor = reactor
+        self.fd = None
+        self.use_splice = (
+            ProcessThread.USE_SPLICE and
+            pulseaudio_dlna.utils.splice.is_available())
+        self.check_source = None
+        self.restart_source = None
+
+    def start(self):
+        self.supervisor.start()
+        self._register()
+        # A hung encoder does not cause any events, so it is checked for
+        # periodically.
+        self.check_source = GObject.timeout_add(
+            self.supervisor.stall_check_interval, self._on_check)
+
+    def _register(self):
+        self.fd = self.pipeline.fileno()
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.reactor.register(
+            self.fd, ProcessStream.POLL_IN, self.handle_event)
+
+    def _unregister(self):
+        if self.fd is not None:
+            self.reactor.unregister(self.fd)
+            self.fd = None
+
+    def _remove_sources(self):
+        for name in ['check_source', 'restart_source']:
+            source = getattr(self, name)
+            if source is not None:
+                GObject.source_remove(source)
+                setattr(self, name, None)
+
+    def stop(self):
+        # Called by the broadcaster while holding its lock, so it must not
+        # call back into the broadcaster.
+        self._remove_sources()
+        self._unregister()
+        self.pipeline.terminate()
+
+    def handle_event(self, fd, event):
+        chunk_size = self.pipeline.chunk_size
+        # At the end of the encoder output splice() returns False, the read
+        # then ends up restarting the pipeline like without splice().
+        if self.use_splice and self.broadcaster.splice(fd, chunk_size):
+            self.supervisor.feed()
+            return
+        try:
+            data = self.pipeline.read(chunk_size)
+        except OSError as e:
+            if e.errno in ProcessStream.RETRY_ERRNOS:
+                return
+            data = b''
+        if len(data) > 0:
+            self.supervisor.feed()
+            self.broadcaster.put(data)
+            return
+        self._schedule_restart()
+
+    def _on_check(self):
+        if self.restart_source is None and self.supervisor.check():
+            self._schedule_restart()
+        return self.check_source is not None
+
+    def _schedule_restart(self):
+        # The streams stay connected while the processes are restarted.
+        self._unregister()
+        backoff = self.supervisor.get_backoff()
+        if backoff is None:
+            self._remove_sources()
+            self.pipeline.terminate()
+            self.broadcaster.close()
+            return
+        self.restart_source = GObject.timeout_add(backoff, self._on_restart)
+
+    def _on_restart(self):
+        self.restart_source = None
+        self.supervisor.restart()
+        self.broadcaster.reset_header()
+        self._register()
+        return False
+
+
+class ReactorProcessBroadcaster(ProcessBroadcaster):
+
+    def __init__(self, path, encoder, recorder, bridge, reactor):
+        ProcessBroadcaster.__init__(self, path, encoder, recorder, bridge)
+        self.reactor = reactor
+
+    def _create_process_runner(self):
+        return ReactorProcessReader(
+            self.path, self.encoder, self.recorder, self, self.reactor)
+
+
+class ReactorStreamManager(StreamManager):
+
+    def __init__(self, server, reactor):
+        StreamManager.__init__(self, server)
+        self.reactor = reactor
+
+    def _create_broadcaster(self, path, bridge, encoder):
+        return ReactorProcessBroadcaster(
+            path=path,
+            encoder=encoder,
+            recorder=bridge.device.codec.get_recorder(bridge.sink.monitor),
+            bridge=bridge,
+            reactor=self.reactor,
+        )
+
+    def create_stream(
+            self, path, request, bridge, chunked=False, client_host=None,
+            offset=None):
+        # Returns immediately, the stream is driven by the reactor from now
+        # on and the headers written by the request handler are sent first.
+        stream = ProcessStream(
+            path=path,
+            sock=request.sock,
+            bridge=bridge,
+            chunked=chunked,
+            client_host=client_host,
+            offset=offset,
+        )
+        request.is_taken_over = True
+        self.register(stream)
+
+        def on_event(fd, event):
+            if not stream.handle_event(fd, event):
+                close()
+                return
+            schedule_timeout()
+
+        def on_timeout():
+            if not stream.handle_timeout():
+                close()
+                return
+            schedule_timeout()
+
+        def schedule_timeout():
+            timeout = stream.get_timeout()
+            if timeout is not None:
+                poller.schedule(timeout, on_timeout)
+
+        def close():
+            poller.close()
+            stream.finish()
+            self.unregister(stream)
+            request.close()
+
+        poller = ReactorPoller(self.reactor, on_event)
+        try:
+            stream.start(poller, pending=request.pop_output())
+        except:
+            poller.close()
+            stream.finish()
+            self.unregister(stream)
+            raise
+        schedule_timeout()
+
+
+class ReactorFile(object):
+
+    # File object handed to the request handler instead of the socket file
+    # objects, all writes are collected and sent by the reactor.
+
+    def __init__(self):
+        self.data = []
+        self.closed = False
+
+    def write(self, data):
+        self.data.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReactorRequest(object):
+
+    def __init__(self, sock, data):
+        self.sock = sock
+        self.data = data
+        self.output = ReactorFile()
+        self.is_taken_over = False
+
+    def makefile(self, mode='r', bufsize=-1):
+        if 'r' in mode:
+            return StringIO.StringIO(self.data)
+        return self.output
+
+    def pop_output(self):
+        data = b''.join(bytes(chunk) for chunk in self.output.data)
+        self.output.data = []
+        return data
+
+    def close(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class ReactorConnection(object):
+
+    MAX_REQUEST_SIZE = 1024 * 64
+    MAX_BODY_SIZE = 1024 * 64
+    IDLE_TIMEOUT = 15
+
+    def __init__(self, server, reactor, sock, client_address):
+        self.server = server
+        self.reactor = reactor
+        self.sock = sock
+        self.client_address = client_address
+        self.data = b''
+        self.pending = None
+        self.keep_alive = False
+        self.timeout_id = None
+
+    def start(self):
+        self.sock.setblocking(0)
+        self.fd = self.sock.fileno()
+        self.reactor.register(
+            self.fd, ProcessStream.POLL_IN, self.handle_event)
+        self._start_timeout()
+
+    def close(self):
+        self._stop_timeout()
+        self.reactor.unregister(self.fd)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def _start_timeout(self):
+        self._stop_timeout()
+        self.timeout_id = GObject.timeout_add(
+            self.IDLE_TIMEOUT * 1000, self._on_timeout)
+
+    def _stop_timeout(self):
+        if self.timeout_id is not None:
+            GObject.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def _on_timeout(self):
+        self.timeout_id = None
+        logger.debug('Closing the idle connection of {}.'.format(
+            self.client_address))
+        self.close()
+        return False
+
+    def handle_event(self, fd, event):
+        if self.pending is not None:
+            self._send()
+            return
+        try:
+            data = self.sock.recv(4096)
+        except socket.error as e:
+            if e.errno not in ProcessStream.RETRY_ERRNOS:
+                self.close()
+            return
+        if len(data) == 0:
+            self.close()
+            return
+        self.data += data
+        self._process_data()
+
+    def _process_data(self):
+        head, separator, body = self.data.partition(b'\r\n\r\n')
+        if not separator:
+            if len(self.data) >= self.MAX_REQUEST_SIZE:
+                self._stop_timeout()
+                self._handle_request(len(self.data))
+            return
+        length = self._get_content_length(head)
+        if length is None:
+            self._reject(400)
+            return
+        if length > self.MAX_BODY_SIZE:
+            self._reject(413)
+            return
+        # The handler reads the body from the request, so it has to be
+        # complete before the request is dispatched.
+        if len(body) < length:
+            return
+        self._stop_timeout()
+        self._handle_request(len(head) + len(separator) + length)
+
+    def _get_content_length(self, head):
+        # Returns None if the header is not a valid length.
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                try:
+                    length = int(value.strip())
+                except ValueError:
+                    return None
+                return length if length >= 0 else None
+        return 0
+
+    def _reject(self, response_code):
+        self._stop_timeout()
+        message = BaseHTTPServer.BaseHTTPRequestHandler.responses[
+            response_code][0]
+        logger.info('Rejected the request of {address} ({code} {message}).'
+                    .format(address=self.client_address,
+                            code=response_code, message=message))
+        self.data = b''
+        self.keep_alive = False
+        self.pending = ('HTTP/1.1 {code} {message}\r\n'
+                        'Content-Length: 0\r\n'
+                        'Connection: close\r\n\r\n').format(
+            code=response_code, message=message).encode('ascii')
+        self.reactor.modify(self.fd, select.POLLOUT)
+        self._send()
+
+    def _handle_request(self, length):
+        # Anything after the request belongs to the next request of a
+        # persistent connection.
+        data, self.data = self.data[:length], self.data[length:]
+        self.reactor.unregister(self.fd)
+        request = ReactorRequest(self.sock, data)
+        try:
+            handler = ReactorStreamRequestHandler(
+                request, self.client_address, self.server)
+        except:
+            logger.exception('Could not handle the request of {}.'.format(
+                self.client_address))
+            if not request.is_taken_over:
+                self.close()
+            return
+        if request.is_taken_over:
+            return
+        self.keep_alive = not handler.close_connection
+        self.pending = request.pop_output()
+        self.reactor.register(self.fd, select.POLLOUT, self.handle_event)
+        self._send()
+
+    def _send(self):
+        try:
+            sent = self.sock.send(self.pending)
+        except socket.error as e:
+            if e.errno not in ProcessStream.RETRY_ERRNOS:
+                self.close()
+            return
+        self.pending = self.pending[sent:]
+        if len(self.pending) == 0:
+            self.pending = None
+            if not self.keep_alive:
+                self.close()
+                return
+            self.reactor.modify(self.fd, ProcessStream.POLL_IN)
+            self._start_timeout()
+            self._process_data()
+
+
 class StreamRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = PROTOCOL_VERSION_V11
+    # Idle persistent connections are closed after that many seconds.
+    timeout = 15
+
     def __init__(self, *args):
+        self.transfer_mode = TRANSFER_MODE_CLOSE
+        self.stream_offset = None
         try:
             BaseHTTPServer.BaseHTTPRequestHandler.__init__(self, *args)
         except IOError:
@@ -289,46 +1952,209 @@ class StreamRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         logger.debug('Got the following GET request:\n{header}'.format(
             header=json.dumps(self.headers.items(), indent=2)))
         item = self.get_requested_item()
-        self.handle_headers(item)
-        if isinstance(item, pulseaudio_dlna.images.BaseImage):
+        if not self.handle_headers(item):
+            return
+        if isinstance(item, (pulseaudio_dlna.images.BaseImage,
+                             pulseaudio_dlna.metrics.BaseReport)):
             self.wfile.write(item.data)
         elif isinstance(item, pulseaudio_dlna.pulseaudio.PulseBridge):
+            # Streams never end on their own, so the connection cannot be
+            # used for another request afterwards.
+            self.close_connection = 1
+            self.tune_socket(item)
             self.server.stream_manager.create_stream(
-                self.path, self.request, item)
+                self.path, self.request, item,
+                chunked=self.transfer_mode == TRANSFER_MODE_CHUNKED,
+                client_host=self.client_address[0],
+                offset=self.stream_offset)
+
+    def do_POST(self):
+        logger.debug('Got the following POST request:\n{header}'.format(
+            header=json.dumps(self.headers.items(), indent=2)))
+        if self.path.split('?', 1)[0] != pulseaudio_dlna.handoff.API_PATH:
+            self.send_error(404, 'File not found: %s' % self.path)
+            return
+        # Only the machine the server runs on may move streams around.
+        client_host = self.client_address[0]
+        if not client_host.startswith('127.') and \
+           client_host != self.request.getsockname()[0]:
+            logger.warning(
+                'Refused a handoff request from {}.'.format(client_host))
+            self.send_text(403, 'Handoff requests are only accepted from '
+                                'the local machine!')
+            return
+        try:
+            length = int(self.headers.get('content-length', 0))
+        except ValueError:
+            length = 0
+        form = urlparse.parse_qs(self.rfile.read(length))
+        source = form.get('source', [''])[0].decode('utf-8')
+        target = form.get('target', [''])[0].decode('utf-8')
+        try:
+            source_bridge, target_bridge = pulseaudio_dlna.handoff.validate(
+                self.server.bridges, source, target)
+        except pulseaudio_dlna.handoff.HandoffException as e:
+            logger.info('Rejected a handoff request ({}).'.format(e))
+            self.send_text(e.STATUS, unicode(e))
+            return
+        # The pulse watcher knows which devices are playing, it does the
+        # rest.
+        self.server.pulse_queue.put({
+            'type': 'handoff',
+            'source': source_bridge.device.udn,
+            'target': target_bridge.device.udn,
+        })
+        self.send_text(
+            202, 'Handing the stream of "{}" over to "{}" ...'.format(
+                source_bridge.device.label, target_bridge.device.label))
+
+    def send_text(self, response_code, text):
+        data = (text + '\n').encode('utf-8')
+        self.send_response(response_code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', len(data))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def tune_socket(self, bridge):
+        codec = bridge.device.codec
+        profile = codec.get_socket_profile()
+        byte_rate = pulseaudio_dlna.sockets.get_byte_rate(codec)
+        logger.debug('Applying the socket profile {profile} ({rate} bytes/s) '
+                     'to the stream of {device}.'.format(
+                         profile=profile, rate=byte_rate,
+                         device=bridge.device.name))
+        profile.apply(self.request, byte_rate)
+
+    def get_transfer_mode(self, bridge):
+        # Device rules have precedence over the server wide settings.
+        rules = list(bridge.device.rules) + list(bridge.device.codec.rules)
+        if pulseaudio_dlna.rules.FAKE_HTTP_CONTENT_LENGTH in rules:
+            mode = TRANSFER_MODE_FAKE_LENGTH
+        elif pulseaudio_dlna.rules.CHUNKED_TRANSFER_ENCODING in rules:
+            mode = TRANSFER_MODE_CHUNKED
+        elif pulseaudio_dlna.rules.HTTP_CONNECTION_CLOSE in rules:
+            mode = TRANSFER_MODE_CLOSE
+        elif self.server.fake_http_content_length:
+            mode = TRANSFER_MODE_FAKE_LENGTH
+        elif self.server.chunked_transfer_encoding:
+            mode = TRANSFER_MODE_CHUNKED
+        else:
+            mode = TRANSFER_MODE_CLOSE
+        if mode == TRANSFER_MODE_CHUNKED and \
+           self.request_version != PROTOCOL_VERSION_V11:
+            mode = TRANSFER_MODE_CLOSE
+        return mode
+
+    def get_range_start(self):
+        # Only open ranges can be served, streams have no end. A range up to
+        # the faked content length counts as open as well.
+        match = re.search(
+            'bytes=(\d+)-(\d+)?', self.headers.get('range', ''),
+            re.IGNORECASE)
+        if not match:
+            return None
+        start, end = match.group(1), match.group(2)
+        if end is not None and int(end) < FAKE_CONTENT_LENGTH - 1:
+            return None
+        return int(start)
+
+    def is_not_modified(self, image):
+        # If-None-Match has precedence, If-Modified-Since is only looked at
+        # without it.
+        etags = self.headers.get('if-none-match', None)
+        if etags is not None:
+            etags = [etag.strip() for etag in etags.split(',')]
+            return '*' in etags or image.etag in etags or \
+                'W/' + image.etag in etags
+        since = self.headers.get('if-modified-since', None)
+        if since is not None and image.modified is not None:
+            since = email.utils.parsedate_tz(since)
+            if since is not None:
+                return int(image.modified) <= email.utils.mktime_tz(since)
+        return False
 
     def handle_headers(self, item):
+        # Returns False if there is no body to send.
         response_code = 200
         headers = {}
 
         if not item:
             logger.info('Requested file not found "{}"'.format(self.path))
             self.send_error(404, 'File not found: %s' % self.path)
-            return
+            return False
         elif isinstance(item, pulseaudio_dlna.images.BaseImage):
             image = item
+            validators = {'ETag': image.etag}
+            if image.last_modified:
+                validators['Last-Modified'] = image.last_modified
+            if self.is_not_modified(image):
+                self.send_response(304)
+                for name, value in validators.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                return False
+            headers.update(validators)
             headers['Content-Type'] = image.content_type
+            headers['Content-Length'] = len(image.data)
+        elif isinstance(item, pulseaudio_dlna.metrics.BaseReport):
+            report = item
+            headers['Content-Type'] = report.content_type
+            headers['Content-Length'] = len(report.data)
+            headers['Cache-Control'] = 'no-cache'
         elif isinstance(item, pulseaudio_dlna.pulseaudio.PulseBridge):
             bridge = item
+            if self.command == 'GET':
+                try:
+                    self.server.stream_manager.admit(self.path, bridge)
+                except pulseaudio_dlna.admission.\
+                        AdmissionRejectedException as e:
+                    logger.warning(e)
+                    self.send_response(503)
+                    self.send_header('Retry-After', e.retry_after)
+                    self.send_header('Content-Length', 0)
+                    self.end_headers()
+                    return False
             headers['Content-Type'] = bridge.device.codec.specific_mime_type
 
-            if self.server.fake_http_content_length or \
-               pulseaudio_dlna.rules.FAKE_HTTP_CONTENT_LENGTH in \
-               bridge.device.codec.rules:
-                gb_in_bytes = pow(1024, 3)
-                headers['Content-Length'] = gb_in_bytes * 100
-            else:
-                if self.request_version == PROTOCOL_VERSION_V10:
-                    pass
-                elif self.request_version == PROTOCOL_VERSION_V11:
-                    headers['Connection'] = 'close'
-
-            if self.headers.get('range'):
-                match = re.search(
-                    'bytes=(\d+)-(\d+)?', self.headers['range'], re.IGNORECASE)
-                if match:
-                    start_range = int(match.group(1))
-                    if start_range != 0:
+            self.transfer_mode = self.get_transfer_mode(bridge)
+            if self.transfer_mode == TRANSFER_MODE_FAKE_LENGTH:
+                headers['Content-Length'] = FAKE_CONTENT_LENGTH
+            elif self.transfer_mode == TRANSFER_MODE_CHUNKED:
+                headers['Transfer-Encoding'] = 'chunked'
+            elif self.command == 'GET':
+                # A HEAD request does not get the endless body, so its
+                # connection can be kept alive.
+                headers['Connection'] = 'close'
+
+            start = self.get_range_start()
+            if start:
+                try:
+                    if self.server.stream_manager.locate(
+                            self.path, self.client_address[0], start):
                         response_code = 206
+                        self.stream_offset = start
+                    else:
+                        logger.info(
+                            'Cannot resume "{path}" at offset {start}, '
+                            'ignoring the range.'.format(
+                                path=self.path, start=start))
+                except RangeNotSatisfiableException as e:
+                    logger.info(e)
+                    self.send_response(416)
+                    if self.transfer_mode == TRANSFER_MODE_FAKE_LENGTH:
+                        self.send_header('Content-Range', 'bytes */{}'.format(
+                            FAKE_CONTENT_LENGTH))
+                    self.send_header('Content-Length', 0)
+                    self.end_headers()
+                    return False
+            if response_code == 206:
+                length = '*'
+                if self.transfer_mode == TRANSFER_MODE_FAKE_LENGTH:
+                    length = FAKE_CONTENT_LENGTH
+                    headers['Content-Length'] = FAKE_CONTENT_LENGTH - start
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                    start, FAKE_CONTENT_LENGTH - 1, length)
 
             if isinstance(
                 bridge.device,
@@ -347,23 +2173,55 @@ class StreamRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         for name, value in headers.items():
             self.send_header(name, value)
         self.end_headers()
+        return True
 
     def get_requested_item(self):
-        settings = self._decode_settings(self.path)
+        report_type = pulseaudio_dlna.metrics.get_report_type(self.path)
+        if report_type:
+            return report_type(self.server.stream_manager.get_metrics())
+        path = self.path.split('?', 1)[0]
+        route = self.server.routes.get(path, None)
+        if route is not None:
+            return self._select_bridge(route)
+        settings = self.server.image_routes.get(path, None)
+        if settings is None:
+            # Paths which are not known yet are still decoded, devices do
+            # not always request the exact url they were given.
+            settings = self._decode_settings(self.path)
         if settings.get('type', None) == 'bridge':
             for bridge in self.server.bridges:
                 if settings.get('udn') == bridge.device.udn:
                     return bridge
-        elif settings.get('type', None) == 'image':
+        elif settings.get('type', None) == 'group':
+            return self._select_bridge([
+                bridge for bridge in self.server.bridges
+                if bridge.group and bridge.get_stream_settings() == settings])
+        elif settings.get('type', None) in ['image', 'sys-icon']:
+            image = self._get_image(settings)
+            if image:
+                self.server.image_routes[path] = settings
+            return image
+        return None
+
+    def _select_bridge(self, bridges):
+        # The members of a group share the stream, but the headers are still
+        # the ones of the device which is connecting.
+        for bridge in bridges:
+            if bridge.device.ip == self.client_address[0]:
+                return bridge
+        if bridges:
+            return bridges[0]
+        return None
+
+    def _get_image(self, settings):
+        if settings.get('type', None) == 'image':
             image_name = settings.get('name', None)
             if image_name:
                 image_path = pkg_resources.resource_filename(
                     'pulseaudio_dlna.streamserver', os.path.join(
                         'images', os.path.basename(image_name)))
                 try:
-                    _type = pulseaudio_dlna.images.get_type_by_filepath(
-                        image_path)
-                    return _type(path=image_path, cached=True)
+                    return pulseaudio_dlna.images.get_cached_image(image_path)
                 except (pulseaudio_dlna.images.UnknownImageExtension,
                         pulseaudio_dlna.images.ImageNotAccessible,
                         pulseaudio_dlna.images.MissingDependencies,
@@ -372,9 +2230,12 @@ class StreamRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         elif settings.get('type', None) == 'sys-icon':
             icon_name = settings.get('name', None)
             if icon_name:
+                icon_name = os.path.basename(icon_name)
                 try:
-                    return pulseaudio_dlna.images.get_icon_by_name(
-                        os.path.basename(icon_name), size=512)
+                    return pulseaudio_dlna.images.cache.get(
+                        ('sys-icon', icon_name, 512),
+                        lambda: pulseaudio_dlna.images.get_icon_by_name(
+                            icon_name, size=512))
                 except (pulseaudio_dlna.images.UnknownImageExtension,
                         pulseaudio_dlna.images.ImageNotAccessible,
                         pulseaudio_dlna.images.MissingDependencies,
@@ -402,6 +2263,17 @@ class StreamRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         pass
 
 
+class ReactorStreamRequestHandler(StreamRequestHandler):
+
+    # Handles exactly one request, the connection is kept alive by the
+    # reactor instead of blocking on the next request.
+    timeout = None
+
+    def handle(self):
+        self.close_connection = 1
+        self.handle_one_request()
+
+
 class StreamServer(SocketServer.TCPServer):
 
     HOST = None
@@ -409,15 +2281,20 @@ class StreamServer(SocketServer.TCPServer):
 
     def __init__(
             self, ip, port, pulse_queue, stream_queue,
-            fake_http_content_length=False, proc_title=None, *args):
+            fake_http_content_length=False, chunked_transfer_encoding=False,
+            proc_title=None, *args):
         self.ip = ip or self.HOST
         self.port = port or self.PORT
         self.pulse_queue = pulse_queue
         self.stream_queue = stream_queue
         self.stream_manager = StreamManager(self)
         self.fake_http_content_length = fake_http_content_length
+        self.chunked_transfer_encoding = chunked_transfer_encoding
         self.proc_title = proc_title
+        self.started = time.time()
         self.bridges = []
+        self.routes = {}
+        self.image_routes = {}
 
     def run(self):
         self.allow_reuse_address = True
@@ -439,6 +2316,22 @@ class StreamServer(SocketServer.TCPServer):
 
     def update_bridges(self, bridges):
         self.bridges = bridges
+        self.routes = self._build_routes(bridges)
+
+    def _build_routes(self, bridges):
+        # Maps the stream path of every bridge to the bridges it serves,
+        # all members of a group share the same path.
+        routes = {}
+        for bridge in bridges:
+            routes.setdefault(bridge.get_stream_path(), []).append(bridge)
+        logger.debug('Updated the stream routes:\n{}'.format(
+            '\n'.join('  {} = {}'.format(
+                path, ', '.join(b.device.name for b in route))
+                for path, route in routes.items())))
+        return routes
+
+    def prespawn(self, path, bridge):
+        self.stream_manager.prespawn(path, bridge)
 
 
 class GobjectMainLoopMixin:
@@ -488,3 +2381,43 @@ class GobjectMainLoopMixin:
 class ThreadedStreamServer(
         GobjectMainLoopMixin, SocketServer.ThreadingMixIn, StreamServer):
     pass
+
+
+class ReactorStreamServer(GobjectMainLoopMixin, StreamServer):
+
+    # Serves all connections and encoder pipes from a single thread.
+
+    request_queue_size = 128
+
+    def __init__(self, *args, **kwargs):
+        StreamServer.__init__(self, *args, **kwargs)
+        self.reactor = Reactor()
+        self.stream_manager = ReactorStreamManager(self, self.reactor)
+
+    def serve_forever(self, poll_interval=0.5):
+        GObject.io_add_watch(
+            self.reactor.fileno(), GObject.IO_IN | GObject.IO_PRI,
+            self.reactor.dispatch)
+        GobjectMainLoopMixin.serve_forever(self, poll_interval)
+
+    def process_request(self, request, client_address):
+        ReactorConnection(
+            self, self.reactor, request, client_address).start()
+
+
+STREAM_SERVERS = {
+    'threaded': ThreadedStreamServer,
+    'epoll': ReactorStreamServer,
+}
+
+
+def validate_eviction_policy(policy):
+    if policy not in EVICTION_POLICIES:
+        raise UnknownEvictionPolicyException(policy)
+
+
+def get_stream_server(name):
+    try:
+        return STREAM_SERVERS[name]
+    except KeyError:
+        raise UnknownStreamServerException(name)
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger('pulseaudio_dlna.utils.libpulse')
+
+PA_STREAM_RECORD = 2
+PA_SAMPLE_S16LE = 3
+PA_INVALID = 0xffffffff
+
+_libpulse_simple = None
+
+
+class LibpulseException(Exception):
+    def __init__(self, message):
+        Exception.__init__(
+            self,
+            'libpulse failed with "{}"!'.format(message)
+        )
+
+
+class pa_sample_spec(ctypes.Structure):
+    _fields_ = [
+        ('format', ctypes.c_int),
+        ('rate', ctypes.c_uint32),
+        ('channels', ctypes.c_uint8),
+    ]
+
+
+class pa_buffer_attr(ctypes.Structure):
+    _fields_ = [
+        ('maxlength', ctypes.c_uint32),
+        ('tlength', ctypes.c_uint32),
+        ('prebuf', ctypes.c_uint32),
+        ('minreq', ctypes.c_uint32),
+        ('fragsize', ctypes.c_uint32),
+    ]
+
+
+def _load():
+    global _libpulse_simple
+    if _libpulse_simple is None:
+        _libpulse_simple = False
+        library = ctypes.util.find_library('pulse-simple')
+        if not library:
+            logger.info('libpulse-simple is not available on your system.')
+            return _libpulse_simple
+        try:
+            lib = ctypes.CDLL(library)
+            lib.pa_simple_new.argtypes = [
+                ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int,
+                ctypes.c_char_p, ctypes.c_char_p,
+                ctypes.POINTER(pa_sample_spec), ctypes.c_void_p,
+                ctypes.POINTER(pa_buffer_attr), ctypes.POINTER(ctypes.c_int)]
+            lib.pa_simple_new.restype = ctypes.c_void_p
+            lib.pa_simple_read.argtypes = [
+                ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t,
+                ctypes.POINTER(ctypes.c_int)]
+            lib.pa_simple_read.restype = ctypes.c_int
+            lib.pa_simple_get_latency.argtypes = [
+                ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)]
+            lib.pa_simple_get_latency.restype = ctypes.c_uint64
+            lib.pa_simple_free.argtypes = [ctypes.c_void_p]
+            lib.pa_simple_free.restype = None
+            lib.pa_strerror.argtypes = [ctypes.c_int]
+            lib.pa_strerror.restype = ctypes.c_char_p
+            _libpulse_simple = lib
+        except (OSError, AttributeError):
+            logger.info('libpulse-simple could not be loaded.')
+            _libpulse_simple = False
+    return _libpulse_simple
+
+
+def is_available():
+    return bool(_load())
+
+
+def _encode(value):
+    if value is None:
+        return None
+    return value.encode('utf-8')
+
+
+class SimpleRecordStream(object):
+
+    # Records signed 16 bit little endian PCM from a PulseAudio source via
+    # the blocking simple API. A fragment size of None lets the server
+    # decide, which usually means a latency of about two seconds.
+
+    def __init__(
+            self, device, name, stream_name, rate=44100, channels=2,
+            fragment_size=None):
+        self._lib = _load()
+        if not self._lib:
+            raise LibpulseException('libpulse-simple is not available')
+        self.fragment_size = fragment_size
+
+        sample_spec = pa_sample_spec(PA_SAMPLE_S16LE, rate, channels)
+        buffer_attr = pa_buffer_attr(
+            PA_INVALID, PA_INVALID, PA_INVALID, PA_INVALID,
+            fragment_size or PA_INVALID)
+        error = ctypes.c_int(0)
+        self._stream = self._lib.pa_simple_new(
+            None, _encode(name), PA_STREAM_RECORD, _encode(device),
+            _encode(stream_name), ctypes.byref(sample_spec), None,
+            ctypes.byref(buffer_attr), ctypes.byref(error))
+        if not self._stream:
+            raise LibpulseException(self._strerror(error))
+        self._buffer = ctypes.create_string_buffer(fragment_size or 4096)
+
+    def _strerror(self, error):
+        return self._lib.pa_strerror(error.value)
+
+    def read(self, size):
+        if self._stream is None:
+            raise LibpulseException('The stream was already freed')
+        if len(self._buffer) < size:
+            self._buffer = ctypes.create_string_buffer(size)
+        error = ctypes.c_int(0)
+        if self._lib.pa_simple_read(
+                self._stream, self._buffer, size, ctypes.byref(error)) < 0:
+            raise LibpulseException(self._strerror(error))
+        return self._buffer.raw[:size]
+
+    @property
+    def latency(self):
+        # The latency of the recorded data in microseconds.
+        error = ctypes.c_int(0)
+        return self._lib.pa_simple_get_latency(
+            self._stream, ctypes.byref(error))
+
+    def free(self):
+        if self._stream is not None:
+            self._lib.pa_simple_free(self._stream)
+            self._stream = None
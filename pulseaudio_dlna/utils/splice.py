@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import sys
+
+logger = logging.getLogger('pulseaudio_dlna.utils.splice')
+
+SPLICE_F_MOVE = 0x01
+SPLICE_F_NONBLOCK = 0x02
+SPLICE_F_MORE = 0x04
+
+_splice = None
+
+
+def _load():
+    global _splice
+    if _splice is None:
+        _splice = False
+        if not sys.platform.startswith('linux'):
+            return _splice
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _splice = libc.splice
+            _splice.argtypes = [
+                ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                ctypes.c_size_t, ctypes.c_uint]
+            _splice.restype = ctypes.c_ssize_t
+        except (OSError, AttributeError):
+            logger.info('splice() is not available on your system.')
+            _splice = False
+    return _splice
+
+
+def is_available():
+    return bool(_load())
+
+
+def splice(fd_in, fd_out, length, flags=SPLICE_F_MOVE | SPLICE_F_MORE):
+    # Moves up to length bytes from fd_in to fd_out without copying them to
+    # userspace. One of both descriptors has to be a pipe.
+    result = _load()(fd_in, None, fd_out, None, length, flags)
+    if result < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return result
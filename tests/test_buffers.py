@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import select
+import threading
+import unittest
+
+import pulseaudio_dlna.buffers
+
+
+class RingBufferTest(unittest.TestCase):
+
+    TIMEOUT = 5
+
+    def create(self, size=8, policy=pulseaudio_dlna.buffers.POLICY_DROP_OLDEST,
+               alignment=1):
+        buffer = pulseaudio_dlna.buffers.RingBuffer(size, policy, alignment)
+        self.addCleanup(buffer.release)
+        return buffer
+
+    def is_readable(self, buffer):
+        readable, _, _ = select.select([buffer], [], [], 0)
+        return len(readable) > 0
+
+    def test_unknown_policy(self):
+        self.assertRaises(
+            pulseaudio_dlna.buffers.UnknownBufferPolicyException,
+            pulseaudio_dlna.buffers.RingBuffer, 8, 'unknown')
+
+    def test_wrap_around(self):
+        buffer = self.create()
+        buffer.write(b'abcdef')
+        self.assertEqual(buffer.read(4), b'abcd')
+        buffer.write(b'ghijkl')
+        self.assertEqual(len(buffer), 8)
+        self.assertEqual(buffer.read(), b'efghijkl')
+        self.assertEqual(buffer.dropped_bytes, 0)
+        self.assertEqual(buffer.written_bytes, 12)
+
+    def test_drop_oldest(self):
+        buffer = self.create()
+        buffer.write(b'abcdef')
+        buffer.write(b'ghij')
+        self.assertEqual(buffer.read(), b'cdefghij')
+        self.assertEqual(buffer.dropped_bytes, 2)
+        self.assertEqual(buffer.overflow_count, 1)
+        self.assertFalse(buffer.is_closed)
+
+    def test_drop_oldest_aligned(self):
+        # Whole frames are dropped, so the reader stays frame aligned.
+        buffer = self.create(alignment=4)
+        buffer.write(b'abcdef')
+        buffer.write(b'ghi')
+        self.assertEqual(buffer.dropped_bytes, 4)
+        self.assertEqual(buffer.read(), b'efghi')
+
+    def test_drop_oldest_larger_than_buffer(self):
+        buffer = self.create()
+        buffer.write(b'ab')
+        buffer.write(b'0123456789')
+        self.assertEqual(buffer.read(), b'23456789')
+        self.assertEqual(buffer.dropped_bytes, 4)
+        self.assertEqual(buffer.overflow_count, 1)
+
+    def test_drop_oldest_larger_than_buffer_aligned(self):
+        buffer = self.create(alignment=4)
+        buffer.write(b'0123456789')
+        self.assertEqual(buffer.read(), b'456789')
+        self.assertEqual(buffer.dropped_bytes, 4)
+
+    def test_block(self):
+        buffer = self.create(policy=pulseaudio_dlna.buffers.POLICY_BLOCK)
+        writer = threading.Thread(target=buffer.write, args=(b'0123456789', ))
+        writer.daemon = True
+        writer.start()
+        writer.join(0.1)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(buffer.read(4), b'0123')
+        writer.join(self.TIMEOUT)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(buffer.read(), b'456789')
+        self.assertEqual(buffer.dropped_bytes, 0)
+        self.assertEqual(buffer.overflow_count, 0)
+
+    def test_block_close(self):
+        buffer = self.create(policy=pulseaudio_dlna.buffers.POLICY_BLOCK)
+        writer = threading.Thread(target=buffer.write, args=(b'0123456789', ))
+        writer.daemon = True
+        writer.start()
+        writer.join(0.1)
+        self.assertTrue(writer.is_alive())
+        buffer.close()
+        writer.join(self.TIMEOUT)
+        self.assertFalse(writer.is_alive())
+
+    def test_disconnect(self):
+        buffer = self.create(policy=pulseaudio_dlna.buffers.POLICY_DISCONNECT)
+        buffer.write(b'abcdef')
+        buffer.write(b'ghij')
+        self.assertTrue(buffer.overflowed)
+        self.assertTrue(buffer.is_closed)
+        self.assertEqual(buffer.dropped_bytes, 4)
+        self.assertEqual(buffer.overflow_count, 1)
+        self.assertTrue(self.is_readable(buffer))
+        # Nothing is read anymore, the stream would continue with a gap.
+        self.assertEqual(buffer.read(), b'')
+        buffer.write(b'kl')
+        self.assertEqual(buffer.written_bytes, 10)
+
+    def test_disconnect_fits(self):
+        buffer = self.create(policy=pulseaudio_dlna.buffers.POLICY_DISCONNECT)
+        buffer.write(b'abcdefgh')
+        self.assertFalse(buffer.overflowed)
+        self.assertEqual(buffer.read(), b'abcdefgh')
+
+    def test_readiness(self):
+        buffer = self.create()
+        self.assertFalse(self.is_readable(buffer))
+        self.assertIsNone(buffer.read_nowait())
+        buffer.write(b'abc')
+        self.assertTrue(self.is_readable(buffer))
+        self.assertEqual(buffer.read_nowait(2), b'ab')
+        self.assertTrue(self.is_readable(buffer))
+        self.assertEqual(buffer.read_nowait(), b'c')
+        self.assertFalse(self.is_readable(buffer))
+
+    def test_close(self):
+        buffer = self.create()
+        buffer.write(b'abc')
+        buffer.close()
+        self.assertTrue(self.is_readable(buffer))
+        self.assertEqual(buffer.read(), b'abc')
+        self.assertEqual(buffer.read(), b'')
+        buffer.write(b'def')
+        self.assertEqual(len(buffer), 0)
+
+    def test_skip(self):
+        buffer = self.create()
+        buffer.write(b'abcdef')
+        self.assertEqual(buffer.skip(), 6)
+        self.assertEqual(buffer.dropped_bytes, 6)
+        self.assertFalse(self.is_readable(buffer))
+        buffer.write(b'gh')
+        self.assertEqual(buffer.read(), b'gh')
+
+
+class HistoryBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = pulseaudio_dlna.buffers.HistoryBuffer(8)
+
+    def test_read(self):
+        self.buffer.write(b'abcdef')
+        self.assertEqual(self.buffer.start, 0)
+        self.assertEqual(self.buffer.end, 6)
+        self.assertEqual(self.buffer.read(0), b'abcdef')
+        self.assertEqual(self.buffer.read(4), b'ef')
+        self.assertEqual(self.buffer.read(6), b'')
+        self.assertIsNone(self.buffer.read(7))
+
+    def test_wrap_around(self):
+        self.buffer.write(b'abcdef')
+        self.buffer.write(b'ghijkl')
+        self.assertEqual(self.buffer.start, 4)
+        self.assertEqual(self.buffer.end, 12)
+        self.assertEqual(self.buffer.read(4), b'efghijkl')
+        self.assertEqual(self.buffer.read(10), b'kl')
+        self.assertIsNone(self.buffer.read(3))
+
+    def test_write_larger_than_buffer(self):
+        self.buffer.write(b'ab')
+        self.buffer.write(b'0123456789')
+        self.assertEqual(self.buffer.start, 4)
+        self.assertEqual(self.buffer.end, 12)
+        self.assertEqual(self.buffer.read(4), b'23456789')
+
+    def test_clear(self):
+        self.buffer.write(b'abcdef')
+        self.buffer.clear()
+        self.assertEqual(self.buffer.end, 0)
+        self.assertEqual(self.buffer.read(0), b'')
+        self.assertIsNone(self.buffer.read(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import struct
+import unittest
+
+import pulseaudio_dlna.framing
+
+
+def wav_header(data_size=0):
+    fmt = struct.pack(b'<HHIIHH', 1, 2, 44100, 44100 * 4, 4, 16)
+    return (b'RIFF' + struct.pack(b'<I', 36 + data_size) + b'WAVE' +
+            b'fmt ' + struct.pack(b'<I', len(fmt)) + fmt +
+            b'data' + struct.pack(b'<I', data_size))
+
+
+def ogg_page(payload, granule_position=0, version=b'\x00'):
+    return (b'OggS' + version + b'\x00' +
+            struct.pack(b'<qIII', granule_position, 1, 0, 0) +
+            struct.pack(b'<B', 1) + struct.pack(b'<B', len(payload)) +
+            payload)
+
+
+def flac_block(length, is_last=False):
+    block_header = (0x80000000 if is_last else 0) | length
+    return struct.pack(b'>I', block_header) + b'\x00' * length
+
+
+# 16 bit stereo at 44.1 kHz with a block size of 4096 samples.
+FLAC_FRAME_HEADER = b'\xff\xf8\xc9\x18'
+
+# MPEG 1 Layer III, 128 kbit/s, 44.1 kHz, without CRC.
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x00'
+MP3_FRAME_LENGTH = 417
+
+
+def mp3_frame(padding=False):
+    header = bytearray(MP3_FRAME_HEADER)
+    if padding:
+        header[2] |= 0x02
+    return bytes(header) + b'\x01' * (
+        MP3_FRAME_LENGTH + (1 if padding else 0) - 4)
+
+
+def adts_frame(length=64):
+    # AAC LC, 44.1 kHz, stereo, without CRC.
+    header = bytearray(b'\xff\xf1\x50\x80\x00\x1f\xfc')
+    header[3] |= (length >> 11) & 0x03
+    header[4] = (length >> 3) & 0xff
+    header[5] |= (length & 0x07) << 5
+    return bytes(header) + b'\x01' * (length - 7)
+
+
+class GetFramingTest(unittest.TestCase):
+
+    def test_known_codec(self):
+        codec = type(str('Codec'), (object, ), {'IDENTIFIER': 'mp3'})()
+        self.assertIsInstance(
+            pulseaudio_dlna.framing.get_framing(codec),
+            pulseaudio_dlna.framing.Mp3Framing)
+
+    def test_unknown_codec(self):
+        codec = type(str('Codec'), (object, ), {'IDENTIFIER': 'unknown'})()
+        framing = pulseaudio_dlna.framing.get_framing(codec)
+        self.assertIs(type(framing), pulseaudio_dlna.framing.BaseFraming)
+        self.assertEqual(framing.header_length(b'data'), 0)
+        self.assertIsNone(framing.frame_offset(b'data'))
+
+
+class WavFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framing = pulseaudio_dlna.framing.WavFraming()
+
+    def test_header_length(self):
+        header = wav_header()
+        self.assertEqual(self.framing.header_length(header + b'\x00' * 8),
+                         len(header))
+
+    def test_header_with_padded_chunk(self):
+        header = wav_header()
+        # Chunks of odd length are followed by a pad byte.
+        header = header[:36] + b'LIST' + struct.pack(b'<I', 3) + \
+            b'abc\x00' + header[36:]
+        self.assertEqual(self.framing.header_length(header), len(header))
+
+    def test_partial_header(self):
+        header = wav_header()
+        self.assertIsNone(self.framing.header_length(header[:8]))
+        self.assertIsNone(self.framing.header_length(header[:-1]))
+
+    def test_no_header(self):
+        self.assertEqual(self.framing.header_length(b'\x00' * 16), 0)
+
+    def test_frame_offset(self):
+        self.assertEqual(self.framing.frame_offset(b'\x00' * 8, 0), 0)
+        self.assertEqual(self.framing.frame_offset(b'\x00' * 8, 5), 3)
+        self.assertEqual(self.framing.frame_offset(b'\x00' * 8, 8), 0)
+        self.assertIsNone(self.framing.frame_offset(b'\x00' * 2, 1))
+
+
+class OggFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framing = pulseaudio_dlna.framing.OggFraming()
+
+    def test_header_length(self):
+        header = ogg_page(b'identification') + ogg_page(b'comment')
+        data = header + ogg_page(b'audio', granule_position=960)
+        self.assertEqual(self.framing.header_length(data), len(header))
+
+    def test_partial_header(self):
+        header = ogg_page(b'identification') + ogg_page(b'comment')
+        self.assertIsNone(self.framing.header_length(header))
+        self.assertIsNone(self.framing.header_length(header[:-3]))
+        self.assertIsNone(self.framing.header_length(b'Og'))
+
+    def test_no_header(self):
+        self.assertEqual(self.framing.header_length(b'\x00' * 32), 0)
+
+    def test_frame_offset(self):
+        page = ogg_page(b'audio', granule_position=960)
+        self.assertEqual(self.framing.frame_offset(b'xyz' + page), 3)
+
+    def test_frame_offset_skips_false_capture_pattern(self):
+        page = ogg_page(b'audio', granule_position=960)
+        data = b'OggS\x01' + page
+        self.assertEqual(self.framing.frame_offset(data), 5)
+
+    def test_no_frame(self):
+        self.assertIsNone(self.framing.frame_offset(b'\x00' * 32))
+
+
+class FlacFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framing = pulseaudio_dlna.framing.FlacFraming()
+
+    def test_header_length(self):
+        header = b'fLaC' + flac_block(34) + flac_block(8, is_last=True)
+        self.assertEqual(
+            self.framing.header_length(header + FLAC_FRAME_HEADER),
+            len(header))
+
+    def test_partial_header(self):
+        header = b'fLaC' + flac_block(34) + flac_block(8, is_last=True)
+        self.assertIsNone(self.framing.header_length(b'fL'))
+        self.assertIsNone(self.framing.header_length(header[:-1]))
+        self.assertIsNone(self.framing.header_length(b'fLaC' + flac_block(34)))
+
+    def test_no_header(self):
+        self.assertEqual(self.framing.header_length(b'\x00' * 8), 0)
+
+    def test_frame_offset(self):
+        data = b'\x00\xff\x00' + FLAC_FRAME_HEADER
+        self.assertEqual(self.framing.frame_offset(data), 3)
+
+    def test_invalid_frame_header(self):
+        # Sample rate 0x0f is invalid.
+        self.assertIsNone(self.framing.frame_offset(b'\xff\xf8\xcf\x18'))
+        self.assertIsNone(self.framing.frame_offset(FLAC_FRAME_HEADER[:3]))
+
+
+class Mp3FramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framing = pulseaudio_dlna.framing.Mp3Framing()
+
+    def test_header_length(self):
+        # The tag size is stored as a syncsafe integer.
+        header = b'ID3\x03\x00\x00\x00\x00\x01\x01' + b'\x00' * 129
+        self.assertEqual(
+            self.framing.header_length(header + MP3_FRAME_HEADER),
+            len(header))
+
+    def test_partial_header(self):
+        header = b'ID3\x03\x00\x00\x00\x00\x01\x01' + b'\x00' * 129
+        self.assertIsNone(self.framing.header_length(header[:5]))
+        self.assertIsNone(self.framing.header_length(header[:-1]))
+
+    def test_no_header(self):
+        self.assertEqual(self.framing.header_length(mp3_frame()), 0)
+
+    def test_frame_length(self):
+        self.assertEqual(
+            self.framing._frame_length(mp3_frame(), 0), MP3_FRAME_LENGTH)
+        self.assertEqual(
+            self.framing._frame_length(mp3_frame(padding=True), 0),
+            MP3_FRAME_LENGTH + 1)
+        # Free format bit rate and reserved sample rate.
+        self.assertIsNone(self.framing._frame_length(b'\xff\xfb\x00\x00', 0))
+        self.assertIsNone(self.framing._frame_length(b'\xff\xfb\x9c\x00', 0))
+
+    def test_frame_offset(self):
+        data = b'\x00\xff\xfb' + mp3_frame() + mp3_frame()
+        self.assertEqual(self.framing.frame_offset(data), 3)
+
+    def test_frame_offset_at_end_of_data(self):
+        # The next frame header cannot be checked, the frame is trusted.
+        self.assertEqual(self.framing.frame_offset(b'\x00' + mp3_frame()), 1)
+
+    def test_frame_offset_needs_following_frame(self):
+        data = MP3_FRAME_HEADER + b'\x00' * 500 + mp3_frame()
+        self.assertEqual(
+            self.framing.frame_offset(data), 500 + len(MP3_FRAME_HEADER))
+
+    def test_silent_frame(self):
+        frame, duration = self.framing.silent_frame(
+            b'\x00' + mp3_frame(padding=True) + mp3_frame())
+        self.assertEqual(len(frame), MP3_FRAME_LENGTH)
+        self.assertEqual(frame[:4], MP3_FRAME_HEADER)
+        self.assertEqual(frame[4:], b'\x00' * (MP3_FRAME_LENGTH - 4))
+        self.assertAlmostEqual(duration, 1152 / 44100.0)
+
+    def test_no_silent_frame(self):
+        self.assertIsNone(self.framing.silent_frame(b'\x00' * 16))
+
+
+class AacFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framing = pulseaudio_dlna.framing.AacFraming()
+
+    def test_no_header(self):
+        self.assertEqual(self.framing.header_length(adts_frame()), 0)
+
+    def test_frame_length(self):
+        self.assertEqual(self.framing._frame_length(adts_frame(64), 0), 64)
+        self.assertEqual(
+            self.framing._frame_length(adts_frame(3000), 0), 3000)
+        self.assertIsNone(self.framing._frame_length(adts_frame()[:6], 0))
+
+    def test_frame_offset(self):
+        data = b'\x00\xff\xf1' + adts_frame() + adts_frame()
+        self.assertEqual(self.framing.frame_offset(data), 3)
+
+    def test_frame_offset_needs_following_frame(self):
+        data = adts_frame(32)[:7] + b'\x00' * 40 + adts_frame()
+        self.assertEqual(self.framing.frame_offset(data), 47)
+
+    def test_invalid_sample_rate(self):
+        header = bytearray(adts_frame())
+        header[2] |= 0x0f << 2
+        self.assertIsNone(self.framing.frame_offset(bytes(header)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pulseaudio_dlna.images
+
+
+class CachedImageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cover.png')
+        pulseaudio_dlna.images.cache.clear()
+
+    def tearDown(self):
+        pulseaudio_dlna.images.cache.clear()
+        shutil.rmtree(self.directory)
+
+    def write(self, data, modified):
+        with open(self.path, 'wb') as h:
+            h.write(data)
+        os.utime(self.path, (modified, modified))
+
+    def test_unchanged_image_is_cached(self):
+        self.write(b'first', 1000)
+        image = pulseaudio_dlna.images.get_cached_image(self.path)
+        self.assertIs(
+            pulseaudio_dlna.images.get_cached_image(self.path), image)
+
+    def test_rewritten_image_is_read_again(self):
+        self.write(b'first', 1000)
+        old = pulseaudio_dlna.images.get_cached_image(self.path)
+        self.write(b'second', 2000)
+        new = pulseaudio_dlna.images.get_cached_image(self.path)
+        self.assertEqual(new.data, b'second')
+        self.assertNotEqual(new.etag, old.etag)
+        self.assertEqual(new.modified, 2000)
+
+    def test_missing_image(self):
+        self.assertRaises(
+            pulseaudio_dlna.images.ImageNotAccessible,
+            pulseaudio_dlna.images.get_cached_image, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
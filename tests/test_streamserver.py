@@ -0,0 +1,357 @@
+#!/usr/bin/python
+
+# This file is part of pulseaudio-dlna.
+
+# pulseaudio-dlna is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# pulseaudio-dlna is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with pulseaudio-dlna.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import unicode_literals
+
+import collections
+import os
+import Queue
+import socket
+import threading
+import time
+import unittest
+
+import pulseaudio_dlna.buffers
+import pulseaudio_dlna.handoff
+import pulseaudio_dlna.streamserver
+import pulseaudio_dlna.utils.splice
+
+
+class FakeCodec(object):
+    IDENTIFIER = 'fake'
+    CPU_COST = 0
+
+
+class FakeProcessRunner(object):
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class BlockingBroadcaster(pulseaudio_dlna.streamserver.ProcessBroadcaster):
+
+    BUFFER_SIZE = 16
+    BUFFER_POLICY = pulseaudio_dlna.buffers.POLICY_BLOCK
+    TIMESHIFT_SIZE = 0
+
+    def _create_process_runner(self):
+        return FakeProcessRunner()
+
+
+FakeStream = collections.namedtuple(
+    'FakeStream', ['id', 'offset', 'snapshot', 'client_host'])
+FakeDevice = collections.namedtuple(
+    'FakeDevice', ['codec', 'udn', 'name', 'label'])
+FakeBridge = collections.namedtuple('FakeBridge', ['device', 'group'])
+FakeServer = collections.namedtuple(
+    'FakeServer', ['bridges', 'pulse_queue', 'started'])
+
+
+def create_bridge(name, codec):
+    return FakeBridge(
+        FakeDevice(codec, 'uuid:' + name, name, name.title()), None)
+
+
+class ProcessBroadcasterTest(unittest.TestCase):
+
+    TIMEOUT = 5
+
+    def setUp(self):
+        bridge = create_bridge('fake', FakeCodec())
+        self.broadcaster = BlockingBroadcaster('/fake', None, None, bridge)
+        self.broadcaster.header = b''
+
+    def test_unsubscribe_with_full_buffer(self):
+        stream = FakeStream(1, None, None, None)
+        buffer = self.broadcaster.subscribe(stream)
+        writer = threading.Thread(
+            target=self.broadcaster.put, args=(b'x' * 64, ))
+        writer.daemon = True
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(len(buffer), BlockingBroadcaster.BUFFER_SIZE)
+
+        leaver = threading.Thread(
+            target=self.broadcaster.unsubscribe, args=(stream, ))
+        leaver.daemon = True
+        leaver.start()
+        leaver.join(self.TIMEOUT)
+        self.assertFalse(leaver.is_alive())
+        writer.join(self.TIMEOUT)
+        self.assertFalse(writer.is_alive())
+        self.assertTrue(self.broadcaster.is_empty)
+
+
+class TimeshiftBroadcaster(pulseaudio_dlna.streamserver.ProcessBroadcaster):
+
+    TIMESHIFT_SIZE = 8
+
+    def _create_process_runner(self):
+        return FakeProcessRunner()
+
+
+class TimeshiftTest(unittest.TestCase):
+
+    # The client got the header followed by the stream from position 0 on,
+    # the time-shift buffer still holds positions 2 to 10.
+    HEADER = b'HEAD'
+    DATA = b'0123456789'
+
+    def setUp(self):
+        bridge = create_bridge('fake', FakeCodec())
+        self.broadcaster = TimeshiftBroadcaster('/fake', None, None, bridge)
+        self.broadcaster.header = self.HEADER
+        self.live_stream = FakeStream(1, None, None, 'client')
+        self.broadcaster.subscribe(self.live_stream)
+        self.broadcaster.put(self.DATA)
+
+    def tearDown(self):
+        for stream_id in list(self.broadcaster.streams):
+            self.broadcaster.unsubscribe(self.broadcaster.streams[stream_id])
+
+    def locate(self, offset, client_host='client'):
+        return self.broadcaster._locate(client_host, offset)
+
+    def test_unknown_client(self):
+        self.assertIsNone(self.locate(6, 'other'))
+        self.assertFalse(self.broadcaster.locate('other', 6))
+
+    def test_locate(self):
+        self.assertEqual(self.locate(6), (b'', 2))
+        self.assertEqual(self.locate(9), (b'', 5))
+        self.assertTrue(self.broadcaster.locate('client', 6))
+
+    def test_locate_end(self):
+        # Resuming right where the stream is now is still possible.
+        offset = len(self.HEADER) + len(self.DATA)
+        self.assertEqual(self.locate(offset), (b'', 10))
+
+    def test_locate_behind_end(self):
+        offset = len(self.HEADER) + len(self.DATA) + 1
+        self.assertRaises(
+            pulseaudio_dlna.streamserver.RangeNotSatisfiableException,
+            self.locate, offset)
+
+    def test_locate_before_start(self):
+        self.assertRaises(
+            pulseaudio_dlna.streamserver.RangeNotSatisfiableException,
+            self.locate, 5)
+        self.assertRaises(
+            pulseaudio_dlna.streamserver.RangeNotSatisfiableException,
+            self.broadcaster.locate, 'client', 0)
+
+    def test_locate_within_header(self):
+        # Only possible as long as the start of the stream was not dropped.
+        self.broadcaster.timeshift = pulseaudio_dlna.buffers.HistoryBuffer(64)
+        self.broadcaster.timeshift.write(self.DATA)
+        self.assertEqual(self.locate(1), (b'EAD', 0))
+        self.assertEqual(self.locate(4), (b'', 0))
+
+    def test_subscribe_shifted(self):
+        stream = FakeStream(2, 6, None, 'client')
+        buffer = self.broadcaster.subscribe(stream)
+        self.assertEqual(buffer.read(), b'23456789')
+        self.broadcaster.put(b'ab')
+        self.assertEqual(buffer.read(), b'ab')
+
+    def test_subscribe_shifted_unavailable(self):
+        stream = FakeStream(2, 5, None, 'client')
+        buffer = self.broadcaster.subscribe(stream)
+        self.assertTrue(buffer.is_closed)
+        self.assertEqual(buffer.read(), b'')
+
+    def test_reset_header(self):
+        self.broadcaster.reset_header()
+        self.assertIsNone(self.locate(6))
+
+
+class SpliceStream(object):
+
+    def __init__(self, sock):
+        self.id = 2
+        self.offset = None
+        self.snapshot = None
+        self.client_host = None
+        self.sock = sock
+        self.bytes_spliced = 0
+        self.bytes_sent = 0
+        self.is_splice_broken = False
+
+    def acquire_socket(self):
+        return True
+
+    def release_socket(self):
+        pass
+
+
+@unittest.skipUnless(
+    pulseaudio_dlna.utils.splice.is_available(), 'splice() is not available')
+class SpliceTest(unittest.TestCase):
+
+    def setUp(self):
+        bridge = create_bridge('fake', FakeCodec())
+        self.broadcaster = BlockingBroadcaster('/fake', None, None, bridge)
+        self.broadcaster.header = b''
+        self.client, sock = socket.socketpair()
+        self.broadcaster.subscribe(SpliceStream(sock))
+        self.reader, self.writer = os.pipe()
+
+    def tearDown(self):
+        os.close(self.reader)
+        if self.writer is not None:
+            os.close(self.writer)
+        self.client.close()
+
+    def test_splice(self):
+        os.write(self.writer, b'data')
+        self.assertTrue(self.broadcaster.splice(self.reader, 1024))
+        self.assertEqual(self.client.recv(1024), b'data')
+        self.assertEqual(self.broadcaster.encoded_bytes, 4)
+
+    def test_splice_end_of_file(self):
+        os.close(self.writer)
+        self.writer = None
+        self.assertFalse(self.broadcaster.splice(self.reader, 1024))
+
+
+class MetricsStream(object):
+
+    def __init__(self, broadcaster, bridge):
+        self.id = 3
+        self.path = broadcaster.path
+        self.offset = None
+        self.snapshot = None
+        self.client_host = None
+        self.bridge = bridge
+        self.broadcaster = broadcaster
+        self.buffer = broadcaster.subscribe(self)
+        self.bytes_sent = 0
+        self.stall_count = 0
+        self.is_evicted = False
+
+    def get_metrics(self):
+        return {'bytes_sent': self.bytes_sent, 'stalls': self.stall_count}
+
+
+class StreamManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = pulseaudio_dlna.streamserver.StreamManager(
+            FakeServer([], Queue.Queue(), time.time()))
+        self.manager.LINGER_SECONDS = 0
+        bridge = create_bridge('fake', FakeCodec())
+        broadcaster = BlockingBroadcaster('/fake', None, None, bridge)
+        self.stream = MetricsStream(broadcaster, bridge)
+        self.manager.broadcasters[broadcaster.path] = broadcaster
+        self.manager.streams[broadcaster.path] = {
+            self.stream.id: self.stream}
+
+    def get_process_metrics(self):
+        metrics = self.manager.get_metrics()['process']
+        return metrics['bytes_encoded'], metrics['bytes_sent'], \
+            metrics['stalls']
+
+    def test_totals_outlast_streams(self):
+        self.stream.broadcaster.encoded_bytes = 300
+        self.stream.bytes_sent = 200
+        self.stream.stall_count = 1
+        self.assertEqual(self.get_process_metrics(), (300, 200, 1))
+        self.manager.unregister(self.stream)
+        self.assertFalse(self.manager.broadcasters)
+        self.assertEqual(self.get_process_metrics(), (300, 200, 1))
+
+
+class ReactorConnectionTest(unittest.TestCase):
+
+    TIMEOUT = 5
+
+    def setUp(self):
+        codec = FakeCodec()
+        self.server = FakeServer(
+            [create_bridge('kitchen', codec), create_bridge('office', codec)],
+            Queue.Queue(), time.time())
+        self.reactor = pulseaudio_dlna.streamserver.Reactor()
+        self.client, sock = socket.socketpair()
+        self.connection = pulseaudio_dlna.streamserver.ReactorConnection(
+            self.server, self.reactor, sock, ('127.0.0.1', 50000))
+        self.connection.start()
+
+    def tearDown(self):
+        self.connection.close()
+        self.client.close()
+
+    def send(self, data):
+        self.client.sendall(data)
+        self.reactor.dispatch()
+
+    def receive(self):
+        self.client.settimeout(0)
+        response = b''
+        deadline = time.time() + self.TIMEOUT
+        while time.time() < deadline:
+            self.reactor.dispatch()
+            try:
+                data = self.client.recv(4096)
+            except socket.error:
+                time.sleep(0.01)
+                continue
+            if len(data) == 0:
+                break
+            response += data
+        return response
+
+    def post(self, body, length=None):
+        if length is None:
+            length = len(body)
+        return ('POST {path} HTTP/1.0\r\n'
+                'Content-Type: application/x-www-form-urlencoded\r\n'
+                'Content-Length: {length}\r\n\r\n').format(
+            path=pulseaudio_dlna.handoff.API_PATH,
+            length=length).encode('ascii') + body
+
+    def test_handoff_with_delayed_body(self):
+        request = self.post(b'source=kitchen&target=office')
+        self.send(request[:-10])
+        self.assertTrue(self.server.pulse_queue.empty())
+        self.send(request[-10:])
+        response = self.receive()
+        self.assertTrue(response.startswith(b'HTTP/1.1 202'), response)
+        self.assertEqual(self.server.pulse_queue.get_nowait(), {
+            'type': 'handoff',
+            'source': 'uuid:kitchen',
+            'target': 'uuid:office',
+        })
+
+    def test_reject_large_body(self):
+        self.send(self.post(
+            b'', pulseaudio_dlna.streamserver.ReactorConnection.MAX_BODY_SIZE
+            + 1))
+        self.assertTrue(self.receive().startswith(b'HTTP/1.1 413'))
+        self.assertTrue(self.server.pulse_queue.empty())
+
+    def test_reject_malformed_length(self):
+        self.send(self.post(b'', 'many'))
+        self.assertTrue(self.receive().startswith(b'HTTP/1.1 400'))
+        self.assertTrue(self.server.pulse_queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()